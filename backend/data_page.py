@@ -1,24 +1,28 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as ple
-import plotly.figure_factory as ff
 
-from data_prep.data_prep import open_file, drop_data, replace, fillna_, price, name_sep
+from backend.dataset import cleaned_data, dataset_aggregates
+from data_prep.aggregates import counts_series, describe_frame
 
+DATASET = 'cars_2023-12-19'
 
-def data_part():
-    data = open_file('cars_2023-12-19')
 
-    data = drop_data(data)
-    data = replace(data)
-    data = fillna_(data)
-    data = price(data)
-    data = name_sep(data)
+def histogram_chart(ple, histogram: dict, label: str):
+    """A bar chart of pre-binned counts drawn like a histogram: one bar per bin, as wide as the bin."""
+    edges = histogram['edges']
+    centers = [(a + b) / 2 for a, b in zip(edges, edges[1:])]
+    fig = ple.bar(x=centers, y=histogram['counts'], labels={'x': label, 'y': 'count'})
+    fig.update_traces(width=[b - a for a, b in zip(edges, edges[1:])])
+    return fig.update_layout(bargap=0)
+
+
+def data_part():
+    stats = dataset_aggregates(DATASET)
 
     st.markdown("""### Общая информация о датасете""")
 
     if st.toggle('Показать статистические данные датасета'):
-        st.dataframe(data.describe())
+        st.dataframe(describe_frame(stats))
 
     st.markdown("""
     Всего было проанализированно 1974 объявления, размещенных на сайте на момент 19 декабря 2023 года.  
@@ -26,14 +30,17 @@ def data_part():
     а переходить на новые автомобили китайского производства пока не все готовы по причине отсутствия понимания логистики запчастей, срока службы автомобилей, а также их ремонтнопригодность.  
     """)
     if st.toggle('Показать датасет'):
-        st.dataframe(data)
+        st.dataframe(cleaned_data(DATASET))
 
     st.markdown("""
     Также по данным Аналитического агентства Автостат, В десятку самых популярных вошли марки девяти зарубежных брендов, разорвавших отношения с Россией: Toyota, Kia, Hyundai, Nissan, Volkswagen, Honda, Ford, Chevrolet и Renault. На первой строчке — ожидаемо бренд отечественного автопрома Lada.  
     Что в подтверждается данными полученными с агрегатора объявлений Drom.""")
 
+    # plotly is imported when the first chart is rendered, the text above does not wait for it.
+    import plotly.express as ple
+
     count = st.slider('Количество марок', 5, 20, 10)
-    top_15_adds = ple.bar(data.name.value_counts().head(count),
+    top_15_adds = ple.bar(counts_series(stats, 'name', count),
                           labels={'index': 'Марка автомобиля', 'value': 'Количнство объявлений, шт'})
     st.plotly_chart(top_15_adds, use_container_width=True)
 
@@ -41,13 +48,13 @@ def data_part():
 среднее значение с учетом догорих автомобилей составляет 2 млн. руб. (1 млн. руб. без учета дорогих авто), что в целом с учетом погрешности исследовний - сопоставимые результаты.
 Распределение стоимости автомобилей, согласно проведенному тесту Шапиро-Уилка, нормальное, со смещением в левую сторону (в сторону низкой стоимости).""")
 
-    prices_fig = ple.histogram(data.price, labels={'value': 'Стоимость, руб.'})
+    prices_fig = histogram_chart(ple, stats['histograms']['price'], 'Стоимость, руб.')
     st.plotly_chart(prices_fig, use_container_width=True)
 
     st.markdown("""Среднее значение годового пробега автомобиля, по данным сайта Автокод, составляет от 10 до 30 тыс. км. в год. По данным проанализированных 1974 объявлений, средний пробег составляет от 120 до 130 тыс. км. при среднем возрасте автомобиля в 10 лет.  
 Распределение пробега автомобилей также, согласно проведенному тесту Шапиро-Уилка, нормальное, со смещением в левую сторону (в сторону малого пробега). """)
 
-    mileage_fig = ple.histogram(data[data.mileage > 10].mileage, labels={'value': 'Пробег, тыс. км.'})
+    mileage_fig = histogram_chart(ple, stats['histograms']['mileage'], 'Пробег, тыс. км.')
     st.plotly_chart(mileage_fig, use_container_width=True)
 
     st.markdown(
@@ -67,19 +74,19 @@ def data_part():
 
     if st.toggle('Показать дополнительные графики'):
         st.markdown("""### Варианты коробок передач в объявлениях""")
-        st.plotly_chart(ple.bar(data.transmission.value_counts(),
+        st.plotly_chart(ple.bar(counts_series(stats, 'transmission'),
                                 labels={'index': 'Тип коробки передач', 'value': 'Количество, шт'}),
                         use_container_width=True)
 
         st.markdown("""### Распределение объема двигателя""")
-        st.plotly_chart(ple.histogram(data.engine_capacity, nbins=15, labels={'value': 'Объем двигателя, л'}),
+        st.plotly_chart(histogram_chart(ple, stats['histograms']['engine_capacity'], 'Объем двигателя, л'),
                         use_container_width=True)
 
         st.markdown("""### Распределение мощности двигателей л.с.""")
-        st.plotly_chart(ple.histogram(data.horse_power, nbins=15, labels={'value': 'Мощность двигателя, л.с.'}),
+        st.plotly_chart(histogram_chart(ple, stats['histograms']['horse_power'], 'Мощность двигателя, л.с.'),
                         use_container_width=True)
 
         st.markdown("""### Варианты топлива""")
         st.plotly_chart(
-            ple.bar(data.fuel.value_counts(), labels={'index': 'Тип топлива', 'value': 'Количество объявлений, шт'}),
+            ple.bar(counts_series(stats, 'fuel'), labels={'index': 'Тип топлива', 'value': 'Количество объявлений, шт'}),
             use_container_width=True)
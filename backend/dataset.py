@@ -0,0 +1,38 @@
+import json
+import os
+
+import pandas as pd
+import streamlit as st
+
+from data_prep.aggregates import load_aggregates
+from data_prep.comparables import load_comparables
+from data_prep.data_prep import load_dataset
+
+
+@st.cache_resource(show_spinner=False)
+def cleaned_data(name: str) -> pd.DataFrame:
+    return load_dataset(name)
+
+
+@st.cache_data(show_spinner=False)
+def dataset_aggregates(name: str) -> dict:
+    return load_aggregates(name)
+
+
+@st.cache_data(show_spinner=False)
+def selector_data(name: str) -> dict:
+    with open(os.path.join(name + '.json'), 'r') as f:
+        return json.load(f)
+
+
+@st.cache_resource(show_spinner='Загрузка модели...')
+def price_predictor(name: str, model_name: str):
+    # xgboost is imported with the model on the first prediction, not when the page is rendered.
+    from model.regression_model import get_predictor
+
+    return get_predictor(name, model_name)
+
+
+@st.cache_resource(show_spinner=False)
+def comparables_index(name: str):
+    return load_comparables(name)
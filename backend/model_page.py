@@ -3,8 +3,11 @@ import datetime
 import pandas as pd
 import streamlit as st
 
-from data_prep.data_prep import select_category_data, open_file, drop_data, replace, fillna_, price, name_sep
-from model.regression_model import predict, open_data
+from backend.dataset import comparables_index, dataset_aggregates, price_predictor, selector_data
+
+LABELS = {'name': 'Марка', 'model': 'Модель', 'year': 'Год выпуска', 'engine_capacity': 'Объем двигателя',
+          'horse_power': 'Мощность двигателя', 'fuel': 'Тип топлива', 'transmission': 'Коробка передач',
+          'drive_unit': 'Привод', 'mileage': 'Пробег', 'location': 'Город', 'bias': 'Средняя цена'}
 
 
 def model_part():
@@ -24,24 +27,13 @@ def model_part():
 * Accuracy тестовой выборки: 0.94262""")
     st.markdown("""# Использование модели""")
 
-    data = open_file('cars_2023-12-19')
-
-    data = drop_data(data)
-    data = replace(data)
-    data = fillna_(data)
-    data = price(data)
-    data = name_sep(data)
-
-    name, model, fuel, transmission, drive_unit, location = select_category_data(data)
-
-    name_to_model = st.selectbox('Марка', name.unique())
+    values = dataset_aggregates('cars_2023-12-19')['values']
 
-    selector = open_data('selector')
+    name_to_model = st.selectbox('Марка', values['name'])
 
-    for k in selector.keys():
-        selector[k].append('Другой')
+    selector = selector_data('selector')
 
-    model_to_model = st.selectbox('Модель', selector[name_to_model])
+    model_to_model = st.selectbox('Модель', selector[name_to_model] + ['Другой'])
 
     year_to_model = st.text_input('Год выпуска', key=1, placeholder='0',
                                   help='Введите год выпуска автомобиля (целое число)')
@@ -55,13 +47,13 @@ def model_part():
     mileage_to_model = st.text_input('Пробег', key=4, placeholder='0.0',
                                      help='Введите пробег автомобиля в тыс. км. (число с плавающей точкой)')
 
-    fuel_to_model_to_model = st.selectbox('Тип топлива', fuel.unique())
+    fuel_to_model_to_model = st.selectbox('Тип топлива', values['fuel'])
 
-    transmission_to_model = st.selectbox('Коробка передач', transmission.unique())
+    transmission_to_model = st.selectbox('Коробка передач', values['transmission'])
 
-    drive_unit_to_model = st.selectbox('Привод', drive_unit.unique())
+    drive_unit_to_model = st.selectbox('Привод', values['drive_unit'])
 
-    location_to_model = st.selectbox('Город', location.unique())
+    location_to_model = st.selectbox('Город', values['location'])
 
     data_to_model = [
         name_to_model,
@@ -78,7 +70,25 @@ def model_part():
 
     if st.button('Рассчитать:', use_container_width=True):
         try:
-            counted_price = int(round(predict(data_to_model, "data", "car_model")[0] * 1000, 0))
-            st.header(f'Ориентировочная стоимость составит: {counted_price:,d} руб.')
+            predictor = price_predictor("data", "car_model")
+            if predictor.has_interval:
+                prices = predictor.predict_interval(data_to_model)
+                counted_price, low, high = (int(round(prices[c] * 1000, 0)) for c in ('price', 'low', 'high'))
+                st.header(f'Ориентировочная стоимость составит: {counted_price:,d} руб. '
+                          f'(от {low:,d} до {high:,d} руб.)')
+            else:
+                counted_price = int(round(predictor.predict(data_to_model)[0] * 1000, 0))
+                st.header(f'Ориентировочная стоимость составит: {counted_price:,d} руб.')
         except:
             st.header('Вы не ввели корректные данные, при затруднении смотрите подсказки.')
+        else:
+            with st.expander('Из чего складывается стоимость'):
+                parts = price_predictor("data", "car_model").explain(data_to_model)
+                st.dataframe(pd.DataFrame({'Признак': parts.feature.map(LABELS),
+                                           'Значение': parts.value.astype(str).where(parts.value.notna(), ''),
+                                           'Вклад, руб.': (parts.contribution * 1000).round().astype(int)}),
+                             hide_index=True)
+            similar = comparables_index('cars_2023-12-19').query([data_to_model])
+            if len(similar):
+                st.markdown('### Похожие объявления')
+                st.dataframe(similar.drop(columns=['query', 'rank']), hide_index=True)
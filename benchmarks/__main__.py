@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from benchmarks.suite import BASELINE, CASES, compare, load_baseline, run_isolated, save_baseline
+
+
+def main(argv=None) -> int:
+    args = argparse.ArgumentParser(prog='python -m benchmarks',
+                                   description='Benchmarks of the hot paths against the stored baseline.')
+    args.add_argument('cases', nargs='*', help=f'cases to run, all by default: {", ".join(CASES)}')
+    args.add_argument('--threshold', type=float, default=0.25,
+                      help='allowed relative regression against the baseline, 0.25 = 25 %%')
+    args.add_argument('--baseline', default=BASELINE, help='JSON file with the stored baseline')
+    args.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    args = args.parse_args(argv)
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        print(f'Неизвестные бенчмарки: {", ".join(sorted(unknown))}', file=sys.stderr)
+        return 2
+
+    baseline = load_baseline(args.baseline)
+    results, failed = {}, False
+    print(f'{"case":18s} {"items/s":>12s} {"p50 ms":>10s} {"p99 ms":>10s} {"rss MB":>8s}  status')
+    for name in args.cases or CASES:
+        result = results[name] = run_isolated(name)
+        regressions = [] if args.update_baseline else compare(result, baseline.get(name), args.threshold)
+        status = 'REGRESSION: ' + '; '.join(regressions) if regressions else \
+            ('ok' if name in baseline else 'no baseline')
+        failed = failed or bool(regressions)
+        print(f'{name:18s} {result["items_per_s"]:12.1f} {result["p50_ms"]:10.3f} {result["p99_ms"]:10.3f} '
+              f'{result["peak_rss_mb"]:8.1f}  {status}', flush=True)
+
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        print(f'Baseline saved to {args.baseline}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+
+from scraper.extract import extract_listings
+from scraper.fixtures import write_fixtures
+
+
+def legacy_parse_page(response: str) -> list:
+    """
+    Summary
+        The BeautifulSoup parser parse_page used before scraper.extract: four find_all scans per page and nested
+        try/except around uncompiled regular expressions. Kept as the baseline of the benchmark.
+
+    Inputs
+        response (str): The HTML of the page.
+
+    Outputs
+        list: A list of rows of strings in the order of the HEADER columns.
+    """
+    soup = BeautifulSoup(response, features='lxml')
+    name_year = soup.find_all('span', {'data-ftid': 'bull_title'})
+    info = soup.find_all('div', class_='css-1fe6w6s e162wx9x0')
+    prices = soup.find_all('div', class_="css-1dv8s3l eyvqki91")
+    locations = soup.find_all('span', {'data-ftid': 'bull_location'})
+
+    rows = []
+    for ny, i, p, l in zip(name_year, info, prices, locations):
+        engin = hp = fuel = transmission = drive_unit = millage = None
+        name, year = ny.text.split(', ')
+        try:
+            engin_hp, fuel, transmission, drive_unit, millage = i.text.split(', ')
+            millage = re.findall(pattern=r'\d+.\d', string=millage.replace(' ', ''))
+            millage = ''.join(millage)
+            try:
+                engin, hp, *tail = re.findall(pattern=r'(\d+.\d)|(\d+)', string=engin_hp)
+                engin = ''.join(engin)
+                hp = ''.join(hp)
+            except:
+                engin = None
+                hp = re.findall(pattern=r'(\d+)', string=engin_hp)
+                hp = ''.join(hp)
+        except:
+            try:
+                engin_hp, fuel, transmission, drive_unit, *tail = i.text.split(', ')
+                try:
+                    engin, hp, *tail = re.findall(pattern=r'(\d+.\d)|(\d+)', string=engin_hp)
+                    engin = ''.join(engin)
+                    hp = ''.join(hp)
+                    millage = '0'
+                except:
+                    engin = None
+                    hp = re.findall(pattern=r'(\d+)', string=engin_hp)
+                    hp = ''.join(hp)
+            except:
+                pass
+        price = p.text
+        location = l.text
+
+        rows.append([name, year, engin, hp, fuel, transmission, drive_unit, millage, location, price])
+
+    return rows
+
+
+def load_pages(directory: str = None, dataset: str = 'cars_2023-12-19') -> list:
+    """Read the saved page<N>.html files of directory, rendering them from the dataset first if no directory is given."""
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='drom_pages_')
+        write_fixtures(dataset, directory)
+
+    names = sorted((f for f in os.listdir(directory) if re.fullmatch(r'page\d+\.html', f)),
+                   key=lambda f: int(f[4:-5]))
+    pages = []
+    for f in names:
+        with open(os.path.join(directory, f), encoding='utf-8') as page:
+            pages.append(page.read())
+    return pages
+
+
+def pages_per_second(parse, pages: list, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            parse(page)
+        best = min(best, time.perf_counter() - start)
+    return len(pages) / best
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Pages per second of the listing parsers on saved drom.ru pages.')
+    args.add_argument('directory', nargs='?', help='directory with page<N>.html files, rendered from the dataset '
+                                                   'if not given')
+    args.add_argument('--repeat', type=int, default=3)
+    args = args.parse_args(argv)
+
+    pages = load_pages(args.directory)
+    before = pages_per_second(legacy_parse_page, pages, args.repeat)
+    after = pages_per_second(extract_listings, pages, args.repeat)
+    print(f'{len(pages)} pages')
+    print(f'BeautifulSoup + find_all: {before:10.1f} pages/s')
+    print(f'lxml single pass:         {after:10.1f} pages/s ({after / before:.1f}x)')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import argparse
+import re
+import subprocess
+import sys
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_times(module: str) -> list:
+    """The (cumulative microseconds, module) of every import of a fresh interpreter importing module, -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                            text=True, check=True)
+    return [(int(m.group(2)), len(m.group(3)) // 2, m.group(4)) for m in map(LINE.match, result.stderr.splitlines())
+            if m]
+
+
+def total(module: str, repeat: int = 5) -> float:
+    """The best cumulative import time of module in seconds over repeat fresh interpreters."""
+    return min(next(t for t, _, name in import_times(module)[::-1] if name == module) for _ in range(repeat)) / 1e6
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Cold import time of the Streamlit app, measured with -X importtime.')
+    args.add_argument('module', nargs='?', default='backend')
+    args.add_argument('--repeat', type=int, default=5)
+    args.add_argument('--top', type=int, default=10, help='number of the slowest top-level imports to list')
+    args = args.parse_args(argv)
+
+    print(f'import {args.module}: {total(args.module, args.repeat) * 1000:.0f} ms (best of {args.repeat})')
+    heavy = sorted(((t, name) for t, level, name in import_times(args.module) if level <= 2), reverse=True)
+    for t, name in heavy[:args.top]:
+        print(f'{t / 1000:10.1f} ms  {name}')
+
+    loaded = {name for _, _, name in import_times(args.module)}
+    for name in ('xgboost', 'plotly', 'plotly.figure_factory', 'sklearn'):
+        print(f'{name:22s} {"imported" if name in loaded else "not imported"}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
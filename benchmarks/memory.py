@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.suite import synthetic_raw
+from data_prep.data_prep import memory_report
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Memory of the dataset read without a schema and with RAW_DTYPES.')
+    args.add_argument('--dataset', default='cars_2023-12-19')
+    args.add_argument('--rows', type=int, default=1_000_000, help='rows of the resampled dataset, 0 uses the file')
+    args = args.parse_args(argv)
+
+    pd.set_option('display.width', 200)
+    if not args.rows:
+        report = memory_report(args.dataset)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'cars')
+            synthetic_raw(args.rows, args.dataset).to_csv(name + '.csv', index=False)
+            report = memory_report(name)
+
+    print((report / 1_000_000).round(2).assign(raw_ratio=report.raw_ratio, clean_ratio=report.clean_ratio)
+          .to_string(header=['raw MB', 'clean MB', 'raw typed MB', 'clean typed MB', 'raw x', 'clean x']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
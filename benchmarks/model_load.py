@@ -0,0 +1,60 @@
+import argparse
+import subprocess
+import sys
+import time
+import warnings
+
+COLD = '''
+import time, warnings
+warnings.filterwarnings('ignore')
+import joblib
+from model.artifact import load_native
+from model.regression_model import DTYPES
+start = time.perf_counter()
+{load}
+print(time.perf_counter() - start)
+'''
+
+LOADERS = {
+    'pickle': "joblib.load('{name}.pkl')",
+    'native': "load_native('{name}', DTYPES)",
+}
+
+
+def cold_load(kind: str, name: str = 'car_model', repeat: int = 5) -> float:
+    """Best time of loading the model in repeat fresh interpreters, the libraries are imported before timing."""
+    code = COLD.format(load=LOADERS[kind].format(name=name))
+    return min(float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                    check=True).stdout) for _ in range(repeat))
+
+
+def warm_load(kind: str, name: str = 'car_model', repeat: int = 20) -> float:
+    """Best time of loading the model again in this process."""
+    import joblib
+
+    from model.artifact import load_native
+    from model.regression_model import DTYPES
+
+    load = {'pickle': lambda: joblib.load(name + '.pkl'), 'native': lambda: load_native(name, DTYPES)}[kind]
+    best = float('inf')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            load()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Load time of the pickled and the native model.')
+    args.add_argument('--model', default='car_model')
+    args = args.parse_args(argv)
+
+    for kind in LOADERS:
+        print(f'{kind:7s} cold {cold_load(kind, args.model) * 1000:8.1f} ms   '
+              f'warm {warm_load(kind, args.model) * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
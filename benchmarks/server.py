@@ -0,0 +1,74 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from model.server import make_server
+
+CAR = ['Toyota', 'Camry', '2018', '2.5', '181', 'бензин', 'АКПП', 'передний', '80', 'Москва']
+
+
+def load_test(url: str, requests: int = 2_000, concurrency: int = 32, data: list = None) -> dict:
+    """Send requests single-car POST /predict requests from concurrency threads and measure them."""
+    body = json.dumps({'data': data or CAR}).encode('utf-8')
+    latency = []
+    lock = threading.Lock()
+    per_thread = requests // concurrency
+
+    def client():
+        own = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            request = urllib.request.Request(url + '/predict', data=body, headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request) as response:
+                response.read()
+            own.append(time.perf_counter() - start)
+        with lock:
+            latency.extend(own)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latency = np.array(latency) * 1000
+    return {'requests': len(latency), 'requests_per_s': len(latency) / elapsed,
+            'p50_ms': float(np.percentile(latency, 50)), 'p99_ms': float(np.percentile(latency, 99))}
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Load test of the local inference server.')
+    args.add_argument('--url', help='address of a running server, an in-process one is started if not given')
+    args.add_argument('--requests', type=int, default=2_000)
+    args.add_argument('--concurrency', type=int, default=32)
+    args.add_argument('--max-batch', type=int, default=64)
+    args.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = args.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        server = make_server(port=0, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://%s:%d' % server.server_address
+
+    result = load_test(url, args.requests, args.concurrency)
+    print(f'{result["requests"]} requests, {result["requests_per_s"]:.1f} req/s, '
+          f'p50 {result["p50_ms"]:.2f} ms, p99 {result["p99_ms"]:.2f} ms')
+    with urllib.request.urlopen(url + '/metrics') as response:
+        print(response.read().decode('utf-8'))
+
+    if server is not None:
+        server.shutdown()
+        server.batcher.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
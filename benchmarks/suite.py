@@ -0,0 +1,215 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+DATASET = 'cars_2023-12-19'
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+CARS = [
+    ['Toyota', 'Camry', '2018', '2.5', '181', 'бензин', 'АКПП', 'передний', '80', 'Москва'],
+    ['Lada', 'Granta', '2020', '1.6', '90', 'бензин', 'механика', 'передний', '30', 'Казань'],
+    ['Kia', 'Rio', '2015', '1.6', '123', 'бензин', 'АКПП', 'передний', '100', 'Москва'],
+    ['Hyundai', 'Solaris', '2012', '1.4', '107', 'бензин', 'механика', 'передний', '150', 'Новосибирск'],
+]
+
+
+def synthetic_raw(rows: int, dataset: str = DATASET, seed: int = 0) -> pd.DataFrame:
+    """A raw dataset of rows rows sampled with replacement from the scraped CSV, as read by open_file."""
+    from data_prep.data_prep import open_file
+
+    raw = open_file(dataset)
+    return raw.sample(rows, replace=True, random_state=seed).reset_index(drop=True)
+
+
+def timed(fn, repeat: int) -> list:
+    latency = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latency.append(time.perf_counter() - start)
+    return latency
+
+
+def case_extract() -> tuple:
+    from benchmarks.extract import load_pages
+    from scraper.extract import extract_listings
+    from scraper.fixtures import write_fixtures
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_fixtures(DATASET, directory)
+        pages = load_pages(directory)
+
+    for page in pages:
+        extract_listings(page)
+    latency = []
+    for _ in range(5):
+        for page in pages:
+            latency += timed(lambda: extract_listings(page), 1)
+    return 1, latency
+
+
+def _case_clean(rows: int, repeat: int):
+    def case() -> tuple:
+        from data_prep.data_prep import clean
+
+        raw = synthetic_raw(rows)
+        return rows, timed(lambda: clean(raw.copy()), repeat)
+    return case
+
+
+def case_prepare_df() -> tuple:
+    from model.regression_model import prepare_df
+
+    prepare_df(CARS[0], 'data')
+    latency = []
+    for car in CARS * 50:
+        latency += timed(lambda: prepare_df(car, 'data'), 1)
+    return 1, latency
+
+
+def case_encode_batch() -> tuple:
+    from model.regression_model import encode_batch, load_encoder
+
+    encoder = load_encoder('data')
+    cars = CARS * 2_500
+    return len(cars), timed(lambda: encode_batch(cars, encoder), 10)
+
+
+def _case_predict(rows: int, repeat: int):
+    def case() -> tuple:
+        from model.regression_model import PricePredictor
+
+        predictor = PricePredictor('data', 'car_model', check_interval=60)
+        cars = (CARS * (rows // len(CARS) + 1))[:rows]
+        predictor.predict_batch(cars)
+        return rows, timed(lambda: predictor.predict_batch(cars), repeat)
+    return case
+
+
+def case_interval() -> tuple:
+    from model.regression_model import PricePredictor
+
+    predictor = PricePredictor('data', 'car_model', check_interval=60)
+    cars = CARS * 2_500
+    predictor.predict_interval_batch(cars)
+    return len(cars), timed(lambda: predictor.predict_interval_batch(cars), 10)
+
+
+def case_explain() -> tuple:
+    from data_prep.data_prep import clean
+    from model.regression_model import COLUMNS, PricePredictor
+
+    predictor = PricePredictor('data', 'car_model', check_interval=60)
+    data = clean(synthetic_raw(10_000))
+    cars = data.assign(mileage=np.random.default_rng(0).uniform(0, 300, len(data)).round(1))[COLUMNS]
+    cars = cars.astype(str).to_numpy().tolist()
+    predictor.explain_batch(cars)
+    return len(cars), timed(lambda: predictor.explain_batch(cars), 5)
+
+
+def case_model_load() -> tuple:
+    from model.regression_model import open_model
+
+    open_model('car_model')
+    return 1, timed(lambda: open_model('car_model'), 20)
+
+
+def case_comparables() -> tuple:
+    from data_prep.comparables import ComparablesIndex
+    from data_prep.data_prep import clean, open_file
+
+    index = ComparablesIndex.from_frame(clean(open_file(DATASET)))
+    cars = index.listings.sample(1_000, replace=True, random_state=0).reset_index(drop=True)
+    index.query(cars)
+    return len(cars), timed(lambda: index.query(cars), 20)
+
+
+CASES = {
+    'extract': case_extract,
+    'clean_1k': _case_clean(1_000, 20),
+    'clean_100k': _case_clean(100_000, 5),
+    'clean_1m': _case_clean(1_000_000, 3),
+    'prepare_df': case_prepare_df,
+    'encode_batch_10k': case_encode_batch,
+    'predict_1': _case_predict(1, 200),
+    'predict_100': _case_predict(100, 100),
+    'predict_10k': _case_predict(10_000, 10),
+    'interval_10k': case_interval,
+    'explain_10k': case_explain,
+    'model_load': case_model_load,
+    'comparables_1k': case_comparables,
+}
+
+
+def run_case(name: str) -> dict:
+    """Run a case in this process and summarise it. Peak RSS is that of the whole process."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        items, latency = CASES[name]()
+
+    latency = np.array(latency)
+    return {
+        'items_per_s': round(float(items * len(latency) / latency.sum()), 2),
+        'p50_ms': round(float(np.percentile(latency, 50)) * 1000, 4),
+        'p99_ms': round(float(np.percentile(latency, 99)) * 1000, 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(name: str) -> dict:
+    """Run a case in a fresh interpreter, so its peak RSS is not inflated by the cases before it."""
+    result = subprocess.run([sys.executable, '-m', 'benchmarks.suite', name], capture_output=True, text=True)
+    if result.returncode:
+        raise Exception(f'Ошибка: {result.stderr.strip()}')
+    return json.loads(result.stdout)
+
+
+def load_baseline(path: str = BASELINE) -> dict:
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_baseline(results: dict, path: str = BASELINE) -> None:
+    baseline = load_baseline(path)
+    baseline.update(results)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp, path)
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """
+    Summary
+        The compare function checks a case against its baseline. Lower throughput, or higher latency or peak RSS, by
+        more than threshold (0.25 = 25 %) is a regression.
+
+    Outputs
+        list: The messages of the regressions, empty if there are none.
+    """
+    regressions = []
+    if not baseline:
+        return regressions
+
+    if result['items_per_s'] < baseline['items_per_s'] * (1 - threshold):
+        regressions.append(f'throughput {result["items_per_s"]} < {baseline["items_per_s"]}')
+    for key in ('p50_ms', 'p99_ms', 'peak_rss_mb'):
+        if result[key] > baseline[key] * (1 + threshold):
+            regressions.append(f'{key} {result[key]} > {baseline[key]}')
+    return regressions
+
+
+if __name__ == '__main__':
+    print(json.dumps(run_case(sys.argv[1])))
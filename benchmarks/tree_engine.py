@@ -0,0 +1,63 @@
+import argparse
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from model.regression_model import COLUMNS, INT_64, FLOAT_32, open_model
+from model.tree_engine import TreeEnsemble
+
+
+def synthetic_batch(rows: int, seed: int = 0) -> pd.DataFrame:
+    """An encoded batch with the value ranges of the training data, a few float features left missing."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'name': rng.integers(1, 40_000, rows),
+        'model': rng.integers(1, 5_000, rows),
+        'year': rng.integers(1980, 2024, rows),
+        'engine_capacity': rng.uniform(0.8, 6.0, rows).round(1),
+        'horse_power': rng.uniform(50, 500, rows).round(),
+        'fuel': rng.integers(1, 90_000, rows),
+        'transmission': rng.integers(1, 60_000, rows),
+        'drive_unit': rng.integers(1, 70_000, rows),
+        'mileage': rng.uniform(0, 400, rows).round(1),
+        'location': rng.integers(1, 10_000, rows),
+    }, columns=COLUMNS)
+    df.loc[rng.random(rows) < 0.02, 'horse_power'] = np.nan
+    return df.astype({**{c: 'int64' for c in INT_64}, **{c: 'float32' for c in FLOAT_32}})
+
+
+def best_time(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='XGBoost predict vs the NumPy tree engine.')
+    args.add_argument('--model', default='car_model')
+    args.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 100_000])
+    args = args.parse_args(argv)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model = open_model(args.model)
+    engine = TreeEnsemble.from_booster(model)
+
+    print(f'{"rows":>8s} {"xgboost ms":>12s} {"numpy ms":>10s} {"speedup":>8s} {"max diff":>10s}')
+    for rows in args.sizes:
+        df = synthetic_batch(rows)
+        repeat = 50 if rows <= 1_000 else 3
+        diff = float(np.abs(model.predict(df) - engine.predict(df)).max())
+        xgb = best_time(lambda: model.predict(df), repeat)
+        npy = best_time(lambda: engine.predict(df), repeat)
+        print(f'{rows:8d} {xgb * 1000:12.3f} {npy * 1000:10.3f} {xgb / npy:7.1f}x {diff:10.2g}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
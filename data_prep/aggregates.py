@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from data_prep.data_prep import build_artifact, load_artifact, load_dataset
+
+TOP = 20
+COUNTS = ['name', 'transmission', 'fuel']
+VALUES = ['name', 'fuel', 'transmission', 'drive_unit', 'location']
+HISTOGRAMS = {'price': 50, 'mileage': 50, 'engine_capacity': 15, 'horse_power': 15}
+MIN_MILEAGE = 10
+
+
+def histogram(values: pd.Series, bins: int) -> dict:
+    values = values.dropna().to_numpy(np.float64)
+    counts, edges = np.histogram(values, bins=bins)
+    return {'edges': edges.round(6).tolist(), 'counts': counts.tolist()}
+
+
+def compute_aggregates(data: pd.DataFrame, top: int = TOP) -> dict:
+    """
+    Summary
+        The compute_aggregates function reduces the cleaned dataset to what the data page shows: the top counts of the
+        categorical columns, pre-binned histograms of the numeric columns and the describe() table. The result does not
+        grow with the number of rows.
+
+    Inputs
+        data (pd.DataFrame): The cleaned dataset.
+        top (int): The number of the most frequent values kept per column, the largest value of the page slider.
+
+    Outputs
+        dict: rows, counts (column -> [[value, count], ...]), values (column -> the distinct values in the order they
+            first appear, for the model page selectors), histograms (column -> edges and counts) and describe (the
+            describe() table in the pandas 'split' layout).
+    """
+    return {
+        'rows': len(data),
+        'counts': {c: [[str(k), int(v)] for k, v in data[c].value_counts().head(top).items()] for c in COUNTS},
+        'values': {c: [str(v) for v in pd.unique(data[c])] for c in VALUES},
+        'histograms': {c: histogram(data[c][data[c] > MIN_MILEAGE] if c == 'mileage' else data[c], bins)
+                       for c, bins in HISTOGRAMS.items()},
+        'describe': json.loads(data.describe().to_json(orient='split')),
+    }
+
+
+def build_aggregates(name: str) -> str:
+    """Compute the aggregates of a cars_<date> snapshot and save them next to it, keyed like its feather."""
+    aggregates = compute_aggregates(load_dataset(name))
+
+    def write(path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(aggregates, f, ensure_ascii=False)
+
+    return build_artifact(name, 'aggregates.json', write)
+
+
+def load_aggregates(name: str) -> dict:
+    with open(load_artifact(name, 'aggregates.json', build_aggregates), 'r') as f:
+        return json.load(f)
+
+
+def describe_frame(aggregates: dict) -> pd.DataFrame:
+    split = aggregates['describe']
+    return pd.DataFrame(split['data'], index=split['index'], columns=split['columns'])
+
+
+def counts_series(aggregates: dict, column: str, top: int = TOP) -> pd.Series:
+    pairs = aggregates['counts'][column][:top]
+    return pd.Series([v for _, v in pairs], index=[k for k, _ in pairs], name='count')
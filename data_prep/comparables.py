@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from data_prep.data_prep import build_artifact, load_artifact, load_dataset
+from telemetry.spans import span
+
+FEATURES = ['year', 'engine_capacity', 'horse_power', 'mileage']
+LISTING = ['name', 'model', 'year', 'engine_capacity', 'horse_power', 'fuel', 'transmission', 'drive_unit', 'mileage',
+           'location', 'price']
+K = 5
+YEAR_WINDOW = 3
+
+
+class ComparablesIndex:
+    """
+    The listings of the cleaned dataset grouped by brand and model. Inside a group the rows are sorted by year, with
+    the numeric columns in one float32 matrix, so a query cuts a year window with searchsorted and ranks it with one
+    vectorized distance.
+    """
+
+    def __init__(self, keys: dict, bounds: np.array, numeric: np.array, scale: np.array, rows: np.array,
+                 listings: pd.DataFrame):
+        self.keys = keys
+        self.bounds = bounds
+        self.numeric = numeric
+        self.scale = scale
+        self.rows = rows
+        self.listings = listings
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame) -> 'ComparablesIndex':
+        """Build the index over the output of data_prep.name_sep (or clean)."""
+        data = data.reset_index(drop=True)
+        names = data['name'].astype(str).to_numpy()
+        models = data['model'].astype(str).to_numpy()
+        numeric = data[FEATURES].to_numpy(np.float32)
+
+        rows = np.lexsort((numeric[:, 0], models, names))
+        names, models = names[rows], models[rows]
+        starts = np.flatnonzero(np.r_[True, (names[1:] != names[:-1]) | (models[1:] != models[:-1])])
+
+        scale = np.nanstd(numeric, axis=0).astype(np.float32)
+        scale[~(scale > 0)] = 1.0
+        return cls({(names[s], models[s]): i for i, s in enumerate(starts)}, np.r_[starts, len(rows)],
+                   numeric[rows], scale, rows, data)
+
+    def save(self, path: str) -> None:
+        brands, models = zip(*self.keys) if self.keys else ((), ())
+        # A file object, so np.savez does not append .npz to the path.
+        with open(path, 'wb') as f:
+            np.savez(f, brands=np.array(brands, dtype=str), models=np.array(models, dtype=str), bounds=self.bounds,
+                     numeric=self.numeric, scale=self.scale, rows=self.rows)
+
+    @classmethod
+    def load(cls, path: str, listings: pd.DataFrame) -> 'ComparablesIndex':
+        with np.load(path) as f:
+            keys = {k: i for i, k in enumerate(zip(f['brands'].tolist(), f['models'].tolist()))}
+            return cls(keys, f['bounds'], f['numeric'], f['scale'], f['rows'], listings)
+
+    def _window(self, start: int, stop: int, year: float, width: float) -> tuple:
+        years = self.numeric[start:stop, 0]
+        return start + np.searchsorted(years, year - width, side='left'), \
+            start + np.searchsorted(years, year + width, side='right')
+
+    def _rank(self, query: np.array, low: int, high: int, k: int) -> tuple:
+        distance = np.sqrt(np.nansum(((self.numeric[low:high] - query) / self.scale) ** 2, axis=1))
+        best = np.argpartition(distance, k - 1)[:k] if len(distance) > k else np.arange(len(distance))
+        return distance, best[np.argsort(distance[best], kind='stable')]
+
+    def nearest(self, name: str, model: str, values, k: int = K, year_window: int = YEAR_WINDOW) -> tuple:
+        """The positions in the dataset and the distances of the k listings of the brand and model closest to values."""
+        group = self.keys.get((str(name), str(model)))
+        if group is None:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        start, stop = self.bounds[group], self.bounds[group + 1]
+        query = np.asarray(values, np.float32)
+        low, high = self._window(start, stop, query[0], year_window)
+        if high - low < k:
+            low, high = start, stop
+
+        distance, best = self._rank(query, low, high, k)
+        # A listing outside the year window is at least year_window / scale away; if the k-th is farther, widen the
+        # window to its distance so the result is the exact k nearest of the brand and model.
+        reach = distance[best[-1]] * self.scale[0] if len(best) else 0.0
+        if reach > year_window and (low, high) != (start, stop):
+            low, high = self._window(start, stop, query[0], reach)
+            distance, best = self._rank(query, low, high, k)
+        return self.rows[low + best], distance[best]
+
+    def query(self, records, k: int = K, year_window: int = YEAR_WINDOW) -> pd.DataFrame:
+        """
+        Summary
+            The query method finds the k most similar listings for every car of a batch: the same brand and model,
+            the closest year, engine capacity, horse power and mileage, each scaled by its standard deviation over
+            the dataset.
+
+        Inputs
+            records: A DataFrame with the columns name, model and FEATURES, or a list of cars in the input format of
+                regression_model.predict (10 values, mileage in thousands of km).
+            k (int): The number of listings per car.
+            year_window (int): The listings at most this many years apart are ranked first, the window is widened
+                only if it holds fewer than k listings or a closer one could lie outside it, so the result is exact.
+
+        Outputs
+            pd.DataFrame: The listings with the query column (the position of the car in the batch), the rank and
+                the distance, ordered by query and rank. A car whose brand and model are not in the dataset, or
+                that cannot be read, has no rows.
+        """
+        if not isinstance(records, pd.DataFrame):
+            from model.regression_model import COLUMNS
+
+            records = pd.DataFrame([list(r) if isinstance(r, (list, tuple)) else [None] * len(COLUMNS)
+                                    for r in records], columns=COLUMNS)
+
+        with span('comparables.query'):
+            values = records[FEATURES].apply(pd.to_numeric, errors='coerce').to_numpy(np.float32)
+            positions, distances, queries = [], [], []
+            for i, (name, model) in enumerate(zip(records['name'], records['model'])):
+                if np.isnan(values[i, 0]):
+                    continue
+                rows, distance = self.nearest(name, model, values[i], k, year_window)
+                positions.append(rows)
+                distances.append(distance)
+                queries.append(np.full(len(rows), i))
+
+            if not positions:
+                return self.listings.iloc[:0][LISTING].assign(query=[], rank=[], distance=[])
+
+            queries = np.concatenate(queries)
+            result = self.listings.iloc[np.concatenate(positions)][LISTING].reset_index(drop=True)
+            return result.assign(query=queries,
+                                 rank=np.concatenate([np.arange(len(p)) for p in positions]),
+                                 distance=np.concatenate(distances).round(4))
+
+
+def build_comparables(name: str) -> str:
+    """Build the comparable-listings index of a cars_<date> snapshot and save it next to it, keyed like its feather."""
+    return build_artifact(name, 'comparables.npz', ComparablesIndex.from_frame(load_dataset(name)).save)
+
+
+def load_comparables(name: str) -> ComparablesIndex:
+    """The comparable-listings index of a cars_<date> snapshot, built on the first call after the snapshot changes."""
+    return ComparablesIndex.load(load_artifact(name, 'comparables.npz', build_comparables), load_dataset(name))
@@ -1,90 +1,211 @@
 import os
+import glob
+import hashlib
 import pandas as pd
 import numpy as np
 import json
-
-
-def open_file(name: str) -> pd.DataFrame:
-    return pd.read_csv(os.path.join(name + '.csv'))
+import pyarrow.feather as feather
+
+from telemetry.spans import span, timed
+
+RAW_DTYPES = {
+    'name': 'category',
+    'year': 'int16',
+    'engine_capacity': 'float32',
+    'horse_power': 'float32',
+    'fuel': 'category',
+    'transmission': 'category',
+    'drive_unit': 'category',
+    'mileage': 'float32',
+    'location': 'category',
+    'price': 'str',
+}
+
+CLEAN_DTYPES = {
+    'name': 'category',
+    'model': 'category',
+    'year': 'int16',
+    'engine_capacity': 'float32',
+    'horse_power': 'float32',
+    'fuel': 'category',
+    'transmission': 'category',
+    'drive_unit': 'category',
+    'mileage': 'float32',
+    'location': 'category',
+    'price': 'float32',
+}
+
+# The version of the cleaning steps, part of the names of the cached cleaned datasets with the dtypes: bump it when
+# clean changes its output, so the caches written by the old steps are rebuilt.
+CLEAN_VERSION = 2
+
+SCHEMA_TAG = hashlib.sha256(json.dumps({'version': CLEAN_VERSION, 'dtypes': CLEAN_DTYPES},
+                                       sort_keys=True).encode('utf-8')).hexdigest()[:8]
+
+
+@timed('data_prep.open_file')
+def open_file(name: str, schema: bool = True) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(name + '.csv'), dtype=RAW_DTYPES if schema else None)
 
 
 def category(data: pd.DataFrame) -> tuple:
-    return tuple(data.select_dtypes('object').columns)
+    return tuple(data.select_dtypes(['object', 'category']).columns)
 
 
 def number(data: pd.DataFrame) -> tuple:
     return tuple(data.select_dtypes('number').columns)
 
 
-def _flat_generator(list_):
-    for elem in list_:
-        for el in elem:
-            yield el
-
-
-def _indexes(data: list) -> set:
-    return {x for x in _flat_generator(data)}
-
-
 def drop_data(data: pd.DataFrame) -> pd.DataFrame:
-    to_drop = [
-        list(data[data.fuel == 'автомат'].index),
-        list(data[data.fuel == 'механика'].index),
-        list(data[data.transmission == '4WD'].index),
-        list(data[data.transmission == 'передний'].index)
-    ]
-    ind = _indexes(to_drop)
-    for i in ind:
-        data.drop(i, axis=0, inplace=True)
-
-    data.drop(data[data.drive_unit == '108 058 км'].index, axis=0, inplace=True)
+    to_drop = (data.fuel.isin(['автомат', 'механика']) |
+               data.transmission.isin(['4WD', 'передний']) |
+               (data.drive_unit == '108 058 км'))
 
-    return data
+    return data[~to_drop]
 
 
 def replace(data: pd.DataFrame) -> pd.DataFrame:
-    data.transmission.replace({'механика': 'МКПП',
-                               'автомат': 'АКПП',
-                               'робот': 'РКП',
-                               'вариатор': 'CVT'
-                               }, inplace=True)
-    return data
+    names = {'механика': 'МКПП',
+             'автомат': 'АКПП',
+             'робот': 'РКП',
+             'вариатор': 'CVT'
+             }
+    if isinstance(data.transmission.dtype, pd.CategoricalDtype):
+        # map calls the function once per category, not once per row.
+        return data.assign(transmission=data.transmission.map(lambda t: names.get(t, t)).astype('category'))
+    return data.assign(transmission=data.transmission.replace(names))
 
 
 def fillna_(data: pd.DataFrame) -> pd.DataFrame:
-    return data.fillna(0)
+    # A categorical column only takes a value among its categories: '0' is added to those with missing values, so
+    # they are filled like the untyped columns, whose 0 becomes '0' once the column is converted to strings.
+    filled = {}
+    for c in data.columns:
+        col = data[c]
+        if isinstance(col.dtype, pd.CategoricalDtype) and col.isna().any():
+            if '0' not in col.cat.categories:
+                col = col.cat.add_categories('0')
+            filled[c] = col.fillna('0')
+    data = data.assign(**filled)
+    return data.fillna({c: 0 for c in data.columns if not isinstance(data[c].dtype, pd.CategoricalDtype)})
 
 
 def price(data: pd.DataFrame) -> pd.DataFrame:
-    price_ = []
-    for d in data.price:
-        price_.append(d.replace('\xa0', '').replace('₽', ''))
-    data.reset_index(drop=True, inplace=True)
-    data.price = pd.Series(price_)
-
-    return data
+    data = data.reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(data.price):
+        return data
+    return data.assign(price=data.price.str.replace('\xa0', '', regex=False).str.replace('₽', '', regex=False))
 
 
 def name_sep(data: pd.DataFrame) -> pd.DataFrame:
-    data.price = data.price.astype('int')
-
-    data.price = data.price / 1_000
-    data.mileage = data.mileage / 1_000
+    title = data.name.str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
 
-    brand = []
-    model = []
-    for i in range(len(data.name)):
-        title = data.name[i].split(" ")
-        brand.append(title[0])
-        model.append(' '.join(title[1:]))
+    data = data.assign(name=title[0],
+                       model=title[1].fillna(''),
+                       price=data.price.astype('int') / 1_000,
+                       mileage=data.mileage / 1_000)
 
-    data.name = pd.Series(brand)
-    data['model'] = pd.Series(model)
-    data = data[['name', 'model', 'year', 'engine_capacity', 'horse_power', 'fuel',
+    return data[['name', 'model', 'year', 'engine_capacity', 'horse_power', 'fuel',
                  'transmission', 'drive_unit', 'mileage', 'location', 'price']]
 
+
+def typed(data: pd.DataFrame) -> pd.DataFrame:
+    data = data.astype(CLEAN_DTYPES)
+    return data.assign(**{c: data[c].cat.remove_unused_categories() for c in category(data)})
+
+
+def clean(data: pd.DataFrame, schema: bool = True) -> pd.DataFrame:
+    steps = (drop_data, replace, fillna_, price, name_sep, typed) if schema else \
+        (drop_data, replace, fillna_, price, name_sep)
+    for step in steps:
+        with span(f'data_prep.{step.__name__}'):
+            data = step(data)
     return data
 
 
+def file_hash(name: str) -> str:
+    digest = hashlib.sha256()
+    with open(os.path.join(name + '.csv'), 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_path(name: str, kind: str, digest: str = None) -> str:
+    """
+    The file of an artifact derived from a cars_<date> snapshot, e.g. its cleaned feather: named after the snapshot,
+    the hash of its CSV file and SCHEMA_TAG, so it is rebuilt when either changes, and ending with kind.
+    """
+    digest = file_hash(name) if digest is None else digest
+    return os.path.join(f'{name}.{digest[:16]}.{SCHEMA_TAG}.{kind}')
+
+
+def build_artifact(name: str, kind: str, write) -> str:
+    """
+    Summary
+        The build_artifact function writes an artifact of a cars_<date> snapshot next to it and removes the artifacts
+        of the same kind built from older versions of the snapshot.
+
+    Inputs
+        name (str): The name of the snapshot CSV file, without the extension.
+        kind (str): The end of the artifact file name, e.g. 'feather' or 'drift.json'.
+        write (callable): Writes the artifact to the file path it is given.
+
+    Flow
+        1. Write the artifact to a temporary file and move it in place, so a reader never sees a partial file.
+        2. Remove the other files name.*.kind.
+
+    Outputs
+        str: The path of the artifact, see artifact_path.
+    """
+    path = artifact_path(name, kind)
+
+    tmp = path + '.tmp'
+    write(tmp)
+    os.replace(tmp, path)
+
+    for old in glob.glob(glob.escape(name) + f'.*.{kind}'):
+        if old != path:
+            os.remove(old)
+
+    return path
+
+
+def load_artifact(name: str, kind: str, build) -> str:
+    """The path of the artifact of the snapshot, built with build(name) on the first call after the snapshot changes."""
+    path = artifact_path(name, kind)
+    if not os.path.exists(path):
+        path = build(name)
+    return path
+
+
+def build_dataset(name: str) -> str:
+    return build_artifact(name, 'feather', lambda path: feather.write_feather(clean(open_file(name)), path))
+
+
+def load_dataset(name: str) -> pd.DataFrame:
+    return feather.read_table(load_artifact(name, 'feather', build_dataset), memory_map=True).to_pandas()
+
+
+def memory_report(name: str) -> pd.DataFrame:
+    """
+    The deep memory in bytes of every column of the raw and the cleaned dataset, read and cleaned without a schema
+    and with RAW_DTYPES and CLEAN_DTYPES, with the ratio of the two.
+    """
+    columns = {}
+    for schema in (False, True):
+        raw = open_file(name, schema)
+        data = clean(raw, schema)
+        label = 'typed' if schema else 'untyped'
+        columns[f'raw_{label}'] = raw.memory_usage(index=False, deep=True)
+        columns[f'clean_{label}'] = data.memory_usage(index=False, deep=True)
+
+    report = pd.DataFrame(columns)
+    report.loc['total'] = report.sum()
+    report['raw_ratio'] = (report.raw_untyped / report.raw_typed).round(2)
+    report['clean_ratio'] = (report.clean_untyped / report.clean_typed).round(2)
+    return report
+
+
 def select_category_data(data: pd.DataFrame) -> tuple:
     return tuple(data[c] for c in category(data))
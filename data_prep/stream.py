@@ -0,0 +1,131 @@
+import datetime
+import os
+import re
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_prep.data_prep import CLEAN_DTYPES, clean
+
+RAW_COLUMNS = ['name', 'year', 'engine_capacity', 'horse_power', 'fuel', 'transmission', 'drive_unit', 'mileage',
+               'location', 'price']
+
+SCHEMA = pa.schema([
+    ('name', pa.string()),
+    ('model', pa.string()),
+    ('year', pa.int64()),
+    ('engine_capacity', pa.float64()),
+    ('horse_power', pa.float64()),
+    ('fuel', pa.string()),
+    ('transmission', pa.string()),
+    ('drive_unit', pa.string()),
+    ('mileage', pa.float64()),
+    ('location', pa.string()),
+    ('price', pa.float64()),
+])
+
+SNAPSHOT = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+
+def read_chunks(name: str, chunksize: int = 100_000):
+    """Read a cars_<date>.csv file in DataFrames of chunksize rows."""
+    return pd.read_csv(os.path.join(name + '.csv'), chunksize=chunksize)
+
+
+def record_chunks(records, chunksize: int = 100_000):
+    """Group scraped rows, e.g. the Listing records of parser.iter_pages, into DataFrames of chunksize rows."""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunksize:
+            yield pd.DataFrame(chunk, columns=RAW_COLUMNS)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=RAW_COLUMNS)
+
+
+def clean_chunks(chunks):
+    """Apply the clean() rules to every chunk. The rules work row by row, so chunks are cleaned independently."""
+    for chunk in chunks:
+        data = clean(chunk.astype({c: 'float64' for c in ['engine_capacity', 'horse_power', 'mileage']}))
+        if len(data):
+            yield data
+
+
+def snapshot_date(name: str) -> str:
+    """The scrape date from a cars_<date> file name, today for a name without a date."""
+    match = SNAPSHOT.search(os.path.basename(name))
+    return match.group(1) if match else datetime.date.today().isoformat()
+
+
+def write_partitioned(chunks, root: str, scrape_date: str) -> list:
+    """
+    Summary
+        The write_partitioned function writes cleaned chunks as Parquet files of the scrape_date=<date> partition of
+        root, one file per chunk, so only one chunk is in memory at a time. The partition is replaced, so writing a
+        snapshot again does not duplicate it.
+
+    Flow
+        1. Write the chunks into a temporary directory next to the partition, hidden from read_partitioned by its
+            leading dot. If a chunk fails, the directory is removed and the previous partition is left as it was.
+        2. Once every chunk is written, move the previous partition aside, move the new one into place with
+            os.replace and remove the previous one.
+
+    Inputs
+        chunks (iterable): Cleaned DataFrames, see clean_chunks.
+        root (str): The directory of the partitioned dataset.
+        scrape_date (str): The date of the snapshot, YYYY-MM-DD.
+
+    Outputs
+        list: The paths of the written files.
+    """
+    directory = os.path.join(root, f'scrape_date={scrape_date}')
+    os.makedirs(root, exist_ok=True)
+    stage = tempfile.mkdtemp(prefix=f'.scrape_date={scrape_date}-', dir=root)
+    try:
+        names = []
+        for i, chunk in enumerate(chunks):
+            names.append(f'part-{i:05d}.parquet')
+            chunk = chunk.astype({f.name: str for f in SCHEMA if f.type == pa.string()})
+            table = pa.Table.from_pandas(chunk, schema=SCHEMA, preserve_index=False)
+            pq.write_table(table, os.path.join(stage, names[-1]))
+
+        # A directory can not be replaced while it has files, so the previous partition is moved aside first.
+        previous = None
+        if os.path.exists(directory):
+            previous = stage + '.old'
+            os.replace(directory, previous)
+        try:
+            os.replace(stage, directory)
+        except OSError:
+            if previous is not None:
+                os.replace(previous, directory)
+            raise
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+    finally:
+        shutil.rmtree(stage, ignore_errors=True)
+
+    return [os.path.join(directory, name) for name in names]
+
+
+def stream_csv(name: str, root: str, chunksize: int = 100_000) -> list:
+    """Clean a cars_<date>.csv file chunk by chunk into the partition of its date in root."""
+    return write_partitioned(clean_chunks(read_chunks(name, chunksize)), root, snapshot_date(name))
+
+
+def stream_records(records, root: str, scrape_date: str = None, chunksize: int = 100_000) -> list:
+    """Clean scraped records chunk by chunk into the partition of scrape_date (today by default) in root."""
+    scrape_date = scrape_date or datetime.date.today().isoformat()
+    return write_partitioned(clean_chunks(record_chunks(records, chunksize)), root, scrape_date)
+
+
+def read_partitioned(root: str, dates: list = None, columns: list = None) -> pd.DataFrame:
+    """Read the partitioned dataset back, optionally only some scrape dates and columns, in the CLEAN_DTYPES schema."""
+    filters = [('scrape_date', 'in', list(dates))] if dates else None
+    table = pq.read_table(root, columns=columns, filters=filters, partitioning='hive')
+    data = table.to_pandas()
+    return data.astype({c: t for c, t in CLEAN_DTYPES.items() if c in data.columns})
@@ -0,0 +1,146 @@
+import datetime
+import json
+import logging
+import os
+
+import xgboost
+
+from xgboost import XGBRegressor
+
+from model.encoder import file_hash
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def native_path(name: str) -> str:
+    return os.path.join(name + '.ubj')
+
+
+def manifest_path(name: str) -> str:
+    return os.path.join(name + '.manifest.json')
+
+
+def export_model(model: XGBRegressor, name: str, dtypes: dict, data_name: str = 'data',
+                 training_data: str = None) -> dict:
+    """
+    Summary
+        The export_model function saves a model in the native UBJSON format of XGBoost, which loads without pickle and
+        does not depend on the versions of Python packages the model was trained with, together with a manifest
+        describing what the model expects.
+
+    Inputs
+        model (XGBRegressor): The trained model.
+        name (str): The name of the model files: name.ubj and name.manifest.json.
+        dtypes (dict): The column -> dtype of the prepared DataFrame, in the order of the columns.
+        data_name (str): The name of the JSON file with the count-encoding maps the model was trained with.
+        training_data (str): The name of the CSV file the model was trained on, if known.
+
+    Outputs
+        dict: The manifest.
+    """
+    model.save_model(native_path(name))
+    booster = model.get_booster()
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'xgboost_version': xgboost.__version__,
+        'model_file': os.path.basename(native_path(name)),
+        'model_sha256': file_hash(native_path(name)),
+        'feature_names': list(dtypes),
+        'feature_types': booster.feature_types,
+        'dtypes': {c: str(t) for c, t in dtypes.items()},
+        'encoder_file': os.path.basename(data_name + '.json'),
+        'encoder_sha256': file_hash(os.path.join(data_name + '.json')),
+        'training_data_file': os.path.basename(training_data + '.csv') if training_data else None,
+        'training_data_sha256': file_hash(os.path.join(training_data + '.csv')) if training_data else None,
+    }
+
+    tmp = manifest_path(name) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, manifest_path(name))
+
+    return manifest
+
+
+def read_manifest(name: str) -> dict:
+    if not os.path.exists(manifest_path(name)):
+        raise FileNotFoundError(f'Файла с названием {name} не существует!')
+
+    with open(manifest_path(name), 'r') as f:
+        return json.load(f)
+
+
+def verify_manifest(name: str, manifest: dict, dtypes: dict, data_name: str = None) -> None:
+    """
+    Summary
+        The verify_manifest function checks that the exported model is the one described by its manifest and fits the
+        code loading it. ValueError is raised on the first mismatch.
+
+    Inputs
+        name (str): The name of the model files.
+        manifest (dict): The manifest, see read_manifest.
+        dtypes (dict): The column -> dtype of the prepared DataFrame, in the order of the columns.
+        data_name (str): The name of the JSON file with the count-encoding maps the model will be used with. None
+            checks the file named in the manifest, next to the model.
+
+    Flow
+        1. The format version is known.
+        2. The model file has the checksum recorded at export.
+        3. The feature order and dtypes are those of the prepared DataFrame.
+        4. The JSON file with the count-encoding maps is the one the model was trained with.
+        5. A different XGBoost version than the one the model was exported with, or a training CSV next to the model
+            which is not the one it was trained on, is logged as a warning: the model still loads.
+    """
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f'Неизвестная версия формата модели: {manifest.get("format_version")}!')
+
+    directory = os.path.dirname(manifest_path(name))
+    model_file = os.path.join(directory, manifest['model_file'])
+    if file_hash(model_file) != manifest['model_sha256']:
+        raise ValueError(f'Контрольная сумма файла {model_file} не совпадает с манифестом!')
+
+    if manifest['feature_names'] != list(dtypes):
+        raise ValueError('Порядок признаков модели не совпадает с prepare_df!')
+
+    if manifest['dtypes'] != {c: str(t) for c, t in dtypes.items()}:
+        raise ValueError('Типы признаков модели не совпадают с prepare_df!')
+
+    encoder_file = os.path.join(data_name + '.json') if data_name is not None else \
+        os.path.join(directory, manifest['encoder_file'])
+    if not os.path.exists(encoder_file) or file_hash(encoder_file) != manifest['encoder_sha256']:
+        raise ValueError(f'Файл {encoder_file} не совпадает с тем, на котором обучалась модель!')
+
+    if manifest.get('xgboost_version') != xgboost.__version__:
+        logger.warning('Модель %s экспортирована XGBoost %s, загружается XGBoost %s', name,
+                       manifest.get('xgboost_version'), xgboost.__version__)
+
+    if manifest.get('training_data_file'):
+        training_data = os.path.join(directory, manifest['training_data_file'])
+        if os.path.exists(training_data) and file_hash(training_data) != manifest['training_data_sha256']:
+            logger.warning('Файл %s изменился после обучения модели %s', training_data, name)
+
+
+def load_native(name: str, dtypes: dict, data_name: str = None) -> XGBRegressor:
+    """
+    Summary
+        The load_native function loads a model saved by export_model after verifying its manifest.
+
+    Inputs
+        name (str): The name of the model files.
+        dtypes (dict): The column -> dtype of the prepared DataFrame, in the order of the columns.
+        data_name (str): The name of the JSON file with the count-encoding maps the model will be used with, see
+            verify_manifest.
+
+    Outputs
+        XGBRegressor: The loaded model.
+    """
+    manifest = read_manifest(name)
+    verify_manifest(name, manifest, dtypes, data_name)
+
+    model = XGBRegressor()
+    model.load_model(os.path.join(os.path.dirname(manifest_path(name)), manifest['model_file']))
+    return model
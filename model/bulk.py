@@ -0,0 +1,189 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_prep.data_prep import RAW_DTYPES, fillna_, replace
+from model.regression_model import COLUMNS, PricePredictor
+from scraper.fetcher import bounded_map
+
+logger = logging.getLogger(__name__)
+
+
+def csv_features(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    The model columns of a chunk of a scraped cars_<date> CSV file, row for row: the transmissions are renamed and
+    the missing values filled as in data_prep.clean, the title is split into brand and model and the mileage
+    converted to thousands of km as in name_sep, but no row is dropped, so the scores stay aligned with the input.
+    """
+    chunk = fillna_(replace(chunk))
+    title = chunk['name'].astype(str).str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
+    data = chunk.assign(name=title[0], model=title[1].fillna(''), mileage=chunk['mileage'] / 1_000)
+    return data.astype({c: str for c in ['fuel', 'transmission', 'drive_unit', 'location']})[COLUMNS]
+
+
+def read_csv_chunks(path: str, chunk_size: int):
+    """Pairs of (position of the first row, features DataFrame) of a cars_<date> CSV file."""
+    start = 0
+    for chunk in pd.read_csv(path, chunksize=chunk_size, dtype=RAW_DTYPES):
+        yield start, csv_features(chunk)
+        start += len(chunk)
+
+
+def read_jsonl_chunks(path: str, chunk_size: int):
+    """
+    Pairs of (position of the first row, list of records) of a JSONL file. A line is a list of 10 values, an object
+    with the COLUMNS keys, or a request of the inference server, {"data": [...]}. An unreadable line becomes a record
+    the model rejects, so it is reported with the other errors.
+    """
+    start = 0
+    chunk = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and 'data' in record:
+                record = record['data']
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield start, chunk
+                start += len(chunk)
+                chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def read_chunks(path: str, chunk_size: int):
+    if path.endswith('.csv'):
+        return read_csv_chunks(path, chunk_size)
+    return read_jsonl_chunks(path, chunk_size)
+
+
+_predictor = None
+
+
+def _init_worker(name: str, model_name: str, backend: str) -> None:
+    global _predictor
+    _predictor = PricePredictor(name, model_name, check_interval=float('inf'), backend=backend)
+
+
+def _score(rows) -> tuple:
+    prices, errors = _predictor.predict_batch(rows)
+    return prices, errors
+
+
+class _Writer:
+    """The scores of the rows in input order as JSONL lines or CSV rows: row, price, error."""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'w', newline='', encoding='utf-8') if path != '-' else sys.stdout
+        self.csv = csv.writer(self.file) if path.endswith('.csv') else None
+        if self.csv:
+            self.csv.writerow(['row', 'price', 'error'])
+
+    def write(self, start: int, prices: np.array, errors: dict) -> None:
+        if self.csv:
+            self.csv.writerows([start + i, '' if i in errors else float(p), errors.get(i, '')]
+                               for i, p in enumerate(prices))
+            return
+
+        self.file.writelines(json.dumps({'row': start + i, 'error': errors[i]} if i in errors else
+                                        {'row': start + i, 'price': float(p)}, ensure_ascii=False) + '\n'
+                             for i, p in enumerate(prices))
+
+    def close(self) -> None:
+        if self.file is not sys.stdout:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def score_file(source: str, target: str, name: str = 'data', model_name: str = 'car_model', chunk_size: int = 10_000,
+               workers: int = None, backend: str = 'xgboost', progress_every: float = 5.0) -> dict:
+    """
+    Summary
+        The score_file function prices every car of a JSONL or cars_<date> CSV file and writes the prices in the input
+        order as soon as they are ready. The input is read in chunks of chunk_size rows and at most 2 * workers chunks
+        are in flight, so the memory does not depend on the size of the file.
+
+    Inputs
+        source (str): The input file, .csv in the cars_<date> layout or JSONL (see read_jsonl_chunks).
+        target (str): The output file, .csv or JSONL, '-' for stdout.
+        name (str): The name of the JSON file with the count-encoding maps.
+        model_name (str): The name of the pre-trained machine learning model file.
+        chunk_size (int): The number of rows encoded and scored at once.
+        workers (int): The number of processes, each loads the model once and keeps it. 0 scores in this process, by
+            default the number of CPUs.
+        backend (str): 'xgboost' or 'numpy', see regression_model.predict.
+        progress_every (float): How often, in seconds, the progress is logged.
+
+    Outputs
+        dict: rows, errors, seconds and rows_per_s.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+
+    start = time.perf_counter()
+    last = start
+    rows = failed = 0
+    writer = _Writer(target)
+    try:
+        if workers:
+            executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(name, model_name, backend))
+            results = bounded_map(executor, _score, read_chunks(source, chunk_size), window=2 * workers)
+        else:
+            executor = None
+            _init_worker(name, model_name, backend)
+            results = ((first, _score(chunk)) for first, chunk in read_chunks(source, chunk_size))
+
+        try:
+            for first, (prices, errors) in results:
+                writer.write(first, prices, errors)
+                rows += len(prices)
+                failed += len(errors)
+
+                now = time.perf_counter()
+                if now - last >= progress_every:
+                    last = now
+                    logger.info('%d строк, %d ошибок, %.0f строк/с', rows, failed, rows / (now - start))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {'rows': rows, 'errors': failed, 'seconds': round(elapsed, 2),
+            'rows_per_s': round(rows / elapsed, 1) if elapsed else 0.0}
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Score a JSONL or cars_<date> CSV file with the car price model.')
+    args.add_argument('source', help='.csv in the cars_<date> layout or JSONL with a car per line')
+    args.add_argument('target', help='.csv or JSONL file for the prices, - for stdout')
+    args.add_argument('--data', default='data', help='name of the JSON file with the count-encoding maps')
+    args.add_argument('--model', default='car_model', help='name of the model file')
+    args.add_argument('--chunk-size', type=int, default=10_000)
+    args.add_argument('--workers', type=int, default=None, help='scoring processes, 0 scores in this process')
+    args.add_argument('--backend', default='xgboost', choices=['xgboost', 'numpy'])
+    args = args.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    report = score_file(args.source, args.target, args.data, args.model, args.chunk_size, args.workers, args.backend)
+    print(json.dumps(report), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def row_keys(df: pd.DataFrame) -> list:
+    """The cache keys of an encoded batch: the bytes of every row as float64, so equal cars give equal keys."""
+    values = np.ascontiguousarray(df.to_numpy(np.float64))
+    return [row.tobytes() for row in values]
+
+
+class PredictionCache:
+    """
+    Summary
+        The PredictionCache class keeps the predicted prices of recently seen cars, keyed on the encoded feature
+        vector. The most recently used maxsize entries are kept in memory, an entry older than ttl seconds is a miss.
+        With path set, the prices are also written to an SQLite file, so worker processes sharing the file share hits.
+
+    Inputs
+        maxsize (int): The largest number of entries kept in memory.
+        ttl (float): How long, in seconds, an entry stays valid. None keeps entries until they are evicted.
+        path (str): The SQLite file shared between processes, None for a memory-only cache.
+        disk_maxsize (int): The largest number of entries kept in the SQLite file.
+
+    Flow
+        1. bind is called with a version of the model and data.json files. A new version empties the memory and
+            makes the entries of the SQLite file written for other versions invisible.
+        2. get_many looks up the keys in memory, then the missing ones in the SQLite file.
+        3. put_many stores the new prices in memory, evicting the least recently used entries, and in the file.
+        4. get_many and put_many take the version the caller computed the keys and prices with. A version other than
+            the bound one finds nothing and stores nothing, so a request that started before bind can not mix the
+            prices of two versions of the files.
+
+    Outputs
+        dict: stats returns the hit, miss, eviction and size counters.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = None, path: str = None, disk_maxsize: int = 1_000_000):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.disk_maxsize = disk_maxsize
+        self.version = ''
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        if path:
+            self._connect().execute('CREATE TABLE IF NOT EXISTS prices '
+                                    '(version TEXT, key BLOB, price REAL, created REAL, PRIMARY KEY (version, key))')
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def bind(self, version: str) -> None:
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            self._connect().execute('DELETE FROM prices')
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get_many(self, keys: list, version: str = None) -> dict:
+        """The cached prices of the keys found, by position in keys, none if version is not the bound one."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            version = self.version if version is None else version
+            if version != self.version:
+                self.misses += len(keys)
+                return found
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if self._expired(entry[1], now):
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[i] = entry[0]
+
+        if self.path and len(found) < len(keys):
+            missing = {keys[i]: i for i in range(len(keys)) if i not in found}
+            rows = self._disk_get(list(missing), version, now)
+            with self._lock:
+                for key, price, created in rows:
+                    found[missing[key]] = price
+                    if version == self.version:
+                        self._store(key, price, created)
+                self.disk_hits += len(rows)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, keys: list, prices, version: str = None) -> None:
+        now = time.time()
+        prices = [float(p) for p in prices]
+        with self._lock:
+            version = self.version if version is None else version
+            if version != self.version:
+                return
+            for key, price in zip(keys, prices):
+                self._store(key, price, now)
+        if self.path and keys:
+            self._disk_put(keys, prices, version, now)
+
+    def _store(self, key: bytes, price: float, created: float) -> None:
+        self._entries[key] = (price, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, keys: list, version: str, now: float) -> list:
+        db = self._connect()
+        rows = []
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            marks = ','.join('?' * len(part))
+            rows += db.execute(f'SELECT key, price, created FROM prices WHERE version = ? AND key IN ({marks})',
+                               [version, *part]).fetchall()
+        return [(bytes(key), price, created) for key, price, created in rows if not self._expired(created, now)]
+
+    def _disk_put(self, keys: list, prices: list, version: str, now: float) -> None:
+        db = self._connect()
+        db.executemany('INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?)',
+                       [(version, key, price, now) for key, price in zip(keys, prices)])
+        self._writes += len(keys)
+        if self._writes >= self.disk_maxsize // 10:
+            self._writes = 0
+            self._prune(db)
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        db.execute('DELETE FROM prices WHERE version != ?', [self.version])
+        if self.ttl is not None:
+            db.execute('DELETE FROM prices WHERE created < ?', [time.time() - self.ttl])
+        db.execute('DELETE FROM prices WHERE rowid IN (SELECT rowid FROM prices ORDER BY created DESC '
+                   'LIMIT -1 OFFSET ?)', [self.disk_maxsize])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'disk_hits': self.disk_hits,
+            }
+
+
+class ContributionCache(PredictionCache):
+    """
+    The PredictionCache of the per-feature contributions of recently explained cars, one float32 array per encoded
+    car. It is kept in memory only.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = None):
+        super().__init__(maxsize, ttl)
+
+    def put_many(self, keys: list, contributions, version: str = None) -> None:
+        now = time.time()
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            for key, row in zip(keys, contributions):
+                self._store(key, np.array(row, dtype=np.float32), now)
+
+
+def files_version(files: list) -> str:
+    """A version of the model and data.json files from their modification times and sizes."""
+    stamp = []
+    for path in files:
+        try:
+            s = os.stat(path)
+            stamp.append(f'{os.path.abspath(path)}:{s.st_mtime_ns}:{s.st_size}')
+        except OSError:
+            stamp.append(f'{os.path.abspath(path)}:missing')
+    return hashlib.sha256('|'.join(stamp).encode('utf-8')).hexdigest()[:16]
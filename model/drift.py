@@ -0,0 +1,254 @@
+import argparse
+import collections
+import json
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_prep.data_prep import build_artifact, load_artifact, load_dataset
+from model.encoder import CountEncoder
+from model.regression_model import CATEGORY, COLUMNS, load_encoder
+
+NUMERIC = ['year', 'engine_capacity', 'horse_power', 'mileage', 'price']
+BINS = 20
+TOP = 30
+OTHER = '__other__'
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.25
+UNSEEN_DRIFT = 0.05
+MIN_RECORDS = 200
+EPSILON = 1e-4
+
+
+def compute_reference(data: pd.DataFrame, bins: int = BINS, top: int = TOP) -> dict:
+    """
+    Summary
+        The compute_reference function reduces the training snapshot to the distributions the drift monitor compares
+        the requests with: the share of the rows in every quantile bin of the numeric columns (price is the predicted
+        price of the requests) and of the top values of the categorical columns, the rest counted as OTHER.
+
+    Inputs
+        data (pd.DataFrame): The cleaned dataset.
+        bins (int): The number of quantile bins of a numeric column, fewer if the quantiles repeat.
+        top (int): The number of the most frequent values of a categorical column kept by name.
+
+    Outputs
+        dict: rows, numeric (column -> edges and shares, the first and last bin open-ended) and categorical
+            (column -> values and shares, OTHER last).
+    """
+    reference = {'rows': len(data), 'numeric': {}, 'categorical': {}}
+    for c in NUMERIC:
+        values = data[c].dropna().to_numpy(np.float64)
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        reference['numeric'][c] = {'edges': edges.round(6).tolist(), 'shares': (counts / counts.sum()).tolist()}
+
+    for c in CATEGORY:
+        counts = data[c].astype(str).value_counts()
+        kept = counts.head(top)
+        shares = np.append(kept.to_numpy(np.float64), counts.iloc[top:].sum()) / counts.sum()
+        reference['categorical'][c] = {'values': [str(v) for v in kept.index] + [OTHER], 'shares': shares.tolist()}
+    return reference
+
+
+def build_reference(name: str) -> str:
+    """Compute the drift reference of a cars_<date> snapshot and save it next to it, keyed like its feather."""
+    reference = compute_reference(load_dataset(name))
+
+    def write(path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(reference, f, ensure_ascii=False)
+
+    return build_artifact(name, 'drift.json', write)
+
+
+def load_reference(name: str) -> dict:
+    with open(load_artifact(name, 'drift.json', build_reference), 'r') as f:
+        return json.load(f)
+
+
+def psi(expected: np.array, actual: np.array) -> float:
+    """The population stability index of two arrays of shares over the same bins."""
+    expected, actual = np.maximum(expected, EPSILON), np.maximum(actual, EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks(expected: np.array, actual: np.array) -> float:
+    """The Kolmogorov-Smirnov statistic of two arrays of shares over the same ordered bins."""
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+class DriftMonitor:
+    """
+    Summary
+        The DriftMonitor class compares the cars of the scored requests with the training snapshot as they come, in
+        constant memory: for every column it keeps the counts over the bins or values of the reference, in blocks
+        of window / blocks records, and only the last blocks blocks, so the report covers the last window records.
+
+    Inputs
+        reference (dict): The distributions of the training snapshot, see load_reference.
+        encoder (CountEncoder): The count encoder of the model: a categorical value it does not know is encoded as
+            the count 1 by import_data and encode_batch and is counted as unseen here.
+        window (int): The number of the most recent records the report covers.
+        blocks (int): The number of blocks the window is kept in; the window moves by window / blocks records.
+
+    Flow
+        1. update takes a batch of request log records, reads the cars and the predicted price and adds them to the
+            counts of the current block. Unreadable numbers are counted as missing and unknown categorical values
+            as unseen, both outside the bins; categorical values which are not strings are not counted.
+        2. When the current block is full it joins the window and the oldest block is dropped.
+        3. report turns the counts of the window into shares and scores them against the reference: PSI for every
+            column, KS over the bins of the numeric ones, the unseen rate of the categorical ones.
+
+    Outputs
+        dict: report returns the records seen, the records in the window, and per column the scores and a status:
+            ok, warning (PSI above PSI_WARNING), drift (PSI above PSI_DRIFT or unseen rate above UNSEEN_DRIFT) or
+            insufficient (fewer than MIN_RECORDS records in the window).
+    """
+
+    def __init__(self, reference: dict, encoder: CountEncoder, window: int = 10_000, blocks: int = 10):
+        self.reference = reference
+        self.encoder = encoder
+        self.window = window
+        self.block_size = max(1, window // blocks)
+        self.records = 0
+        self._edges = {c: np.asarray(r['edges']) for c, r in reference['numeric'].items()}
+        self._values = {c: pd.Index(r['values'][:-1], dtype=object) for c, r in reference['categorical'].items()}
+        self._blocks = collections.deque(maxlen=blocks)
+        self._current = self._empty()
+        self._lock = threading.Lock()
+
+    def _empty(self) -> dict:
+        """Counts of a block: per numeric column its bins and missing, per categorical its values, OTHER, unseen."""
+        counts = {c: np.zeros(len(e) + 2, dtype=np.int64) for c, e in self._edges.items()}
+        counts.update({c: np.zeros(len(v) + 2, dtype=np.int64) for c, v in self._values.items()})
+        counts['records'] = np.zeros(1, dtype=np.int64)
+        return counts
+
+    def _count(self, frame: pd.DataFrame) -> dict:
+        counts = self._empty()
+        counts['records'][0] = len(frame)
+        for c, edges in self._edges.items():
+            values = pd.to_numeric(frame[c], errors='coerce').to_numpy(np.float64)
+            missing = np.isnan(values)
+            counts[c][:-1] += np.bincount(np.searchsorted(edges, values[~missing], side='right'),
+                                          minlength=len(edges) + 1)
+            counts[c][-1] += missing.sum()
+        for c, index in self._values.items():
+            values = frame[c][frame[c].map(lambda x: isinstance(x, str)).to_numpy(dtype=bool)]
+            codes = index.get_indexer(pd.Index(values, dtype=object))
+            codes[codes < 0] = len(index)
+            codes[~self.encoder.known(c, values)] = len(index) + 1
+            counts[c] += np.bincount(codes, minlength=len(index) + 2)
+        return counts
+
+    def update(self, records: list) -> None:
+        """Add a batch of request log records ({'data': car, 'price': ...}) to the window."""
+        rows = []
+        for record in records:
+            record = record if isinstance(record, dict) else {}
+            row = record.get('data')
+            if isinstance(row, dict):
+                row = [row.get(c) for c in COLUMNS]
+            if not isinstance(row, (list, tuple)) or len(row) != len(COLUMNS):
+                row = [None] * len(COLUMNS)
+            rows.append(list(row) + [record.get('price')])
+        frame = pd.DataFrame(rows, columns=COLUMNS + ['price'], dtype=object)
+
+        with self._lock:
+            start = 0
+            while start < len(frame):
+                room = self.block_size - int(self._current['records'][0])
+                self._add(self._count(frame.iloc[start:start + room]))
+                start += room
+            self.records += len(frame)
+
+    def _add(self, counts: dict) -> None:
+        for c, values in counts.items():
+            self._current[c] += values
+        if self._current['records'][0] >= self.block_size:
+            self._blocks.append(self._current)
+            self._current = self._empty()
+
+    def _window_counts(self) -> dict:
+        total = self._empty()
+        for block in list(self._blocks) + [self._current]:
+            for c, values in block.items():
+                total[c] += values
+        return total
+
+    def report(self) -> dict:
+        with self._lock:
+            counts = self._window_counts()
+            records = self.records
+        window = int(counts['records'][0])
+
+        features = {}
+        for c, edges in self._edges.items():
+            binned = counts[c][:-1]
+            expected = np.asarray(self.reference['numeric'][c]['shares'])
+            features[c] = {'missing_rate': round(float(counts[c][-1]) / window, 4) if window else 0.0}
+            if binned.sum():
+                actual = binned / binned.sum()
+                features[c].update(psi=round(psi(expected, actual), 4), ks=round(ks(expected, actual), 4))
+        for c in self._values:
+            known, seen = counts[c][:-1], counts[c].sum()
+            expected = np.asarray(self.reference['categorical'][c]['shares'])
+            features[c] = {'unseen_rate': round(float(counts[c][-1]) / float(seen), 4) if seen else 0.0}
+            if known.sum():
+                features[c]['psi'] = round(psi(expected, known / known.sum()), 4)
+
+        for score in features.values():
+            if window < MIN_RECORDS:
+                score['status'] = 'insufficient'
+            elif score.get('psi', 0.0) > PSI_DRIFT or score.get('unseen_rate', 0.0) > UNSEEN_DRIFT:
+                score['status'] = 'drift'
+            elif score.get('psi', 0.0) > PSI_WARNING:
+                score['status'] = 'warning'
+            else:
+                score['status'] = 'ok'
+
+        return {
+            'records': records,
+            'window': window,
+            'drift': [c for c, score in features.items() if score['status'] == 'drift'],
+            'features': features,
+        }
+
+
+def read_log(path: str, chunk_size: int = 10_000):
+    """Lists of up to chunk_size records of a request log, see telemetry.request_log; unreadable lines are skipped."""
+    chunk = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                chunk.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Compare a request log with the training snapshot of the model.')
+    args.add_argument('log', help='JSONL request log written by the inference server (--request-log)')
+    args.add_argument('--dataset', default='cars_2023-12-19', help='cars_<date> snapshot the model was trained on')
+    args.add_argument('--data', default='data', help='name of the JSON file with the count-encoding maps')
+    args.add_argument('--window', type=int, default=10_000, help='the number of the most recent records compared')
+    args = args.parse_args(argv)
+
+    monitor = DriftMonitor(load_reference(args.dataset), load_encoder(args.data), args.window)
+    for records in read_log(args.log):
+        monitor.update(records)
+    report = monitor.report()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report['drift'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
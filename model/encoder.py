@@ -0,0 +1,120 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class CountEncoder:
+    """
+    Summary
+        The CountEncoder class is a compiled form of the count-encoding maps from data.json. For every categorical
+        column it keeps a pandas Index of the known values and an np.int64 array of their counts, so a whole column of
+        raw strings is encoded with one hash lookup and one array take, without dicts of strings and without
+        converting the counts from strings at request time.
+
+    Inputs
+        columns (list): The names of the encoded columns, in the order of the maps in data.json.
+        keys (list): For every column an array of the known values.
+        counts (list): For every column an np.int64 array of the counts of the known values.
+        source (str): The sha256 of the data.json the encoder was built from.
+
+    Flow
+        1. Build an Index of the known values of every column and append the count 1 for unseen values to the
+            counts.
+        2. To encode a column find the position of every value in the Index, unseen values get the position -1,
+            which is the appended count 1.
+
+    Outputs
+        np.array: encode returns an np.int64 array of counts for the given values.
+    """
+
+    def __init__(self, columns: list, keys: list, counts: list, source: str = ''):
+        self.columns = list(columns)
+        self.source = source
+        self._index = {c: pd.Index(np.asarray(k).tolist(), dtype=object) for c, k in zip(self.columns, keys)}
+        self._counts = {c: np.append(np.asarray(v, dtype=np.int64), np.int64(1)) for c, v in zip(self.columns, counts)}
+
+    @classmethod
+    def from_info(cls, info: list, columns: list, source: str = '') -> 'CountEncoder':
+        """Build the encoder from the 'data' section of data.json: a list of dicts of value -> count as a string."""
+        if len(info) != len(columns):
+            raise ValueError(f'Ожидалось {len(columns)} словарей, получено {len(info)}!')
+
+        keys = [list(v.keys()) for v in info]
+        counts = [np.array([int(x) for x in v.values()], dtype=np.int64) for v in info]
+        return cls(columns, keys, counts, source)
+
+    def encode(self, column: str, values) -> np.array:
+        codes = self._index[column].get_indexer(pd.Index(values, dtype=object))
+        return self._counts[column][codes]
+
+    def count(self, column: str, value: str) -> np.int64:
+        """The count of a single value of the column, 1 if unseen: one hash lookup, without building an Index."""
+        try:
+            return self._counts[column][self._index[column].get_loc(value)]
+        except KeyError:
+            return self._counts[column][-1]
+
+    def known(self, column: str, values) -> np.array:
+        """A bool array, True for the values of the column the encoder has a count for, False for the unseen ones."""
+        return self._index[column].get_indexer(pd.Index(values, dtype=object)) >= 0
+
+    def transform(self, data: pd.DataFrame) -> dict:
+        """Encode every column of the encoder found in data. Returns a dict of column name -> np.int64 array."""
+        return {c: self.encode(c, data[c]) for c in self.columns if c in data.columns}
+
+    def updated(self, data: pd.DataFrame, known: bool = True) -> 'CountEncoder':
+        """
+        A new encoder with the rows of data added to the counts: known values get their count in data added, new values
+        are appended with it. The counts of the old rows are not recomputed. With known=False the counts of the known
+        values are kept as they are.
+        """
+        keys, counts = [], []
+        for c in self.columns:
+            index, merged = self._index[c], self._counts[c][:-1].copy()
+            values = data[c].astype(str) if c in data.columns else pd.Series(dtype=str)
+            if values.isna().any():
+                raise ValueError(f'В столбце {c} есть пропуски, данные должны быть очищены!')
+            delta = values.value_counts(sort=False)
+            if known:
+                found = index.get_indexer(delta.index)
+                np.add.at(merged, found[found >= 0], delta.to_numpy(np.int64)[found >= 0])
+
+            new = pd.Index(pd.unique(values)).difference(index, sort=False)
+            keys.append(list(index) + list(new))
+            counts.append(np.concatenate([merged, delta.reindex(new).to_numpy(np.int64)]))
+        return CountEncoder(self.columns, keys, counts, self.source)
+
+    def to_info(self) -> list:
+        """The maps in the data.json format."""
+        return [{k: str(v) for k, v in zip(self._index[c], self._counts[c][:-1])} for c in self.columns]
+
+    def save(self, path: str) -> None:
+        """Write the encoder to an .npz file, which np.load reads back without pickle and without parsing."""
+        with open(path, 'wb') as f:
+            np.savez(f,
+                     columns=np.array(self.columns, dtype=str),
+                     source=np.array(self.source, dtype=str),
+                     sizes=np.array([len(self._index[c]) for c in self.columns], dtype=np.int64),
+                     keys=np.array([k for c in self.columns for k in self._index[c]], dtype=str),
+                     counts=np.concatenate([self._counts[c][:-1] for c in self.columns]))
+
+    @classmethod
+    def load(cls, path: str) -> 'CountEncoder':
+        with np.load(path, allow_pickle=False) as f:
+            columns = [str(c) for c in f['columns']]
+            bounds = np.cumsum(f['sizes'])[:-1]
+            keys = np.split(f['keys'], bounds)
+            counts = np.split(f['counts'], bounds)
+            source = str(f['source'])
+        return cls(columns, keys, counts, source)
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compiled_path(name: str) -> str:
+    return os.path.join(name + '.npz')
@@ -0,0 +1,186 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from xgboost import XGBRegressor
+
+from model.regression_model import MARGIN_ATTR, QUANTILES, load_encoder, open_model, open_quantiles
+from model.training import (conformal_margin, coverage, encode_features, load_training_data, predict_quantiles, rmse,
+                            r2, training_params, write_artifacts)
+from telemetry.spans import span
+
+logger = logging.getLogger(__name__)
+
+
+def merge_selector(selector: dict, data) -> dict:
+    """The brand -> models map with the brands and models of data added after the known ones."""
+    merged = {name: list(models) for name, models in selector.items()}
+    for name, model in data[['name', 'model']].drop_duplicates().itertuples(index=False):
+        models = merged.setdefault(name, [])
+        if model not in models:
+            models.append(model)
+    return merged
+
+
+def continue_boosting(model: XGBRegressor, x, y, rounds: int) -> XGBRegressor:
+    """
+    A new model with rounds trees fitted on x, y added to the trees of model, with the parameters it was trained with,
+    see model.training.keep_params. They are not in the native model file, so get_params would give the defaults.
+    """
+    params = training_params(model)
+    return XGBRegressor(n_estimators=rounds, **params).fit(x, y, xgb_model=model.get_booster(), verbose=False)
+
+
+def recalibrate(quantiles: dict, updated: dict, x_before, x_after, y) -> dict:
+    """
+    Measure the conformal margin of the updated quantile models on the first half of the holdout and store it in
+    their boosters, then the coverage of the current and the updated range on the second half.
+    """
+    half = len(y) // 2
+    if not half:
+        raise ValueError(f'Недостаточно отложенных строк для калибровки диапазона цены: {len(y)}!')
+
+    low, high = updated['low'].predict(x_after[:half]), updated['high'].predict(x_after[:half])
+    margin = conformal_margin(y[:half], low, high, QUANTILES['high'] - QUANTILES['low'])
+    for label in ('low', 'high'):
+        updated[label].get_booster().set_attr(**{MARGIN_ATTR: str(margin)})
+
+    before = predict_quantiles(quantiles, x_before[half:])
+    after = predict_quantiles(updated, x_after[half:])
+    return {
+        'coverage_before': round(coverage(y[half:], before['low'], before['high']), 4),
+        'coverage_after': round(coverage(y[half:], after['low'], after['high']), 4),
+        'margin': round(margin, 3),
+    }
+
+
+def refresh(datasets: list, name: str = 'data', model_name: str = 'car_model', selector_name: str = 'selector',
+            rounds: int = 50, holdout: float = 0.2, tolerance: float = 0.05, seed: int = 0,
+            freeze_counts: bool = False, dry_run: bool = False) -> dict:
+    """
+    Summary
+        The refresh function updates the model and its encoder with newly scraped listings instead of training from
+        scratch: the counts of data.json grow by the counts of the new rows, the booster gets rounds more trees fitted
+        on them, and the result replaces the artifacts only if it is not worse on held-out new rows.
+
+    Inputs
+        datasets (list): The new listings only, e.g. a CSV written by parser.get_data with seen, see
+            model.training.load_training_data.
+        name, model_name, selector_name (str): The names of the artifacts to update.
+        rounds (int): The number of trees to add.
+        holdout (float): The share of the new rows held out to validate the update.
+        tolerance (float): The update is accepted if its holdout RMSE is at most (1 + tolerance) times that of the
+            current model, and if the share of the holdout prices in the updated quantile range is at most tolerance
+            farther from the nominal QUANTILES['high'] - QUANTILES['low'] than with the current quantile models.
+        seed (int): The seed of the holdout split.
+        freeze_counts (bool): Keep the counts of the known values and only append the new values with their counts.
+            The trees split on count thresholds, so when the new rows are a large share of the history, the additive
+            counts move the known values across the thresholds of the existing trees and the update is rejected;
+            frozen counts keep the existing trees valid.
+        dry_run (bool): Validate without writing the artifacts.
+
+    Flow
+        1. Load the current model, the current encoder and the new rows.
+        2. Add the counts of the new rows to the encoder (unless freeze_counts), new values are appended.
+        3. Continue boosting the current booster (xgb_model=) on the new rows outside the holdout, encoded with the
+            updated encoder.
+        4. Compare the holdout RMSE of the current model with the current encoder and of the updated pair.
+        5. If accepted, write the updated model, data.json, its .npz and selector.json with
+            model.training.write_artifacts, which moves them into place atomically with the manifest last.
+        6. The quantile models of the price range, if there are any, get rounds more trees on the same rows. Their
+            conformal margin is measured again on one half of the holdout, and the coverage of the range on the
+            other half decides, with the RMSE, whether the update is accepted. They are written with the model, so
+            they stay valid for the new data.json.
+
+    Outputs
+        dict: The report: rows, rmse and r2 of both pairs on the holdout, with quantile models their coverage and the
+            new margin, whether the update was accepted and written, and the time in seconds.
+    """
+    start = time.perf_counter()
+    with span('refresh.load'):
+        model = open_model(model_name, name)
+        quantiles = open_quantiles(model_name, name)
+        encoder = load_encoder(name)
+        data = load_training_data(datasets)
+        with open(os.path.join(selector_name + '.json'), 'r') as f:
+            selector = json.load(f)
+
+    updated_encoder = encoder.updated(data, known=not freeze_counts)
+    y = data['price'].to_numpy(np.float32)
+    order = np.random.default_rng(seed).permutation(len(data))
+    split = int(len(data) * (1 - holdout))
+    train_rows, test_rows = order[:split], order[split:]
+    if not len(train_rows) or not len(test_rows):
+        raise ValueError(f'Недостаточно новых строк для обновления: {len(data)}!')
+
+    with span('refresh.fit'):
+        x = encode_features(data, updated_encoder)
+        updated = continue_boosting(model, x.iloc[train_rows], y[train_rows], rounds)
+        updated_quantiles = {label: continue_boosting(quantile, x.iloc[train_rows], y[train_rows], rounds)
+                             for label, quantile in quantiles.items()}
+
+    with span('refresh.validate'):
+        x_before = encode_features(data.iloc[test_rows], encoder)
+        before = model.predict(x_before)
+        after = updated.predict(x.iloc[test_rows])
+
+    report = {
+        'rows': len(data),
+        'trees': updated.get_booster().num_boosted_rounds(),
+        'rmse_before': round(rmse(y[test_rows], before), 3),
+        'rmse_after': round(rmse(y[test_rows], after), 3),
+        'r2_before': round(r2(y[test_rows], before), 4),
+        'r2_after': round(r2(y[test_rows], after), 4),
+    }
+    report['accepted'] = report['rmse_after'] <= report['rmse_before'] * (1 + tolerance)
+
+    if quantiles:
+        with span('refresh.quantiles'):
+            report.update(recalibrate(quantiles, updated_quantiles, x_before, x.iloc[test_rows], y[test_rows]))
+        width = QUANTILES['high'] - QUANTILES['low']
+        report['accepted'] = report['accepted'] and \
+            abs(report['coverage_after'] - width) <= abs(report['coverage_before'] - width) + tolerance
+    report['written'] = report['accepted'] and not dry_run
+
+    if report['written']:
+        with span('refresh.write'):
+            write_artifacts(updated, updated_encoder, merge_selector(selector, data), name, model_name, selector_name,
+                            quantiles=updated_quantiles)
+    elif not report['accepted']:
+        logger.warning('Обновление отклонено: RMSE %.3f против %.3f, покрытие диапазона %s против %s',
+                       report['rmse_after'], report['rmse_before'], report.get('coverage_after'),
+                       report.get('coverage_before'))
+
+    report['total_s'] = round(time.perf_counter() - start, 1)
+    return report
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Update the car price model with newly scraped listings.')
+    args.add_argument('datasets', nargs='+', help='cars_<date> CSV files with new listings, without extension, or '
+                                                  'partitioned Parquet directories')
+    args.add_argument('--data', default='data', help='name of the JSON file with the count-encoding maps')
+    args.add_argument('--model', default='car_model', help='name of the model files')
+    args.add_argument('--selector', default='selector', help='name of the JSON file with the brand -> models map')
+    args.add_argument('--rounds', type=int, default=50)
+    args.add_argument('--holdout', type=float, default=0.2)
+    args.add_argument('--tolerance', type=float, default=0.05)
+    args.add_argument('--seed', type=int, default=0)
+    args.add_argument('--freeze-counts', action='store_true', help='keep the counts of the known values')
+    args.add_argument('--dry-run', action='store_true')
+    args = args.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = refresh(args.datasets, args.data, args.model, args.selector, args.rounds, args.holdout, args.tolerance,
+                     args.seed, args.freeze_counts, args.dry_run)
+    print(json.dumps(report, indent=2))
+    return 0 if report['accepted'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,28 +1,62 @@
 import json
+import logging
 import os
+import re
+import threading
+import time
 import joblib
 
+from typing import NamedTuple
+
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 
-from xgboost import XGBRegressor
+from xgboost import DMatrix, XGBRegressor
+
+from model.artifact import export_model, load_native, manifest_path, native_path
+from model.cache import ContributionCache, PredictionCache, files_version, row_keys
+from model.encoder import CountEncoder, file_hash, compiled_path
+from model.tree_engine import TreeEnsemble
+from telemetry.spans import span, timed
+
+logger = logging.getLogger(__name__)
 
+COLUMNS = ['name', 'model', 'year', 'engine_capacity', 'horse_power', 'fuel', 'transmission', 'drive_unit', 'mileage',
+           'location']
+CATEGORY = ['transmission', 'name', 'model', 'fuel', 'drive_unit', 'location']
+INT_64 = ['name', 'model', 'year', 'fuel', 'transmission', 'drive_unit', 'location']
+FLOAT_32 = ['engine_capacity', 'horse_power', 'mileage']
+BACKENDS = ('xgboost', 'numpy')
+EXPLAIN_METHODS = ('auto', 'exact', 'approx')
+QUANTILES = {'low': 0.1, 'median': 0.5, 'high': 0.9}
+MARGIN_ATTR = 'interval_margin'
+DTYPES = {c: 'int64' if c in INT_64 else 'float32' for c in COLUMNS}
+_NUMERIC_TYPES = frozenset([str, int, float, type(None), np.int16, np.int32, np.int64, np.float32, np.float64])
+_DECIMAL = re.compile(r'-?[0-9]+(\.[0-9]+)?')
 
-def open_model(name: str) -> XGBRegressor:
+
+@timed('model.open_model')
+def open_model(name: str, data_name: str = None) -> XGBRegressor:
     """
     Summary
         The open_model function is a Python function that takes a string parameter name and returns an instance of the XGBRegressor class. It is used to load a pre-trained machine learning model from a file.
 
     Inputs
         name (string): The name of the model file to be loaded.
+        data_name (string): The name of the JSON file with the count-encoding maps the model will be used with, which
+            must be the one it was trained with. None checks the file named in the manifest.
 
     Flow
         1. Check if the name parameter is a string. If not, raise a ValueError with the message "Название должно быть
             строкой!".
-        2. Check if the model file with the given name exists. If not, raise a FileNotFoundError with the message
+        2. If the model was exported with export_native (name + '.manifest.json' exists), verify the manifest against
+            data_name and load the native XGBoost file name + '.ubj'.
+        3. Otherwise check if the model file name + '.pkl' exists. If not, raise a FileNotFoundError with the message
             "Файла с названием {name} не существует!".
-        3. Open the model file using joblib.load and assign it to the model variable.
-        4. Return the loaded model.
+        4. Open the model file using joblib.load and assign it to the model variable.
+        5. Return the loaded model.
 
     Outputs
         model (XGBRegressor): The loaded machine learning model.
@@ -30,18 +64,65 @@ def open_model(name: str) -> XGBRegressor:
     if not isinstance(name, str):
         raise ValueError('Название должно быть строкой!')
 
+    if os.path.exists(manifest_path(name)):
+        return load_native(name, DTYPES, data_name)
+
     if not os.path.exists(os.path.join(name + '.pkl')):
         raise FileNotFoundError(f'Файла с названием {name} не существует!')
 
     try:
-        with open(os.path.join(name + '.pkl'), 'r') as f:
-            model = joblib.load(os.path.join(name + '.pkl'))
-            return model
+        model = joblib.load(os.path.join(name + '.pkl'))
+        return model
 
     except Exception as e:
         raise Exception(f'Ошибка: {e}')
 
 
+def model_files(name: str) -> list:
+    """The files open_model reads for the model name."""
+    if os.path.exists(manifest_path(name)):
+        return [manifest_path(name), native_path(name)]
+    return [os.path.join(name + '.pkl')]
+
+
+def quantile_name(model_name: str, label: str) -> str:
+    """The name of the files of the quantile model label ('low', 'median' or 'high') of the model model_name."""
+    return f'{model_name}.{label}'
+
+
+def open_quantiles(model_name: str, data_name: str = None) -> dict:
+    """
+    The quantile models of model_name by label, see model.training.fit_quantiles, or an empty dict if any of them
+    was not exported. data_name is checked as in open_model.
+    """
+    names = {label: quantile_name(model_name, label) for label in QUANTILES}
+    if not all(os.path.exists(manifest_path(n)) for n in names.values()):
+        return {}
+    return {label: open_model(n, data_name) for label, n in names.items()}
+
+
+def export_native(model_name: str, name: str = 'data', training_data: str = None) -> dict:
+    """
+    Summary
+        The export_native function converts the pickled model name + '.pkl' to the native XGBoost format with a
+        manifest (see model.artifact.export_model). From then on open_model loads the native file.
+
+    Inputs
+        model_name (str): The name of the pickled model file.
+        name (str): The name of the JSON file with the count-encoding maps the model was trained with.
+        training_data (str): The name of the CSV file the model was trained on, if known.
+
+    Outputs
+        dict: The manifest.
+    """
+    if not os.path.exists(os.path.join(model_name + '.pkl')):
+        raise FileNotFoundError(f'Файла с названием {model_name} не существует!')
+
+    model = joblib.load(os.path.join(model_name + '.pkl'))
+    return export_model(model, model_name, DTYPES, name, training_data)
+
+
+@timed('model.open_data')
 def open_data(name: str) -> dict:
     """
     Summary
@@ -81,6 +162,55 @@ def open_data(name: str) -> dict:
         raise Exception(f'Ошибка: {e}')
 
 
+def compile_encoder(name: str) -> CountEncoder:
+    """
+    Summary
+        The compile_encoder function builds a CountEncoder from the JSON file with the count-encoding maps and saves it
+        next to it as name + '.npz', which load_encoder reads instead of the JSON file while the JSON file is unchanged.
+
+    Inputs
+        name (str): The name of the JSON file with the count-encoding maps.
+
+    Outputs
+        CountEncoder: The compiled encoder.
+    """
+    encoder = CountEncoder.from_info(open_data(name)['data'], CATEGORY, file_hash(os.path.join(name + '.json')))
+    encoder.save(compiled_path(name))
+    return encoder
+
+
+@timed('model.load_encoder')
+def load_encoder(name: str) -> CountEncoder:
+    """
+    Summary
+        The load_encoder function returns the CountEncoder for the JSON file with the count-encoding maps. The
+        compiled name + '.npz' file is used if it was built from the current content of the JSON file, otherwise the
+        encoder is built from the JSON file.
+
+    Inputs
+        name (str): The name of the JSON file with the count-encoding maps.
+
+    Outputs
+        CountEncoder: The encoder.
+    """
+    if not isinstance(name, str):
+        raise ValueError('Название должно быть строкой!')
+
+    if not os.path.exists(os.path.join(name + '.json')):
+        raise FileNotFoundError(f'Файла с названием {name} не существует!')
+
+    source = file_hash(os.path.join(name + '.json'))
+    if os.path.exists(compiled_path(name)):
+        try:
+            encoder = CountEncoder.load(compiled_path(name))
+            if encoder.source == source and encoder.columns == CATEGORY:
+                return encoder
+        except (OSError, ValueError, KeyError):
+            pass
+
+    return CountEncoder.from_info(open_data(name)['data'], CATEGORY, source)
+
+
 def import_data(data: list, name: str) -> np.array:
     """
     Summary
@@ -124,6 +254,36 @@ def import_data(data: list, name: str) -> np.array:
     except Exception as e:
         raise Exception(f'Ошибка: {e}')
 
+    return encode_data(data, info)
+
+
+@timed('model.encode_data')
+def encode_data(data: list, info: list) -> np.array:
+    """
+    Summary
+        The encode_data function does the work of import_data on an already loaded list of count-encoding maps, so
+        callers that keep data.json in memory (see PricePredictor) do not have to read it again for every car.
+
+    Inputs
+        data (list): A list containing 10 elements representing the data for a car, in the same order as for
+            import_data.
+        info (list): The 'data' section of data.json: six dicts mapping a category value to its count, in the order
+            transmission, name, model, fuel, drive unit, location.
+
+    Flow
+        1. Check that data is a list of 10 elements.
+        2. Check that categorical and numerical data are strings.
+        3. Replace every categorical value with its count, unseen values get the count '1'.
+
+    Outputs
+        A numpy array containing the data for a car with categorical values replaced by their counts.
+    """
+    if not isinstance(data, list):
+        raise ValueError('Данные должны быть переданы в виде списка!')
+
+    if len(data) != 10:
+        raise ImportError('Список должен содержать 10 элементов!')
+
     name, model, year, engine_capacity, horse_power, fuel, transmission, drive_unit, mileage, location = data
 
     category = [transmission, name, model, fuel, drive_unit, location]
@@ -164,42 +324,231 @@ def prepare_df(data: np.array, name: str) -> pd.DataFrame:
 
     Flow
         1. Call the import_data function with the data and name parameters to retrieve a numpy array of the data.
-        2. Create a transposed DataFrame te from the numpy array.
-        3. Rename the columns of te to match the desired column names.
-        4. Define two lists int_64 and float_32 to specify the columns that need to be converted to the appropriate data
-            types.
-        5. Iterate over the columns in int_64 and float_32 and convert them to np.int64 and np.float32 respectively.
-        6. Return the prepared DataFrame te.
+        2. Call the to_frame function to create a one-row DataFrame with the model column names and convert the
+            columns to np.int64 and np.float32.
+        3. Return the prepared DataFrame.
 
     Outputs
         A pandas DataFrame containing the prepared data for a car.
 
     """
     df = import_data(data=data, name=name)
-    te = pd.DataFrame(df).T
-    te.rename(columns={
-        0: 'name',
-        1: 'model',
-        2: 'year',
-        3: 'engine_capacity',
-        4: 'horse_power',
-        5: 'fuel',
-        6: 'transmission',
-        7: 'drive_unit',
-        8: 'mileage',
-        9: 'location'
-    }, inplace=True)
-    int_64 = ['name', 'model', 'year', 'fuel', 'transmission', 'drive_unit', 'location']
-    float_32 = ['engine_capacity', 'horse_power', 'mileage']
-    for i in int_64:
+    return to_frame(df)
+
+
+@timed('model.to_frame')
+def to_frame(data: np.array) -> pd.DataFrame:
+    """
+    Summary
+        The to_frame function turns an encoded car (the output of import_data or encode_data) into the one-row
+        DataFrame expected by the model, with the column names and data types used during training.
+
+    Inputs
+        data (np.array): An encoded array of 10 elements.
+
+    Outputs
+        A pandas DataFrame containing the prepared data for a car.
+    """
+    te = pd.DataFrame(data).T
+    te.rename(columns=dict(enumerate(COLUMNS)), inplace=True)
+    for i in INT_64:
         te[i] = te[i].astype(np.int64)
-    for i in float_32:
+    for i in FLOAT_32:
         te[i] = te[i].astype(np.float32)
 
     return te
 
 
-def predict(data: np.array, name: str, model_name: str) -> np.array:
+def _batch_frame(data) -> tuple:
+    if isinstance(data, pd.DataFrame):
+        missing = [c for c in COLUMNS if c not in data.columns]
+        if missing:
+            raise ValueError(f'В данных нет столбцов: {", ".join(missing)}!')
+        return data[COLUMNS].reset_index(drop=True), {}
+
+    if isinstance(data, np.ndarray):
+        if data.ndim != 2 or data.shape[1] != 10:
+            raise ImportError('Массив должен иметь размер (N, 10)!')
+        return pd.DataFrame(data, columns=COLUMNS, dtype=object), {}
+
+    if not isinstance(data, list):
+        raise ValueError('Данные должны быть переданы в виде DataFrame, списка записей или двумерного массива!')
+
+    rows = []
+    errors = {}
+    for i, row in enumerate(data):
+        if isinstance(row, dict):
+            row = [row.get(c) for c in COLUMNS]
+        elif not isinstance(row, (list, tuple)) or len(row) != 10:
+            errors[i] = 'Список должен содержать 10 элементов!'
+            row = [None] * 10
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=COLUMNS, dtype=object), errors
+
+
+def _is_string(x) -> bool:
+    return type(x) is str or isinstance(x, str)
+
+
+def _is_number(x) -> bool:
+    return type(x) in _NUMERIC_TYPES or \
+        isinstance(x, (str, int, float, np.number)) and not isinstance(x, (bool, np.bool_))
+
+
+def _check(col: pd.Series, test) -> np.array:
+    """A bool array of test applied to every value of the column; the exact type is tried first, as it is cheap."""
+    return np.fromiter(map(test, col.to_numpy()), dtype=bool, count=len(col))
+
+
+def _numeric_input(col: pd.Series) -> np.array:
+    """A bool array, False for the values of a numerical column which are not a string, a number or None, bools too."""
+    if pd.api.types.is_bool_dtype(col.dtype):
+        return np.zeros(len(col), dtype=bool)
+    if col.dtype != object:
+        return np.ones(len(col), dtype=bool)
+    return _check(col, _is_number)
+
+
+def row_error(row) -> str:
+    """
+    The message encode_batch rejects a car with if it has the wrong shape or a value of the wrong type, None if the
+    types are right. Checks one car in Python, without the encoder; the values themselves are checked by encode_batch.
+    """
+    if isinstance(row, dict):
+        row = [row.get(c) for c in COLUMNS]
+    elif not isinstance(row, (list, tuple)) or len(row) != 10:
+        return 'Список должен содержать 10 элементов!'
+
+    for c, x in zip(COLUMNS, row):
+        if c in CATEGORY:
+            if not _is_string(x):
+                return 'Категориальные данные должны перередаваться в виде строки!'
+        elif x is not None and not _is_number(x):
+            return 'Числовые данные должны перередаваться в виде числа или строки с числом!'
+    return None
+
+
+@timed('model.encode_batch')
+def encode_batch(data, encoder: CountEncoder) -> tuple:
+    """
+    Summary
+        The encode_batch function is the batch version of encode_data. It encodes a whole table of cars in one pass
+        per column: categorical columns are mapped to their counts by the CountEncoder (unseen values get the count
+        1), numerical columns are converted with pd.to_numeric. Bad rows are reported instead of raising.
+
+    Inputs
+        data (pd.DataFrame | list | np.array): The cars to encode. A DataFrame with the model columns, a list of
+            10-element lists or of dicts keyed by column name, or a 2-D array with 10 columns in the order of
+            import_data. Numerical values may be strings or numbers.
+        encoder (CountEncoder): The compiled count-encoding maps, see load_encoder.
+
+    Flow
+        1. Build a DataFrame with the model columns from the input.
+        2. For every categorical column mark the rows which are not strings and map the rest to counts.
+        3. For every numerical column mark the rows which can not be converted to a number. Empty values are passed
+            to the model as missing, year must be an integer.
+        4. Drop the marked rows and convert the columns to np.int64 and np.float32.
+
+    Outputs
+        tuple: A DataFrame of the valid encoded rows, indexed by their position in the input, and a dict mapping the
+            position of every rejected row to the error message.
+    """
+    frame, errors = _batch_frame(data)
+    bad = np.zeros(len(frame), dtype=bool)
+    bad[list(errors)] = True
+    out = {}
+
+    for c in CATEGORY:
+        col = frame[c]
+        is_str = _check(col, _is_string)
+        for i in np.flatnonzero(~is_str & ~bad):
+            errors[int(i)] = 'Категориальные данные должны перередаваться в виде строки!'
+        bad |= ~is_str
+        # The rejected values may be unhashable, e.g. lists: they are left out of the lookup.
+        out[c] = encoder.encode(c, col if is_str.all() else col.where(is_str, ''))
+
+    for c in ['year'] + FLOAT_32:
+        col = frame[c]
+        scalar = _numeric_input(col)
+        values = pd.to_numeric(col if scalar.all() else col.where(scalar, None), errors='coerce')
+        if c == 'year':
+            wrong = (values.isna() | (values % 1 != 0)).to_numpy() | ~scalar
+        else:
+            wrong = (values.isna() & col.notna()).to_numpy() | ~scalar
+        for i in np.flatnonzero(wrong & ~bad):
+            errors[int(i)] = 'Числовые данные должны перередаваться в виде числа или строки с числом!'
+        bad |= wrong
+        out[c] = values
+
+    df = pd.DataFrame(out)[COLUMNS][~bad]
+    df = df.astype({**{i: np.int64 for i in INT_64}, **{i: np.float32 for i in FLOAT_32}})
+
+    return df, dict(sorted(errors.items()))
+
+
+def encode_row(data: list, encoder: CountEncoder) -> pd.DataFrame:
+    """
+    Summary
+        The encode_row function prepares a single car the same way as prepare_df, with the checks of encode_data, but
+        uses a CountEncoder instead of the dicts from data.json. The categorical values are looked up one by one and
+        the one-row frame is built directly; encode_batch is only called for numbers which are not plain decimals.
+
+    Inputs
+        data (list): A list containing 10 elements representing the data for a car, see import_data.
+        encoder (CountEncoder): The compiled count-encoding maps, see load_encoder.
+
+    Outputs
+        A one-row pandas DataFrame containing the prepared data for a car.
+    """
+    if not isinstance(data, list):
+        raise ValueError('Данные должны быть переданы в виде списка!')
+
+    if len(data) != 10:
+        raise ImportError('Список должен содержать 10 элементов!')
+
+    for c, x in zip(COLUMNS, data):
+        if not isinstance(x, str):
+            if c in CATEGORY:
+                raise ValueError('Категориальные данные должны перередаваться в виде строки!')
+            raise ValueError('Числовые данные должны перередаваться в виде в виде строки!')
+
+    row = {}
+    for c, x in zip(COLUMNS, data):
+        if c in CATEGORY:
+            row[c] = encoder.count(c, x)
+        elif (x.isascii() and x.isdigit()) if c == 'year' else _DECIMAL.fullmatch(x):
+            row[c] = int(x) if c == 'year' else float(x)
+        else:
+            # Anything but plain digits goes through pd.to_numeric in encode_batch, which decides what is a number.
+            df, errors = encode_batch([data], encoder)
+            if errors:
+                raise ValueError(errors[0])
+            return df
+
+    return pd.DataFrame({c: np.array([row[c]], dtype=DTYPES[c]) for c in COLUMNS})
+
+
+def predict_batch(data, name: str, model_name: str, backend: str = 'xgboost') -> tuple:
+    """
+    Summary
+        The predict_batch function predicts the price of many cars with a single call of the model. See
+        PricePredictor.predict_batch.
+
+    Inputs
+        data (pd.DataFrame | list | np.array): The cars to price, see encode_batch.
+        name (str): The name of the file to be opened.
+        model_name (str): The name of the pre-trained machine learning model file to be loaded.
+        backend (str): See predict.
+
+    Outputs
+        tuple: An array of predicted values aligned with the input (NaN for rejected rows) and a dict mapping the
+            position of every rejected row to the error message.
+    """
+    return get_predictor(name, model_name, backend).predict_batch(data)
+
+
+def predict(data: np.array, name: str, model_name: str, backend: str = 'xgboost') -> np.array:
     """
     Summary
         The predict function takes in an array of data, a name, and a model name as inputs. It first prepares the data
@@ -214,16 +563,441 @@ def predict(data: np.array, name: str, model_name: str) -> np.array:
             location.
         name (str): The name of the file to be opened.
         model_name (str): The name of the pre-trained machine learning model file to be loaded.
+        backend (str): 'xgboost' to predict with the model itself, 'numpy' to predict with its trees compiled to NumPy
+            arrays (see model.tree_engine), which is faster for small batches.
 
     Flow
-        Call the prepare_df function with the data and name parameters to prepare the data as a pandas DataFrame.
-        Call the open_model function with the model_name parameter to load the pre-trained machine learning model.
+        Get the resident PricePredictor for the name and model_name files, it loads the model and data.json only
+        once per process and again when they change on disk.
+        Prepare the data as a pandas DataFrame the same way prepare_df does.
         Use the loaded model to make predictions on the prepared data.
         Return the predicted values as a numpy array.
 
     Outputs
         np.array: An array containing the predicted values for the given data.
     """
-    df = prepare_df(data, name)
-    model = open_model(model_name)
-    return model.predict(df)
+    return get_predictor(name, model_name, backend).predict(data)
+
+
+def predict_interval_batch(data, name: str, model_name: str, backend: str = 'xgboost') -> tuple:
+    """
+    Summary
+        The predict_interval_batch function predicts the price of many cars together with the low, median and high
+        quantiles of the price. See PricePredictor.predict_interval_batch.
+
+    Inputs
+        data (pd.DataFrame | list | np.array): The cars to price, see encode_batch.
+        name (str): The name of the file to be opened.
+        model_name (str): The name of the pre-trained machine learning model file to be loaded.
+        backend (str): See predict.
+
+    Outputs
+        tuple: A DataFrame with the columns price, low, median and high aligned with the input (NaN for rejected
+            rows) and a dict mapping the position of every rejected row to the error message.
+    """
+    return get_predictor(name, model_name, backend).predict_interval_batch(data)
+
+
+def predict_interval(data: list, name: str, model_name: str, backend: str = 'xgboost') -> dict:
+    """
+    Summary
+        The predict_interval function predicts the price of a car with the range it most likely falls in.
+
+    Inputs
+        data (list): A list containing 10 elements representing the data for a car, see predict.
+        name (str): The name of the file to be opened.
+        model_name (str): The name of the pre-trained machine learning model file to be loaded.
+        backend (str): See predict.
+
+    Outputs
+        dict: price, the prediction of predict, and low, median and high, the QUANTILES of the price, in thousands of
+            rubles. About 80% of the cars are priced between low and high.
+    """
+    return get_predictor(name, model_name, backend).predict_interval(data)
+
+
+def explanation(data: list, contributions: np.array) -> pd.DataFrame:
+    """The contributions of one car next to its input values: feature, value and contribution, bias last."""
+    return pd.DataFrame({'feature': COLUMNS + ['bias'],
+                         'value': list(data) + [None],
+                         'contribution': np.asarray(contributions, dtype=np.float32)})
+
+
+def explain_batch(data, name: str, model_name: str, backend: str = 'xgboost', method: str = 'auto') -> tuple:
+    """
+    Summary
+        The explain_batch function splits the predicted price of many cars into the contributions of their features
+        with a single call of the booster. See PricePredictor.explain_batch.
+
+    Inputs
+        data (pd.DataFrame | list | np.array): The cars to explain, see encode_batch.
+        name (str): The name of the file to be opened.
+        model_name (str): The name of the pre-trained machine learning model file to be loaded.
+        backend (str): See predict.
+        method (str): See PricePredictor.explain_batch.
+
+    Outputs
+        tuple: A DataFrame of contributions aligned with the input (NaN for rejected rows) and a dict mapping the
+            position of every rejected row to the error message.
+    """
+    return get_predictor(name, model_name, backend).explain_batch(data, method)
+
+
+def explain(data: list, name: str, model_name: str, backend: str = 'xgboost', method: str = 'auto') -> pd.DataFrame:
+    """
+    Summary
+        The explain function shows how much each input of a car added to or subtracted from its predicted price.
+
+    Inputs
+        data (list): A list containing 10 elements representing the data for a car, see predict.
+        name (str): The name of the file to be opened.
+        model_name (str): The name of the pre-trained machine learning model file to be loaded.
+        backend (str): See predict.
+        method (str): See PricePredictor.explain_batch.
+
+    Outputs
+        pd.DataFrame: The columns feature, value (the input as given, not its count) and contribution, in thousands
+            of rubles. The last row is the bias, the price of an average car; the contributions add up to the price.
+    """
+    return get_predictor(name, model_name, backend).explain(data, method)
+
+
+class _State(NamedTuple):
+    """The files a PricePredictor serves from, loaded together and replaced together."""
+    encoder: CountEncoder
+    model: object
+    quantiles: dict
+    margins: dict
+    version: str
+    stamp: tuple
+
+
+class PricePredictor:
+    """
+    Summary
+        The PricePredictor class keeps the pre-trained model and the count-encoding maps from data.json in memory, so
+        a prediction costs only the encoding of the car and the model call. It is safe to share between threads and
+        reloads both files when they change on disk.
+
+    Inputs
+        name (str): The name of the JSON file with the count-encoding maps.
+        model_name (str): The name of the pre-trained machine learning model file to be loaded.
+        check_interval (float): How often, in seconds, the files are checked for changes. 0 checks on every call.
+        backend (str): 'xgboost' or 'numpy', see predict.
+        cache (PredictionCache): The cache of predicted prices keyed on the encoded cars, None to always call the
+            model. With a cache the contributions of explain are cached as well, in a ContributionCache of the same
+            size.
+
+    Flow
+        1. Load the model and the compiled data.json maps once and remember the modification time and size of both files.
+        2. Before a prediction, at most once per check_interval, compare the files on disk with the remembered ones
+            and reload both if any of them changed. The encoder, the models and the version of the files are replaced
+            in one assignment, and a request uses the ones it started with, so it never mixes two versions. A reload
+            also moves the cache to the new version; prices computed with an older version are not cached.
+        3. Encode the car with the in-memory maps, take the price from the cache if the encoded car is there, and
+            make the prediction with the in-memory model otherwise.
+        4. If the quantile models of the model were exported (see open_quantiles), they are loaded and reloaded with
+            it, and predict_interval scores the encoded cars with the model and all of them concurrently.
+
+    Outputs
+        np.array: predict returns an array containing the predicted values for the given data.
+    """
+
+    max_exact_rows = 16
+
+    def __init__(self, name: str = 'data', model_name: str = 'car_model', check_interval: float = 1.0,
+                 backend: str = 'xgboost', cache: PredictionCache = None):
+        if backend not in BACKENDS:
+            raise ValueError(f'Неизвестный backend {backend}, доступны: {", ".join(BACKENDS)}!')
+
+        self.name = name
+        self.model_name = model_name
+        self.check_interval = check_interval
+        self.backend = backend
+        self.cache = cache
+        self.explain_cache = ContributionCache(cache.maxsize, cache.ttl) if cache is not None else None
+        self._lock = threading.Lock()
+        self._state = None
+        self._pool = None
+        self._checked = 0.0
+        self.reload()
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    @property
+    def has_interval(self) -> bool:
+        return self._state is not None and bool(self._state.quantiles)
+
+    def _files(self) -> list:
+        files = [os.path.join(self.name + '.json')] + model_files(self.model_name)
+        for label in QUANTILES:
+            if os.path.exists(manifest_path(quantile_name(self.model_name, label))):
+                files += model_files(quantile_name(self.model_name, label))
+        return files
+
+    def _file_stamp(self) -> tuple:
+        return tuple((s.st_mtime_ns, s.st_size) for s in map(os.stat, self._files()))
+
+    def reload(self) -> None:
+        with self._lock:
+            self._reload()
+
+    def _reload(self) -> None:
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            stamp = None
+        encoder = load_encoder(self.name)
+        model = open_model(self.model_name, self.name)
+        if self.backend == 'numpy':
+            model = _NumpyModel(model)
+        try:
+            quantiles = open_quantiles(self.model_name, self.name)
+        except ValueError:
+            logger.warning('Квантильные модели %s не подходят к модели, диапазон цены недоступен', self.model_name,
+                           exc_info=True)
+            quantiles = {}
+        threads = max(1, (os.cpu_count() or 1) // (len(quantiles) + 1))
+        for quantile in quantiles.values():
+            quantile.set_params(n_jobs=threads)
+        margins = {label: float(m.get_booster().attr(MARGIN_ATTR) or 0.0) for label, m in quantiles.items()}
+        self._state = _State(encoder, model, quantiles, margins, files_version(self._files()), stamp)
+        if self.cache is not None:
+            self.cache.bind(self._state.version)
+            self.explain_cache.bind(self._state.version)
+        self._checked = time.monotonic()
+
+    def refresh(self) -> bool:
+        """Reload the model and data.json if they changed on disk. Returns True if they were reloaded."""
+        if time.monotonic() - self._checked < self.check_interval:
+            return False
+
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                stamp = self._file_stamp()
+            except OSError:
+                return False
+
+            if stamp == self._state.stamp:
+                return False
+
+            try:
+                self._reload()
+            except Exception:
+                logger.warning('Не удалось перезагрузить модель %s, используется прежняя', self.model_name,
+                               exc_info=True)
+                return False
+            return True
+
+    def predict(self, data: list) -> np.array:
+        with span('predict.refresh'):
+            self.refresh()
+        state = self._state
+        with span('predict.encode'):
+            df = encode_row(data, state.encoder)
+        return self._score(state, df)
+
+    def predict_batch(self, data) -> tuple:
+        """
+        Encode all cars at once with encode_batch and call the model once for the valid rows. Returns an array of
+        prices aligned with the input, NaN for rejected rows, and a dict with the error message of every rejected row.
+        """
+        with span('predict.refresh'):
+            self.refresh()
+        state = self._state
+        with span('predict.encode'):
+            df, errors = encode_batch(data, state.encoder)
+        prices = np.full(len(df) + len(errors), np.nan, dtype=np.float32)
+        if len(df):
+            prices[df.index.to_numpy()] = self._score(state, df.reset_index(drop=True))
+        return prices, errors
+
+    def _score(self, state: _State, df: pd.DataFrame) -> np.array:
+        """Predict the encoded cars, taking the prices of the cached ones from the cache of the version of state."""
+        if self.cache is None:
+            with span('predict.model'):
+                return state.model.predict(df)
+
+        with span('predict.cache'):
+            keys = row_keys(df)
+            found = self.cache.get_many(keys, state.version)
+        if len(found) == len(keys):
+            return np.array([found[i] for i in range(len(keys))], dtype=np.float32)
+
+        prices = np.empty(len(keys), dtype=np.float32)
+        missing = [i for i in range(len(keys)) if i not in found]
+        if found:
+            prices[list(found)] = list(found.values())
+        with span('predict.model'):
+            prices[missing] = state.model.predict(df.iloc[missing].reset_index(drop=True))
+        self.cache.put_many([keys[i] for i in missing], prices[missing], state.version)
+        return prices
+
+    def predict_interval(self, data: list) -> dict:
+        """The price of one car with its low, median and high quantiles, see predict_interval."""
+        with span('predict.refresh'):
+            self.refresh()
+        state = self._state
+        with span('predict.encode'):
+            df = encode_row(data, state.encoder)
+        return {c: float(v[0]) for c, v in self._score_interval(state, df).items()}
+
+    def predict_interval_batch(self, data) -> tuple:
+        """
+        Encode all cars once with encode_batch and score the encoded batch with the model and the quantile models
+        concurrently, in a thread pool: XGBoost releases the GIL while predicting, so the models run on separate
+        cores. Returns a DataFrame with the columns price, low, median and high aligned with the input, NaN for
+        rejected rows, and a dict with the error message of every rejected row.
+        """
+        with span('predict.refresh'):
+            self.refresh()
+        state = self._state
+        with span('predict.encode'):
+            df, errors = encode_batch(data, state.encoder)
+        result = np.full((len(df) + len(errors), len(QUANTILES) + 1), np.nan, dtype=np.float32)
+        if len(df):
+            scores = self._score_interval(state, df.reset_index(drop=True))
+            result[df.index.to_numpy()] = np.column_stack([scores[c] for c in ['price'] + list(QUANTILES)])
+        return pd.DataFrame(result, columns=['price'] + list(QUANTILES)), errors
+
+    def _score_interval(self, state: _State, df: pd.DataFrame) -> dict:
+        """The price and the quantiles of the encoded cars, the models of state scored concurrently."""
+        quantiles, margins = state.quantiles, state.margins
+        if not quantiles:
+            raise ValueError(f'Для модели {self.model_name} нет квантильных моделей!')
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(len(QUANTILES) + 1, thread_name_prefix='quantiles')
+        with span('predict.quantiles'):
+            price = self._pool.submit(self._score, state, df)
+            futures = {label: self._pool.submit(m.predict, df) for label, m in quantiles.items()}
+            scores = {label: f.result() for label, f in futures.items()}
+
+        # The low and high models are widened by their conformal margin and the quantiles sorted, so that
+        # low <= median <= high even where the separately trained models cross.
+        bounds = np.sort(np.column_stack([scores['low'] - margins.get('low', 0.0), scores['median'],
+                                          scores['high'] + margins.get('high', 0.0)]), axis=1)
+        return {'price': price.result(), 'low': bounds[:, 0], 'median': bounds[:, 1], 'high': bounds[:, 2]}
+
+    def explain(self, data: list, method: str = 'auto') -> pd.DataFrame:
+        """The contributions of the inputs of one car to its price, see explain."""
+        with span('predict.refresh'):
+            self.refresh()
+        state = self._state
+        with span('predict.encode'):
+            df = encode_row(data, state.encoder)
+        return explanation(data, self._contributions(state, df, method)[0])
+
+    def explain_batch(self, data, method: str = 'auto') -> tuple:
+        """
+        Encode all cars at once with encode_batch and split their prices into per-feature contributions with one
+        booster call (pred_contribs) for the cars not in the cache. Identical cars are explained once.
+
+        method 'exact' computes TreeSHAP values, 'approx' the faster path attributions of XGBoost (approx_contribs),
+        which cost a small multiple of a prediction while TreeSHAP costs about a millisecond per car. 'auto' is exact
+        for up to max_exact_rows distinct cars and approximate above. Both add up to the predicted price.
+
+        Returns a DataFrame with the COLUMNS and bias, in thousands of rubles, aligned with the input, NaN for
+        rejected rows, and a dict with the error message of every rejected row.
+        """
+        with span('predict.refresh'):
+            self.refresh()
+        state = self._state
+        with span('predict.encode'):
+            df, errors = encode_batch(data, state.encoder)
+        contributions = np.full((len(df) + len(errors), len(COLUMNS) + 1), np.nan, dtype=np.float32)
+        if len(df):
+            contributions[df.index.to_numpy()] = self._contributions(state, df.reset_index(drop=True), method)
+        return pd.DataFrame(contributions, columns=COLUMNS + ['bias']), errors
+
+    def _contributions(self, state: _State, df: pd.DataFrame, method: str) -> np.array:
+        """The contributions of the encoded cars, one booster call for the distinct ones not in the cache."""
+        if method not in EXPLAIN_METHODS:
+            raise ValueError(f'Неизвестный метод {method}, доступны: {", ".join(EXPLAIN_METHODS)}!')
+
+        keys = row_keys(df)
+        first = {}
+        for i, key in enumerate(keys):
+            first.setdefault(key, i)
+        exact = method == 'exact' or (method == 'auto' and len(first) <= self.max_exact_rows)
+        tag = b'exact:' if exact else b'approx:'
+        unique = [tag + key for key in first]
+
+        found = {}
+        if self.explain_cache is not None:
+            with span('predict.cache'):
+                found = self.explain_cache.get_many(unique, state.version)
+
+        rows = list(first.values())
+        values = np.empty((len(rows), len(COLUMNS) + 1), dtype=np.float32)
+        for i, row in found.items():
+            values[i] = row
+        missing = [i for i in range(len(rows)) if i not in found]
+        if missing:
+            with span('predict.explain'):
+                values[missing] = state.model.get_booster().predict(DMatrix(df.iloc[[rows[i] for i in missing]]),
+                                                                    pred_contribs=True, approx_contribs=not exact)
+            if self.explain_cache is not None:
+                self.explain_cache.put_many([unique[i] for i in missing], values[missing], state.version)
+
+        position = {key: i for i, key in enumerate(first)}
+        return values[[position[key] for key in keys]]
+
+
+class _NumpyModel:
+    """
+    The model with predict served by its trees compiled to NumPy arrays. The engine wins on small batches, where
+    XGBoost spends its time building the DMatrix; batches above max_rows go to XGBoost, which is faster there.
+    """
+
+    max_rows = 256
+
+    def __init__(self, model: XGBRegressor):
+        self.model = model
+        self.engine = TreeEnsemble.from_booster(model)
+
+    def get_booster(self):
+        return self.model.get_booster()
+
+    def predict(self, df: pd.DataFrame) -> np.array:
+        if len(df) > self.max_rows:
+            return self.model.predict(df)
+        return self.engine.predict(df[COLUMNS])
+
+
+_predictors = {}
+_predictors_lock = threading.Lock()
+
+
+def get_predictor(name: str = 'data', model_name: str = 'car_model', backend: str = 'xgboost',
+                  cache: PredictionCache = None) -> PricePredictor:
+    """
+    Summary
+        The get_predictor function returns the PricePredictor shared by the whole process for the given pair of files,
+        creating it on the first call.
+
+    Inputs
+        name (str): The name of the JSON file with the count-encoding maps.
+        model_name (str): The name of the pre-trained machine learning model file.
+        backend (str): 'xgboost' or 'numpy', see predict.
+        cache (PredictionCache): The cache of the predictor when it is created, an in-memory LRU cache of 10 000
+            cars by default.
+
+    Outputs
+        PricePredictor: The resident predictor for these files and backend.
+    """
+    if not isinstance(name, str) or not isinstance(model_name, str):
+        raise ValueError('Название должно быть строкой!')
+
+    key = (os.path.abspath(name), os.path.abspath(model_name), backend)
+    with _predictors_lock:
+        predictor = _predictors.get(key)
+        if predictor is None:
+            predictor = PricePredictor(name, model_name, backend=backend, cache=cache or PredictionCache())
+            _predictors[key] = predictor
+
+    return predictor
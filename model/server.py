@@ -0,0 +1,463 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+import numpy as np
+
+from data_prep.comparables import ComparablesIndex, load_comparables
+from model.cache import PredictionCache
+from model.drift import DriftMonitor, load_reference
+from model.regression_model import get_predictor, load_encoder, row_error, PricePredictor
+from telemetry import spans
+from telemetry.request_log import RequestLog
+
+logger = logging.getLogger(__name__)
+
+
+class Stats:
+    """Request, batch and latency counters of the server, with the latencies of the last window requests."""
+
+    def __init__(self, window: int = 10_000):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self._latency = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def request(self, rows: int, errors: int, latency: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+            self.errors += errors
+            self._latency.append(latency)
+
+    def batch(self, rows: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batch_rows += rows
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latency = np.array(self._latency) * 1000 if self._latency else np.zeros(1)
+            uptime = time.monotonic() - self.started
+            return {
+                'uptime_s': round(uptime, 3),
+                'requests': self.requests,
+                'rows': self.rows,
+                'errors': self.errors,
+                'batches': self.batches,
+                'mean_batch_size': round(self.batch_rows / self.batches, 2) if self.batches else 0.0,
+                'rows_per_s': round(self.rows / uptime, 2) if uptime else 0.0,
+                'latency_ms': {'p50': round(float(np.percentile(latency, 50)), 3),
+                               'p99': round(float(np.percentile(latency, 99)), 3),
+                               'max': round(float(latency.max()), 3)},
+            }
+
+
+class MicroBatcher:
+    """
+    Summary
+        The MicroBatcher class coalesces the cars of concurrent requests into batches for one predict_batch call. A
+        worker thread takes the first waiting car, then keeps collecting until max_batch cars are collected or
+        max_wait_ms have passed, and calls the model once for all of them. If that call fails, the cars of the batch
+        are scored one by one, so a car that breaks the model fails only its own request.
+
+    Inputs
+        predictor (PricePredictor): The resident predictor.
+        max_batch (int): The largest number of cars in a batch.
+        max_wait_ms (float): How long the first car of a batch waits for others.
+        stats (Stats): The counters to update.
+
+    Outputs
+        Future: submit returns a future of the price of the car. It raises ValueError for a car the model can not
+            price.
+    """
+
+    def __init__(self, predictor: PricePredictor, max_batch: int = 64, max_wait_ms: float = 2.0,
+                 stats: Stats = None):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats or Stats()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit(self, data) -> Future:
+        future = Future()
+        self._queue.put((data, future))
+        return future
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self) -> list:
+        item = self._queue.get()
+        if item is None:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            try:
+                prices, errors = self.predictor.predict_batch([data for data, _ in batch])
+            except Exception:
+                logger.exception('Ошибка модели, машины пакета оцениваются по одной')
+                for item in batch:
+                    self._score_one(item)
+                continue
+
+            self.stats.batch(len(batch))
+            for i, (_, future) in enumerate(batch):
+                if i in errors:
+                    future.set_exception(ValueError(errors[i]))
+                else:
+                    future.set_result(float(prices[i]))
+
+    def _score_one(self, item: tuple) -> None:
+        data, future = item
+        try:
+            prices, errors = self.predictor.predict_batch([data])
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        self.stats.batch(1)
+        if errors:
+            future.set_exception(ValueError(errors[0]))
+        else:
+            future.set_result(float(prices[0]))
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class Handler(BaseHTTPRequestHandler):
+    batcher = None
+    timeout_s = 30.0
+    registry = None
+    profile_dir = None
+    comparables = None
+    request_log = None
+    monitor = None
+
+    def _send(self, status: int, body, content_type: str = 'application/json; charset=utf-8') -> None:
+        data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        elif self.path == '/ready':
+            ready = self.batcher.alive and self.batcher.predictor.ready
+            self._send(200 if ready else 503, {'ready': ready})
+        elif self.path == '/metrics':
+            metrics = self.batcher.stats.snapshot()
+            cache = self.batcher.predictor.cache
+            if cache is not None:
+                metrics['cache'] = cache.stats()
+                metrics['explain_cache'] = self.batcher.predictor.explain_cache.stats()
+            if self.registry is not None:
+                metrics['spans'] = self.registry.snapshot()
+            if self.request_log is not None:
+                metrics['request_log'] = self.request_log.stats()
+            self._send(200, metrics)
+        elif self.path == '/drift' and self.monitor is not None:
+            self._send(200, self.monitor.report())
+        elif self.path == '/metrics/prometheus' and self.registry is not None:
+            self._send(200, self.registry.prometheus(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, {'error': 'Не найдено'})
+
+    def do_POST(self):
+        path, _, query = self.path.partition('?')
+        if path not in ('/predict', '/explain'):
+            self._send(404, {'error': 'Не найдено'})
+            return
+        profile = self.profile_dir is not None and 'profile=1' in query.split('&')
+        try:
+            k = int(parse_qs(query).get('comparables', ['0'])[0]) if self.comparables is not None else 0
+        except ValueError:
+            self._send(400, {'error': 'Параметр comparables должен быть целым числом'})
+            return
+
+        start = time.perf_counter()
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            single = 'data' in body
+            rows = [body['data']] if single else body['records']
+            if not isinstance(rows, list):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            self._send(400, {'error': 'Ожидается JSON вида {"data": [...]} или {"records": [[...], ...]}'})
+            return
+
+        if path == '/explain':
+            self._explain(rows, single)
+            return
+        if 'interval=1' in query.split('&'):
+            self._interval(rows, single, k)
+            return
+        if profile:
+            self._profiled(rows, single, k)
+            return
+
+        # The cars of the wrong shape or types are rejected here and never join a batch of other requests.
+        invalid = {i: row_error(row) for i, row in enumerate(rows)}
+        futures = [None if invalid[i] else self.batcher.submit(row) for i, row in enumerate(rows)]
+        prices, errors = [], {}
+        try:
+            for i, future in enumerate(futures):
+                if future is None:
+                    prices.append(None)
+                    errors[i] = invalid[i]
+                    continue
+                try:
+                    prices.append(future.result(self.timeout_s))
+                except ValueError as e:
+                    prices.append(None)
+                    errors[i] = str(e)
+        except Exception as e:
+            self._send(500, {'error': f'Ошибка: {e}'})
+            return
+        self.batcher.stats.request(len(rows), len(errors), time.perf_counter() - start)
+        if self.request_log is not None:
+            self.request_log.log(rows, prices, errors)
+
+        if single:
+            if errors:
+                self._send(422, {'error': errors[0]})
+            else:
+                self._send(200, self._with_comparables({'price': prices[0]}, rows, single, k))
+        else:
+            self._send(200, self._with_comparables({'prices': prices, 'errors': errors}, rows, single, k))
+
+    def _with_comparables(self, body: dict, rows: list, single: bool, k: int) -> dict:
+        """Add the k most similar listings of every car to the response body, see ComparablesIndex.query."""
+        if k <= 0:
+            return body
+        found = self.comparables.query(rows, k)
+        listings = [[] for _ in rows]
+        for i, listing in zip(found.pop('query'), found.drop(columns='rank').to_dict('records')):
+            listings[i].append(listing)
+        body['comparables'] = listings[0] if single else listings
+        return body
+
+    def _interval(self, rows: list, single: bool, k: int) -> None:
+        """Score the request with the model and its quantile models in this thread, outside the batcher."""
+        try:
+            scores, errors = self.batcher.predictor.predict_interval_batch(rows)
+        except ValueError as e:
+            self._send(501, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send(500, {'error': f'Ошибка: {e}'})
+            return
+        if self.request_log is not None:
+            self.request_log.log(rows, scores['price'].tolist(), errors)
+
+        columns = {c: [None if i in errors else float(v) for i, v in enumerate(scores[c])] for c in scores.columns}
+        if single:
+            if errors:
+                self._send(422, {'error': errors[0]})
+            else:
+                self._send(200, self._with_comparables({c: v[0] for c, v in columns.items()}, rows, single, k))
+        else:
+            body = {'prices': columns.pop('price'), **columns, 'errors': errors}
+            self._send(200, self._with_comparables(body, rows, single, k))
+
+    def _explain(self, rows: list, single: bool) -> None:
+        """Split the prices of the request into per-feature contributions in this thread, with one booster call."""
+        try:
+            contributions, errors = self.batcher.predictor.explain_batch(rows)
+        except Exception as e:
+            self._send(500, {'error': f'Ошибка: {e}'})
+            return
+
+        contributions = [None if i in errors else {c: float(v) for c, v in row.items()}
+                         for i, row in enumerate(contributions.to_dict('records'))]
+        if single:
+            if errors:
+                self._send(422, {'error': errors[0]})
+            else:
+                self._send(200, {'price': sum(contributions[0].values()), 'contributions': contributions[0]})
+        else:
+            self._send(200, {'contributions': contributions, 'errors': errors})
+
+    def _profiled(self, rows: list, single: bool, k: int = 0) -> None:
+        """Score the request in this thread under cProfile, outside the batcher, and save the profile."""
+        path = os.path.join(self.profile_dir, f'predict-{time.strftime("%Y%m%d-%H%M%S")}-{threading.get_ident()}.prof')
+        try:
+            with spans.profile(path):
+                prices, errors = self.batcher.predictor.predict_batch(rows)
+        except Exception as e:
+            self._send(500, {'error': f'Ошибка: {e}'})
+            return
+        if self.request_log is not None:
+            self.request_log.log(rows, prices.tolist(), errors)
+
+        prices = [None if i in errors else float(p) for i, p in enumerate(prices)]
+        if single:
+            body = {'error': errors[0]} if errors else self._with_comparables({'price': prices[0]}, rows, single, k)
+        else:
+            body = self._with_comparables({'prices': prices, 'errors': errors}, rows, single, k)
+        body['profile'] = path
+        self._send(422 if single and errors else 200, body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8000, name: str = 'data', model_name: str = 'car_model',
+                max_batch: int = 64, max_wait_ms: float = 2.0, cache: PredictionCache = None,
+                registry: spans.HistogramRegistry = None, profile_dir: str = None,
+                comparables: ComparablesIndex = None, request_log: RequestLog = None,
+                monitor: DriftMonitor = None) -> InferenceServer:
+    """
+    Summary
+        The make_server function creates the local inference server: a threading HTTP server whose handlers put the
+        cars of every request into a shared MicroBatcher in front of the resident predictor.
+
+    Endpoints
+        POST /predict: {"data": [10 values]} -> {"price": float}, the same input and price as predict, or
+            {"records": [[10 values], ...]} -> {"prices": [...], "errors": {position: message}}.
+        GET /health: The process is up.
+        GET /ready: The model is loaded and the batcher runs, 503 otherwise.
+        POST /predict?profile=1: With profile_dir, score the request outside the batcher under cProfile and save the
+            profile there, the response names the file.
+        POST /predict?interval=1: The price with its low, median and high quantiles, {"price", "low", "median",
+            "high"} or {"prices", "low", "median", "high": [...], "errors"}, see PricePredictor.predict_interval_batch.
+            Scored in the handler thread, 501 if the model has no quantile models.
+        POST /explain: The same input as POST /predict -> {"price": float, "contributions": {column: float}} or
+            {"contributions": [{column: float} | null, ...], "errors": {...}}, the share of every input (and the
+            bias) in the price, see PricePredictor.explain_batch. Scored in the handler thread, outside the batcher.
+        POST /predict?comparables=K: With comparables, the response also lists the K most similar listings of every
+            car under "comparables", see data_prep.comparables.
+        GET /metrics: Request, batch, latency and prediction cache counters, and the stage timings with registry.
+        GET /drift: With monitor, the drift report of the recent requests against the training snapshot.
+        GET /metrics/prometheus: The stage timings in the Prometheus text format, with registry.
+
+    Inputs
+        host (str), port (int): The address to listen on, port 0 picks a free port.
+        name (str): The name of the JSON file with the count-encoding maps.
+        model_name (str): The name of the pre-trained machine learning model file.
+        max_batch (int), max_wait_ms (float): See MicroBatcher.
+        cache (PredictionCache): The prediction cache, see get_predictor.
+        registry (spans.HistogramRegistry): The histograms of the stage timings to report. Installing it, or a
+            PrometheusFileSink feeding it, with spans.add_sink is left to the caller.
+        profile_dir (str): The directory for the profiles of POST /predict?profile=1, None disables profiling.
+        comparables (ComparablesIndex): The comparable-listings index of POST /predict?comparables=K, see
+            data_prep.comparables.load_comparables.
+        request_log (RequestLog): The log every scored car of POST /predict is appended to, off the request thread.
+        monitor (DriftMonitor): The drift monitor of GET /drift. Feeding it, as a consumer of request_log, is left to
+            the caller.
+
+    Outputs
+        InferenceServer: The server, not started yet. Its batcher attribute is the MicroBatcher.
+    """
+    batcher = MicroBatcher(get_predictor(name, model_name, cache=cache), max_batch, max_wait_ms)
+    handler = type('BoundHandler', (Handler,), {'batcher': batcher, 'registry': registry, 'profile_dir': profile_dir,
+                                               'comparables': comparables, 'request_log': request_log,
+                                               'monitor': monitor})
+    server = InferenceServer((host, port), handler)
+    server.batcher = batcher
+    return server
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Local HTTP inference server of the car price model.')
+    args.add_argument('--host', default='127.0.0.1')
+    args.add_argument('--port', type=int, default=8000)
+    args.add_argument('--data', default='data', help='name of the JSON file with the count-encoding maps')
+    args.add_argument('--model', default='car_model', help='name of the model file')
+    args.add_argument('--max-batch', type=int, default=64)
+    args.add_argument('--max-wait-ms', type=float, default=2.0)
+    args.add_argument('--cache-size', type=int, default=10_000, help='cars kept in the in-memory prediction cache')
+    args.add_argument('--cache-ttl', type=float, default=None, help='seconds a cached price stays valid')
+    args.add_argument('--cache-path', default=None, help='SQLite file shared by server processes as a second cache level')
+    args.add_argument('--spans', action='store_true', help='time the predict stages and report them in /metrics')
+    args.add_argument('--spans-log', action='store_true', help='log every stage timing at DEBUG')
+    args.add_argument('--prometheus-file', default=None, help='file rewritten with the stage timings, implies --spans')
+    args.add_argument('--profile-dir', default=None, help='directory for the profiles of POST /predict?profile=1')
+    args.add_argument('--request-log', default=None, help='JSONL file every scored car is appended to')
+    args.add_argument('--drift', default=None, metavar='DATASET',
+                      help='cars_<date> snapshot the model was trained on, compared with the requests in GET /drift')
+    args.add_argument('--drift-window', type=int, default=10_000, help='the number of recent cars GET /drift covers')
+    args.add_argument('--comparables', default=None, metavar='DATASET',
+                      help='cars_<date> snapshot whose listings POST /predict?comparables=K returns')
+    args = args.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    registry = None
+    if args.prometheus_file:
+        sink = spans.PrometheusFileSink(args.prometheus_file)
+        spans.add_sink(sink)
+        registry = sink.registry
+    elif args.spans:
+        registry = spans.HistogramRegistry()
+        spans.add_sink(registry)
+    if args.spans_log:
+        spans.add_sink(spans.LoggerSink())
+    cache = PredictionCache(args.cache_size, args.cache_ttl, args.cache_path)
+    comparables = load_comparables(args.comparables) if args.comparables else None
+    monitor = DriftMonitor(load_reference(args.drift), load_encoder(args.data), args.drift_window) if args.drift \
+        else None
+    request_log = None
+    if args.request_log or monitor is not None:
+        request_log = RequestLog(args.request_log, consumers=[monitor.update] if monitor is not None else [])
+    server = make_server(args.host, args.port, args.data, args.model, args.max_batch, args.max_wait_ms, cache,
+                         registry, args.profile_dir, comparables, request_log, monitor)
+    logger.info('Сервер запущен на http://%s:%d', *server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+        if request_log is not None:
+            request_log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from xgboost import XGBRegressor
+
+from data_prep.data_prep import clean, open_file
+from data_prep.stream import read_partitioned
+from model.artifact import export_model, manifest_path, native_path
+from model.encoder import CountEncoder, file_hash, compiled_path
+from model.regression_model import CATEGORY, COLUMNS, DTYPES, MARGIN_ATTR, QUANTILES, load_encoder, quantile_name
+from telemetry.spans import span
+
+logger = logging.getLogger(__name__)
+
+GRID = {
+    'max_depth': [4, 6, 8],
+    'learning_rate': [0.05, 0.1, 0.3],
+    'min_child_weight': [1, 5],
+    'subsample': [0.8, 1.0],
+}
+
+MAX_ROUNDS = 2_000
+EARLY_STOPPING = 50
+
+QUANTILE_PARAMS = {'max_depth': 4, 'learning_rate': 0.05, 'n_estimators': 300, 'min_child_weight': 5,
+                   'subsample': 0.8}
+
+# The booster attribute with the parameters a model was fitted with, JSON. A model loaded from its native file does not
+# have them otherwise, and model.refresh needs them to add trees grown the same way.
+PARAMS_ATTR = 'training_params'
+
+
+def load_training_data(datasets: list) -> pd.DataFrame:
+    """
+    Clean and concatenate the snapshots to train on. A name is a scraped cars_<date> CSV file without extension, or a
+    directory with the partitioned Parquet dataset of data_prep.stream, which is already cleaned.
+    """
+    frames = []
+    for name in datasets:
+        with span('training.load'):
+            if os.path.isdir(name):
+                frames.append(read_partitioned(name).drop(columns='scrape_date', errors='ignore'))
+            else:
+                frames.append(clean(open_file(name)))
+    if not frames:
+        raise ValueError('Не задано ни одного датасета!')
+
+    data = pd.concat(frames, ignore_index=True)
+    return data.astype({c: str for c in CATEGORY})
+
+
+def build_encoder(data: pd.DataFrame, source: str = '') -> CountEncoder:
+    """The count encoder of the cleaned data: every value of a categorical column maps to its number of rows."""
+    keys, counts = [], []
+    for c in CATEGORY:
+        if data[c].isna().any():
+            raise ValueError(f'В столбце {c} есть пропуски, данные должны быть очищены!')
+        values = data[c].value_counts(sort=False, dropna=False)
+        order = pd.unique(data[c])
+        keys.append(list(order))
+        counts.append(values.reindex(order).to_numpy(np.int64))
+    return CountEncoder(CATEGORY, keys, counts, source)
+
+
+def build_selector(data: pd.DataFrame) -> dict:
+    """The brand -> models map of the model page selectors, in the order the brands and models first appear."""
+    pairs = data[['name', 'model']].drop_duplicates()
+    return {name: list(models) for name, models in pairs.groupby('name', sort=False)['model']}
+
+
+def encode_features(data: pd.DataFrame, encoder: CountEncoder) -> pd.DataFrame:
+    """The feature DataFrame the model is trained on, in the COLUMNS order with the DTYPES of prepare_df."""
+    return data.assign(**encoder.transform(data))[COLUMNS].astype(DTYPES).reset_index(drop=True)
+
+
+def kfold(rows: int, folds: int, seed: int = 0) -> list:
+    """folds pairs of (train, validation) positions of a shuffled k-fold split."""
+    order = np.random.default_rng(seed).permutation(rows)
+    parts = np.array_split(order, folds)
+    return [(np.concatenate(parts[:i] + parts[i + 1:]), parts[i]) for i in range(folds)]
+
+
+def keep_params(model: XGBRegressor, params: dict) -> XGBRegressor:
+    """Store the booster parameters in the PARAMS_ATTR attribute of the model, the number of rounds left out."""
+    params = {k: v for k, v in params.items() if k not in ('n_estimators', 'early_stopping_rounds', 'n_jobs')}
+    model.get_booster().set_attr(**{PARAMS_ATTR: json.dumps(params, sort_keys=True)})
+    return model
+
+
+def training_params(model: XGBRegressor) -> dict:
+    """The booster parameters the model was fitted with, see keep_params."""
+    params = model.get_booster().attr(PARAMS_ATTR)
+    if params is None:
+        raise ValueError('В модели не сохранены параметры обучения, её нужно обучить заново!')
+    return json.loads(params)
+
+
+def _fit(params: dict, x_train, y_train, x_valid=None, y_valid=None, n_jobs: int = 1) -> XGBRegressor:
+    if x_valid is None:
+        model = XGBRegressor(n_jobs=n_jobs, **params)
+        return keep_params(model.fit(x_train, y_train), params)
+
+    model = XGBRegressor(n_estimators=MAX_ROUNDS, early_stopping_rounds=EARLY_STOPPING, n_jobs=n_jobs, **params)
+    return keep_params(model.fit(x_train, y_train, eval_set=[(x_valid, y_valid)], verbose=False), params)
+
+
+def rmse(y_true, y_pred) -> float:
+    return float(np.sqrt(np.mean((np.asarray(y_true) - np.asarray(y_pred)) ** 2)))
+
+
+def r2(y_true, y_pred) -> float:
+    y_true, y_pred = np.asarray(y_true, dtype=np.float64), np.asarray(y_pred, dtype=np.float64)
+    return float(1 - ((y_true - y_pred) ** 2).sum() / ((y_true - y_true.mean()) ** 2).sum())
+
+
+def coverage(y_true, low, high) -> float:
+    """The share of the prices between low and high."""
+    y_true = np.asarray(y_true)
+    return float(np.mean((y_true >= low) & (y_true <= high)))
+
+
+def _fit_quantile(alpha: float, x, y, params: dict, seed: int, n_jobs: int) -> XGBRegressor:
+    params = dict(params, objective='reg:quantileerror', quantile_alpha=alpha, random_state=seed)
+    return keep_params(XGBRegressor(n_jobs=n_jobs, **params).fit(x, y), params)
+
+
+def conformal_margin(y, low, high, width: float) -> float:
+    """
+    The margin by which low and high have to be widened to hold a width share of the prices y, as measured on
+    calibration rows the quantile models were not fitted on (conformalized quantile regression).
+    """
+    scores = np.maximum(low - y, y - high)
+    return max(0.0, float(np.quantile(scores, min(1.0, width * (1 + 1 / len(y))))))
+
+
+def fit_quantiles(x: pd.DataFrame, y: np.array, params: dict = None, quantiles: dict = None,
+                  calibration: float = 0.25, seed: int = 0, n_jobs: int = 1) -> dict:
+    """
+    Summary
+        The fit_quantiles function fits one quantile-objective booster per quantile on the same encoded features as
+        the price model. Boosted quantiles cover fewer prices than they should on data of this size (about 65%
+        between the 0.1 and 0.9 quantiles instead of 80%), so the interval is conformalized: the low and high models
+        are first fitted without a calibration part, the margin by which they miss its prices is measured, and the
+        models fitted on all rows carry that margin, which PricePredictor subtracts from low and adds to high.
+
+    Inputs
+        x (pd.DataFrame): The encoded features.
+        y (np.array): The prices.
+        params (dict): The booster parameters, QUANTILE_PARAMS by default.
+        quantiles (dict): label -> quantile, QUANTILES by default. The labels low and high get the margin.
+        calibration (float): The share of the rows held out to measure the margin.
+        seed (int): The seed of the calibration split and of the subsampling.
+        n_jobs (int): The number of threads of every fit.
+
+    Outputs
+        dict: label -> XGBRegressor, the margin stored in the MARGIN_ATTR attribute of the boosters.
+    """
+    params = params or QUANTILE_PARAMS
+    quantiles = quantiles or QUANTILES
+    low, high = quantiles['low'], quantiles['high']
+
+    order = np.random.default_rng(seed).permutation(len(x))
+    split = int(len(x) * (1 - calibration))
+    fit_rows, calibration_rows = order[:split], order[split:]
+    bounds = [_fit_quantile(alpha, x.iloc[fit_rows], y[fit_rows], params, seed, n_jobs).predict(
+        x.iloc[calibration_rows]) for alpha in (low, high)]
+    margin = conformal_margin(y[calibration_rows], bounds[0], bounds[1], high - low)
+
+    models = {}
+    for label, alpha in quantiles.items():
+        models[label] = _fit_quantile(alpha, x, y, params, seed, n_jobs)
+        if label in ('low', 'high'):
+            models[label].get_booster().set_attr(**{MARGIN_ATTR: str(margin)})
+    return models
+
+
+def predict_quantiles(models: dict, x: pd.DataFrame) -> dict:
+    """The low, median and high prices of fit_quantiles models, with the margin, as PricePredictor gives them."""
+    margin = {label: float(m.get_booster().attr(MARGIN_ATTR) or 0.0) for label, m in models.items()}
+    bounds = np.sort(np.column_stack([models['low'].predict(x) - margin['low'], models['median'].predict(x),
+                                      models['high'].predict(x) + margin['high']]), axis=1)
+    return {'low': bounds[:, 0], 'median': bounds[:, 1], 'high': bounds[:, 2]}
+
+
+_shared = {}
+
+
+def _init_worker(x: pd.DataFrame, y: np.array, splits: list) -> None:
+    _shared.update(x=x, y=y, splits=splits)
+
+
+def _score_fold(task: tuple) -> tuple:
+    """Fit one grid point on one fold in a worker, with early stopping on the validation part."""
+    i, params, fold = task
+    train, valid = _shared['splits'][fold]
+    x, y = _shared['x'], _shared['y']
+    model = _fit(params, x.iloc[train], y[train], x.iloc[valid], y[valid])
+    return i, rmse(y[valid], model.predict(x.iloc[valid])), model.best_iteration + 1
+
+
+def grid_points(grid: dict) -> list:
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def search(x: pd.DataFrame, y: np.array, grid: dict = None, folds: int = 5, workers: int = None,
+           seed: int = 0) -> list:
+    """
+    Summary
+        The search function scores every point of the hyperparameter grid with k-fold cross-validation. Every
+        (grid point, fold) pair is an independent single-threaded fit in a pool of worker processes, so all cores are
+        busy, and every fit stops early once the validation RMSE has not improved for EARLY_STOPPING rounds.
+
+    Inputs
+        x (pd.DataFrame): The encoded features.
+        y (np.array): The prices.
+        grid (dict): parameter -> list of values, GRID by default.
+        folds (int): The number of cross-validation folds.
+        workers (int): The number of processes, by default the number of CPUs.
+        seed (int): The seed of the fold split.
+
+    Outputs
+        list: A dict per grid point with the params, the mean validation rmse and the mean number of boosting rounds
+            (n_estimators), best first.
+    """
+    points = grid_points(grid or GRID)
+    splits = kfold(len(x), folds, seed)
+    tasks = [(i, params, fold) for i, params in enumerate(points) for fold in range(folds)]
+
+    scores = {i: [] for i in range(len(points))}
+    rounds = {i: [] for i in range(len(points))}
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(x, y, splits)) as pool:
+        for i, score, best in pool.map(_score_fold, tasks):
+            scores[i].append(score)
+            rounds[i].append(best)
+
+    results = [{'params': params, 'rmse': float(np.mean(scores[i])), 'rmse_std': float(np.std(scores[i])),
+                'n_estimators': int(round(np.mean(rounds[i])))} for i, params in enumerate(points)]
+    return sorted(results, key=lambda r: r['rmse'])
+
+
+def _stage_quantiles(quantiles: dict, stage: str, model_name: str, data_name: str, training_data: str = None) -> list:
+    """Export the quantile models into the staging directory, the (source, target) moves, every manifest last."""
+    models, manifests = [], []
+    for label, quantile in quantiles.items():
+        staged = os.path.join(stage, os.path.basename(quantile_name(model_name, label)))
+        export_model(quantile, staged, DTYPES, data_name, training_data)
+        models.append((native_path(staged), native_path(quantile_name(model_name, label))))
+        manifests.append((manifest_path(staged), manifest_path(quantile_name(model_name, label))))
+    return models + manifests
+
+
+def write_artifacts(model: XGBRegressor, encoder: CountEncoder, selector: dict, name: str = 'data',
+                    model_name: str = 'car_model', selector_name: str = 'selector', training_data: str = None,
+                    quantiles: dict = None) -> dict:
+    """
+    Summary
+        The write_artifacts function writes a trained model with the encoder it was trained with: data.json, its
+        compiled .npz, selector.json and the native model with its manifest. Everything is written to a staging
+        directory next to the targets first and then moved into place with os.replace, the manifest last, so a
+        running PricePredictor never loads a model with the maps of another one: until the manifest lands, the
+        checksums do not match and it keeps the old pair.
+
+    Inputs
+        model (XGBRegressor): The trained model.
+        encoder (CountEncoder): The encoder the model was trained with.
+        selector (dict): The brand -> models map.
+        name, model_name, selector_name (str): The names of the JSON file with the count-encoding maps, of the model
+            files and of the JSON file with the selector map.
+        training_data (str): The name of the CSV file the model was trained on, if it was a single file.
+        quantiles (dict): The quantile models of fit_quantiles, written as model_name.<label> with their manifests
+            before the manifest of the model.
+
+    Outputs
+        dict: The manifest.
+    """
+    directory = os.path.dirname(os.path.abspath(model_name))
+    stage = tempfile.mkdtemp(prefix='.artifacts-', dir=directory)
+    try:
+        staged_name = os.path.join(stage, os.path.basename(name))
+        staged_model = os.path.join(stage, os.path.basename(model_name))
+        staged_selector = os.path.join(stage, os.path.basename(selector_name))
+
+        with open(staged_name + '.json', 'w') as f:
+            json.dump({'data': encoder.to_info()}, f)
+        encoder.source = file_hash(staged_name + '.json')
+        encoder.save(compiled_path(staged_name))
+        with open(staged_selector + '.json', 'w') as f:
+            json.dump(selector, f)
+
+        manifest = export_model(model, staged_model, DTYPES, staged_name, training_data)
+
+        moves = [(native_path(staged_model), native_path(model_name)),
+                 (staged_name + '.json', os.path.join(name + '.json')),
+                 (compiled_path(staged_name), compiled_path(name)),
+                 (staged_selector + '.json', os.path.join(selector_name + '.json'))]
+        moves += _stage_quantiles(quantiles or {}, stage, model_name, staged_name, training_data)
+        moves.append((manifest_path(staged_model), manifest_path(model_name)))
+        for source, target in moves:
+            os.replace(source, target)
+    finally:
+        shutil.rmtree(stage, ignore_errors=True)
+
+    return manifest
+
+
+def train(datasets: list, name: str = 'data', model_name: str = 'car_model', selector_name: str = 'selector',
+          grid: dict = None, folds: int = 5, workers: int = None, test_size: float = 0.2, seed: int = 0,
+          quantiles: bool = True) -> dict:
+    """
+    Summary
+        The train function regenerates the model and its encoder from scraped data, the process the model page
+        describes: count encoding of the categorical columns, an 80/20 split, and an XGBRegressor whose
+        hyperparameters are chosen by cross-validation on the training part.
+
+    Inputs
+        datasets (list): The snapshots to train on, see load_training_data.
+        name, model_name, selector_name (str): The names of the artifacts to write, see write_artifacts.
+        grid (dict): The hyperparameter grid, GRID by default.
+        folds (int): The number of cross-validation folds.
+        workers (int): The number of processes of the search, by default the number of CPUs.
+        test_size (float): The share of rows held out to report the quality of the chosen model.
+        seed (int): The seed of the splits.
+        quantiles (bool): Also fit and write the quantile models of the price range, see fit_quantiles.
+
+    Flow
+        1. Clean and concatenate the snapshots, count-encode them with counts over all rows, as data.json has.
+        2. Hold out test_size of the rows and search the grid with k-fold cross-validation on the rest.
+        3. Fit the best parameters with their mean number of rounds on the training part and score the holdout, the
+            quantile models too.
+        4. Fit them again on all rows and write the model with data.json, its .npz, selector.json and the quantile
+            models.
+
+    Outputs
+        dict: The report: rows, the best parameters, the cross-validation rmse, holdout rmse and r2, the share of
+            the holdout prices in the quantile range, the search and total time in seconds, and the manifest.
+    """
+    start = time.perf_counter()
+    data = load_training_data(datasets)
+    encoder = build_encoder(data)
+    x = encode_features(data, encoder)
+    y = data['price'].to_numpy(np.float32)
+
+    order = np.random.default_rng(seed).permutation(len(x))
+    split = int(len(x) * (1 - test_size))
+    train_rows, test_rows = order[:split], order[split:]
+
+    search_start = time.perf_counter()
+    with span('training.search'):
+        results = search(x.iloc[train_rows].reset_index(drop=True), y[train_rows], grid, folds, workers, seed)
+    search_time = time.perf_counter() - search_start
+
+    best = results[0]
+    params = dict(best['params'], n_estimators=best['n_estimators'])
+    with span('training.fit'):
+        holdout = _fit(params, x.iloc[train_rows], y[train_rows], n_jobs=workers or -1)
+        predicted = holdout.predict(x.iloc[test_rows])
+        model = _fit(params, x, y, n_jobs=workers or -1)
+
+    report = {
+        'rows': len(x),
+        'params': params,
+        'cv_rmse': round(best['rmse'], 3),
+        'holdout_rmse': round(rmse(y[test_rows], predicted), 3),
+        'holdout_r2': round(r2(y[test_rows], predicted), 4),
+    }
+
+    quantile_models = None
+    if quantiles:
+        with span('training.quantiles'):
+            bounds = predict_quantiles(fit_quantiles(x.iloc[train_rows], y[train_rows], seed=seed,
+                                                     n_jobs=workers or -1), x.iloc[test_rows])
+            quantile_models = fit_quantiles(x, y, seed=seed, n_jobs=workers or -1)
+        report['holdout_coverage'] = round(coverage(y[test_rows], bounds['low'], bounds['high']), 4)
+
+    single_csv = datasets[0] if len(datasets) == 1 and not os.path.isdir(datasets[0]) else None
+    with span('training.write'):
+        manifest = write_artifacts(model, encoder, build_selector(data), name, model_name, selector_name, single_csv,
+                                   quantile_models)
+
+    report.update(search_s=round(search_time, 1), total_s=round(time.perf_counter() - start, 1), manifest=manifest)
+    return report
+
+
+def train_quantiles(datasets: list, name: str = 'data', model_name: str = 'car_model', params: dict = None,
+                    test_size: float = 0.2, seed: int = 0, workers: int = None) -> dict:
+    """
+    Summary
+        The train_quantiles function fits the quantile models of an already trained model, with the encoder of its
+        data.json, and writes them next to it. The model and data.json are not changed.
+
+    Inputs
+        datasets (list): The snapshots the model was trained on, see load_training_data.
+        name, model_name (str): The names of the JSON file with the count-encoding maps and of the model files.
+        params (dict): The booster parameters, QUANTILE_PARAMS by default.
+        test_size (float): The share of rows held out to report the coverage.
+        seed (int): The seed of the splits.
+        workers (int): The number of threads of every fit, by default all CPUs.
+
+    Outputs
+        dict: The report: rows, the holdout coverage of the low-high range and the share of the holdout prices below
+            the median, and the time in seconds.
+    """
+    start = time.perf_counter()
+    data = load_training_data(datasets)
+    x = encode_features(data, load_encoder(name))
+    y = data['price'].to_numpy(np.float32)
+
+    order = np.random.default_rng(seed).permutation(len(x))
+    split = int(len(x) * (1 - test_size))
+    train_rows, test_rows = order[:split], order[split:]
+
+    with span('training.quantiles'):
+        bounds = predict_quantiles(fit_quantiles(x.iloc[train_rows], y[train_rows], params, seed=seed,
+                                                 n_jobs=workers or -1), x.iloc[test_rows])
+        models = fit_quantiles(x, y, params, seed=seed, n_jobs=workers or -1)
+
+    single_csv = datasets[0] if len(datasets) == 1 and not os.path.isdir(datasets[0]) else None
+    stage = tempfile.mkdtemp(prefix='.artifacts-', dir=os.path.dirname(os.path.abspath(model_name)))
+    try:
+        for source, target in _stage_quantiles(models, stage, model_name, name, single_csv):
+            os.replace(source, target)
+    finally:
+        shutil.rmtree(stage, ignore_errors=True)
+
+    return {
+        'rows': len(x),
+        'holdout_coverage': round(coverage(y[test_rows], bounds['low'], bounds['high']), 4),
+        'holdout_below_median': round(float(np.mean(y[test_rows] < bounds['median'])), 4),
+        'margin': round(float(models['low'].get_booster().attr(MARGIN_ATTR)), 3),
+        'total_s': round(time.perf_counter() - start, 1),
+    }
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Train the car price model and write it with its encoder.')
+    args.add_argument('datasets', nargs='+', help='cars_<date> CSV files without extension or partitioned '
+                                                  'Parquet directories')
+    args.add_argument('--data', default='data', help='name of the JSON file with the count-encoding maps')
+    args.add_argument('--model', default='car_model', help='name of the model files')
+    args.add_argument('--selector', default='selector', help='name of the JSON file with the brand -> models map')
+    args.add_argument('--grid', default=None, help='JSON object of parameter -> list of values')
+    args.add_argument('--folds', type=int, default=5)
+    args.add_argument('--workers', type=int, default=None)
+    args.add_argument('--test-size', type=float, default=0.2)
+    args.add_argument('--seed', type=int, default=0)
+    args.add_argument('--no-quantiles', action='store_true', help='do not fit the quantile models of the price range')
+    args.add_argument('--quantiles-only', action='store_true',
+                      help='only fit the quantile models of the existing model and data.json')
+    args = args.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.quantiles_only:
+        report = train_quantiles(args.datasets, args.data, args.model, test_size=args.test_size, seed=args.seed,
+                                 workers=args.workers)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    report = train(args.datasets, args.data, args.model, args.selector, json.loads(args.grid) if args.grid else None,
+                   args.folds, args.workers, args.test_size, args.seed, not args.no_quantiles)
+    report.pop('manifest')
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
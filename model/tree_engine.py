@@ -0,0 +1,131 @@
+import json
+
+import numpy as np
+
+
+class TreeEnsemble:
+    """
+    Summary
+        The TreeEnsemble class evaluates a trained XGBoost regression booster with NumPy only. All trees are flattened
+        into contiguous arrays of nodes, and a batch walks down every tree at once, one level per step, so a
+        prediction costs a few array operations per level instead of a DMatrix and a thread pool.
+
+    Inputs
+        feature (np.array): The feature index of every node.
+        threshold (np.array): The split value of every node, float32 as in XGBoost.
+        left, right, missing (np.array): The child of every node for x < threshold, x >= threshold and a missing
+            value. Leaves point to themselves, so a finished walk stays in its leaf.
+        value (np.array): The leaf value of every node, 0 for inner nodes.
+        roots (np.array): The root node of every tree.
+        depth (int): The largest depth of the trees.
+        base_score (float): The value added to the sum of the leaves.
+
+    Flow
+        1. Start every row at the roots of all trees.
+        2. depth times move every row in every tree to the child chosen by its feature value.
+        3. Add the leaf values of the trees one by one to base_score.
+
+    Outputs
+        np.array: predict returns a float32 array of predictions, one per row.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing, value, roots, depth: int, base_score: float):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing = missing
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.base_score = np.float32(base_score)
+
+    @classmethod
+    def from_booster(cls, booster) -> 'TreeEnsemble':
+        """Flatten an xgboost.Booster (or XGBRegressor) with numerical splits and the reg:squarederror objective."""
+        if hasattr(booster, 'get_booster'):
+            booster = booster.get_booster()
+
+        learner = json.loads(booster.save_raw('json'))['learner']
+        if learner['objective']['name'] != 'reg:squarederror':
+            raise ValueError(f'Функция потерь {learner["objective"]["name"]} не поддерживается!')
+
+        base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+        trees = learner['gradient_booster']['model']['trees']
+
+        feature, threshold, left, right, missing, value, roots, depths = [], [], [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            if any(tree['split_type']):
+                raise ValueError('Категориальные разбиения не поддерживаются!')
+
+            l = np.array(tree['left_children'], dtype=np.int64)
+            r = np.array(tree['right_children'], dtype=np.int64)
+            cond = np.array(tree['split_conditions'], dtype=np.float32)
+            leaf = l == -1
+            nodes = np.arange(len(l))
+
+            l = np.where(leaf, nodes, l)
+            r = np.where(leaf, nodes, r)
+            m = np.where(np.array(tree['default_left'], dtype=bool), l, r)
+
+            feature.append(np.where(leaf, 0, tree['split_indices']))
+            threshold.append(cond)
+            value.append(np.where(leaf, cond, np.float32(0)))
+            left.append(l + offset)
+            right.append(r + offset)
+            missing.append(m + offset)
+            roots.append(offset)
+            depths.append(_depth(l, r, leaf))
+            offset += len(l)
+
+        return cls(np.concatenate(feature).astype(np.int32),
+                   np.concatenate(threshold).astype(np.float32),
+                   np.concatenate(left).astype(np.int32),
+                   np.concatenate(right).astype(np.int32),
+                   np.concatenate(missing).astype(np.int32),
+                   np.concatenate(value).astype(np.float32),
+                   np.array(roots, dtype=np.int32),
+                   max(depths, default=0),
+                   base_score)
+
+    def predict(self, data, chunk_size: int = 1_024) -> np.array:
+        """
+        Predict a batch. data is a 2-D array or DataFrame with the features in the order of the booster. Rows are
+        evaluated chunk_size at a time to bound the memory of the (rows x trees) node matrix.
+        """
+        x = np.ascontiguousarray(np.asarray(data, dtype=np.float32))
+        if x.ndim == 1:
+            x = x[None, :]
+
+        out = np.empty(len(x), dtype=np.float32)
+        for start in range(0, len(x), chunk_size):
+            out[start:start + chunk_size] = self._predict(x[start:start + chunk_size])
+        return out
+
+    def _predict(self, x: np.array) -> np.array:
+        n, k = x.shape
+        values = x.ravel()
+        offsets = (np.arange(n, dtype=np.int64) * k)[:, None]
+        node = np.broadcast_to(self.roots, (n, len(self.roots))).copy()
+        for _ in range(self.depth):
+            fvalue = values.take(offsets + self.feature.take(node))
+            child = np.where(fvalue < self.threshold.take(node), self.left.take(node), self.right.take(node))
+            nan = np.isnan(fvalue)
+            if nan.any():
+                child[nan] = self.missing.take(node[nan])
+            node = child
+        # XGBoost adds the trees one by one to base_score in float32, the same order gives bit-identical sums.
+        out = np.full(n, self.base_score, dtype=np.float32)
+        for leaves in self.value.take(node).T:
+            out += leaves
+        return out
+
+
+def _depth(left: np.array, right: np.array, leaf: np.array) -> int:
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):
+        if not leaf[node]:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max())
@@ -1,24 +1,117 @@
 import os
 import csv
-import re
 import datetime
 import time
 
+from concurrent.futures import ProcessPoolExecutor
+
 import requests
 
-from bs4 import BeautifulSoup
+from scraper.extract import extract_listings
+from scraper.fetcher import bounded_map, fetch_pages
+from scraper.state import Checkpoint, SeenIndex
+from telemetry import spans
+
+URL = 'https://auto.drom.ru'
+HEADER = ['name', 'year', 'engine_capacity', 'horse_power', 'fuel', 'transmission', 'drive_unit', 'mileage',
+          'location', 'price']
+
 
+def parse_page(response: str) -> list:
+    """
+    Summary
+        The parse_page function extracts the listings from the HTML of an auto.drom.ru/all/pageN/ page: car name, year,
+        engine capacity, horsepower, fuel type, transmission, drive unit, mileage, location and price.
+
+    Inputs
+        response (str): The HTML of the page.
 
-def get_data():
+    Outputs
+        list: A list of Listing records (see scraper.extract) in the order of the HEADER columns, with numeric year,
+            engine capacity, horsepower, mileage in km and price in rubles.
+    """
+    return extract_listings(response)
+
+
+def _parse_page_timed(response: str) -> tuple:
+    """parse_page in a worker process, returning its duration for the sinks of the parent process."""
+    start = time.perf_counter()
+    rows = parse_page(response)
+    return rows, time.perf_counter() - start
+
+
+class _Run:
+    """The output file of a scraping run together with its checkpoint and index of seen listings."""
+
+    def __init__(self, path: str = None, checkpoint: str = None, seen: str = None, stop_after: int = 0):
+        self.checkpoint = Checkpoint(checkpoint) if checkpoint else None
+        self.seen = SeenIndex(seen) if seen else None
+        self.stop_after = stop_after
+        self.idle = 0
+        self.written = 0
+
+        resume = self.checkpoint is not None and self.checkpoint.output is not None
+        if resume:
+            path = self.checkpoint.output
+        if path is None:
+            path = f'./cars_{datetime.datetime.now().strftime("%Y-%m-%d")}.csv'
+        if self.checkpoint is not None:
+            self.checkpoint.output = path
+
+        append = os.path.exists(path) and (resume or self.seen is not None)
+        self.path = path
+        self.file = open(path, 'a' if append else 'w', newline='')
+        self.writer = csv.writer(self.file, delimiter=',')
+        if not append or os.path.getsize(path) == 0:
+            self.writer.writerow(HEADER)
+
+    def pages(self, pages) -> list:
+        return self.checkpoint.remaining(pages) if self.checkpoint is not None else list(pages)
+
+    def write(self, page: int, rows: list) -> bool:
+        """Write the new rows of a page and return False once stop_after pages in a row had no new listings."""
+        with spans.span('scraper.write'):
+            if self.seen is not None:
+                rows = self.seen.filter_new(rows)
+            self.writer.writerows(rows)
+            self.file.flush()
+            self.written += len(rows)
+
+            if self.seen is not None:
+                self.seen.add(rows)
+            if self.checkpoint is not None:
+                self.checkpoint.mark_done(page)
+                self.checkpoint.save()
+
+        self.idle = 0 if rows else self.idle + 1
+        return not self.stop_after or self.idle < self.stop_after
+
+    def close(self, finished: bool) -> None:
+        self.file.close()
+        if self.seen is not None:
+            self.seen.close()
+        if finished and self.checkpoint is not None:
+            self.checkpoint.clear()
+
+
+def get_data(pages=range(1, 2_000), path: str = None, checkpoint: str = None, seen: str = None,
+             stop_after: int = 0) -> int:
     """
     The get_data function is responsible for scraping data from a website and saving it to a CSV file. It uses the
-    requests library to send HTTP requests and retrieve the HTML content of each page. Then, it uses the BeautifulSoup
-    library to parse the HTML and extract specific information such as car names, years, engine capacity, horsepower,
+    requests library to send HTTP requests and retrieve the HTML content of each page. Then, it uses parse_page to
+    parse the HTML and extract specific information such as car names, years, engine capacity, horsepower,
     fuel type, transmission, drive unit, mileage, location, and price. Finally, it writes the extracted data to a CSV
     file.
 
     Inputs
-    There are no inputs for the get_data function. It retrieves data from a website by sending HTTP requests.
+        pages (iterable): The numbers of the pages to scrape, 1 to 1999 by default.
+        path (str): The CSV file to write, by default cars_<today>.csv.
+        checkpoint (str): A JSON file recording the written pages. If it is left from a run which did not finish,
+            that run is resumed: its CSV file is appended and its written pages are skipped. It is removed when the
+            run finishes.
+        seen (str): An SQLite index of the listings already scraped. Only listings not in it are written and an
+            existing CSV file is appended instead of truncated.
+        stop_after (int): With seen, stop once this many pages in a row had no new listings, 0 never stops.
 
     Flow
         1. Generate a filename based on the current date and time.
@@ -26,7 +119,7 @@ def get_data():
         3. Write the header row to the CSV file.
         4. Iterate over a range of page numbers from 1 to 2000.
         5. Send an HTTP GET request to the website's URL for each page.
-        6. Parse the HTML content of the response using BeautifulSoup.
+        6. Parse the HTML content of the response using parse_page.
         7. Extract the car names, years, engine capacity, horsepower, fuel type, transmission, drive unit, mileage,
         location and price from the parsed HTML.
         8. Write the extracted data as a row to the CSV file.
@@ -34,54 +127,105 @@ def get_data():
         10. Close the CSV file.
 
     Outputs
-        The get_data function does not return any values. It saves the extracted data to a CSV file.
+        int: The number of written listings. The extracted data is saved to a CSV file.
     """
-    file = f'cars_{datetime.datetime.now().strftime("%Y-%m-%d")}'
-    path = f'./{file}'
-    with open(os.path.join(path + '.csv'), 'w') as f:
-        writer = csv.writer(f, delimiter=',')
-        writer.writerow(
-            ['name', 'year', 'engin_capacity', 'horse_power', 'fuel', 'transmission', 'drive_unit', 'millage',
-             'location', 'price'])
-        for i in range(1, 2_000):
+    run = _Run(path, checkpoint, seen, stop_after)
+    finished = False
+    try:
+        for i in run.pages(pages):
             time.sleep(3)
 
-            response = requests.get(url=f'https://auto.drom.ru/all/page{i}/').text
-            soup = BeautifulSoup(response, features='lxml')
-            name_year = soup.find_all('span', {'data-ftid': 'bull_title'})
-            info = soup.find_all('div', class_='css-1fe6w6s e162wx9x0')
-            prices = soup.find_all('div', class_="css-1dv8s3l eyvqki91")
-            locations = soup.find_all('span', {'data-ftid': 'bull_location'})
-
-            for ny, i, p, l in zip(name_year, info, prices, locations):
-                name, year = ny.text.split(', ')
-                try:
-                    engin_hp, fuel, transmission, drive_unit, millage = i.text.split(', ')
-                    millage = re.findall(pattern=r'\d+.\d', string=millage.replace(' ', ''))
-                    millage = ''.join(millage)
-                    try:
-                        engin, hp, *tail = re.findall(pattern=r'(\d+.\d)|(\d+)', string=engin_hp)
-                        engin = ''.join(engin)
-                        hp = ''.join(hp)
-                    except:
-                        engin = None
-                        hp = re.findall(pattern=r'(\d+)', string=engin_hp)
-                        hp = ''.join(hp)
-                except:
-                    try:
-                        engin_hp, fuel, transmission, drive_unit, *tail = i.text.split(', ')
-                        try:
-                            engin, hp, *tail = re.findall(pattern=r'(\d+.\d)|(\d+)', string=engin_hp)
-                            engin = ''.join(engin)
-                            hp = ''.join(hp)
-                            millage = '0'
-                        except:
-                            engin = None
-                            hp = re.findall(pattern=r'(\d+)', string=engin_hp)
-                            hp = ''.join(hp)
-                    except:
-                        pass
-                price = p.text
-                location = l.text
-
-                writer.writerow([name, year, engin, hp, fuel, transmission, drive_unit, millage, location, price])
+            with spans.span('scraper.fetch'):
+                response = requests.get(url=f'{URL}/all/page{i}/').text
+            with spans.span('scraper.parse'):
+                rows = parse_page(response)
+            if not run.write(i, rows):
+                break
+        finished = True
+    finally:
+        run.close(finished)
+
+    return run.written
+
+
+def get_data_concurrent(pages=range(1, 2_000), concurrency: int = 8, rate: float = 2.0, ordered: bool = True,
+                        base_url: str = URL, workers: int = None, path: str = None, checkpoint: str = None,
+                        seen: str = None, stop_after: int = 0) -> list:
+    """
+    Summary
+        The get_data_concurrent function scrapes the same pages as get_data, but downloads concurrency pages at a time
+        over one keep-alive session, limited to rate requests per second, and parses them in a pool of worker
+        processes so parsing does not hold up the downloads.
+
+    Inputs
+        pages (iterable): The numbers of the pages to scrape.
+        concurrency (int): The number of pages downloaded at the same time.
+        rate (float): The largest number of requests per second.
+        ordered (bool): Write the listings in the order of the pages. Otherwise a page is written as soon as it is
+            parsed.
+        base_url (str): The address of the site, a local server with saved pages can be used instead of auto.drom.ru
+            (see scraper.fixtures).
+        workers (int): The number of parsing processes, by default the number of CPUs.
+        path (str): The CSV file to write, by default cars_<today>.csv.
+        checkpoint, seen, stop_after: See get_data. Pages which could not be downloaded stay out of the checkpoint,
+            so resuming the run downloads them again. stop_after counts pages in the order they are written, so it is
+            meant for ordered runs.
+
+    Flow
+        1. Download the pages with fetch_pages, 429 and 5xx responses are retried with backoff.
+        2. Send every downloaded page to the process pool for parse_page, at most 2 * concurrency pages wait there.
+        3. Write the new rows of every parsed page to the CSV file and record the page in the checkpoint.
+
+    Outputs
+        list: The numbers of the pages which could not be downloaded.
+    """
+    run = _Run(path, checkpoint, seen, stop_after)
+    failed = []
+    finished = False
+    try:
+        parsed = iter_pages(run.pages(pages), concurrency, rate, ordered, base_url, workers, failed)
+        for page, rows in parsed:
+            if not run.write(page, rows):
+                parsed.close()
+                break
+        finished = not failed
+    finally:
+        run.close(finished)
+
+    return sorted(failed)
+
+
+def iter_pages(pages=range(1, 2_000), concurrency: int = 8, rate: float = 2.0, ordered: bool = True,
+               base_url: str = URL, workers: int = None, failed: list = None):
+    """
+    Summary
+        The iter_pages generator downloads and parses pages the same way as get_data_concurrent and yields their
+        listings instead of writing them, so they can be streamed into data_prep.stream without a CSV file.
+
+    Inputs
+        pages, concurrency, rate, ordered, base_url, workers: See get_data_concurrent.
+        failed (list): If given, the numbers of the pages which could not be downloaded are appended to it.
+
+    Outputs
+        generator: Pairs of (page number, list of Listing records).
+    """
+    if failed is None:
+        failed = []
+    urls = ((page, f'{base_url}/all/page{page}/') for page in pages)
+
+    with ProcessPoolExecutor(workers) as parsers:
+        def downloaded():
+            for page, response in fetch_pages(urls, concurrency=concurrency, rate=rate, ordered=ordered):
+                if response is None:
+                    failed.append(page)
+                else:
+                    yield page, response
+
+        if not spans.enabled():
+            yield from bounded_map(parsers, parse_page, downloaded(), window=2 * concurrency, ordered=ordered)
+            return
+
+        for page, (rows, seconds) in bounded_map(parsers, _parse_page_timed, downloaded(), window=2 * concurrency,
+                                                 ordered=ordered):
+            spans.record('scraper.parse', seconds)
+            yield page, rows
@@ -0,0 +1,126 @@
+import re
+
+from typing import NamedTuple, Optional
+
+from lxml import etree, html
+
+LISTING_NODES = etree.XPath('//span[@data-ftid="bull_title"] | //div[@class="css-1fe6w6s e162wx9x0"] | '
+                            '//div[@class="css-1dv8s3l eyvqki91"] | //span[@data-ftid="bull_location"]')
+
+ENGINE = re.compile(r'(\d+(?:[.,]\d+)?)\s*л(?!\.)')
+HORSE_POWER = re.compile(r'(\d[\d\s]*)\s*л\.\s*с\.')
+MILEAGE = re.compile(r'(\d[\d\s]*)\s*км')
+DIGITS = re.compile(r'\d+')
+SPACES = re.compile(r'\s+')
+
+TRANSMISSIONS = {'АКПП', 'механика', 'автомат', 'робот', 'вариатор'}
+DRIVE_UNITS = {'передний', 'задний', '4WD'}
+
+
+class Listing(NamedTuple):
+    name: str
+    year: int
+    engine_capacity: Optional[float]
+    horse_power: Optional[int]
+    fuel: Optional[str]
+    transmission: Optional[str]
+    drive_unit: Optional[str]
+    mileage: int
+    location: str
+    price: int
+
+
+def _int(text: str) -> int:
+    return int(''.join(DIGITS.findall(text)))
+
+
+def parse_info(text: str) -> tuple:
+    """
+    Summary
+        The parse_info function splits the description line of a listing, e.g. '2.5 л (101 л.с.), дизель, АКПП,
+        задний, 271 324 км', into engine capacity, horsepower, fuel, transmission, drive unit and mileage. The site
+        leaves out unknown fields, so transmission and drive unit are recognised by their values instead of their
+        position, and a listing without mileage is a new car with mileage 0.
+
+    Inputs
+        text (str): The description line.
+
+    Outputs
+        tuple: engine_capacity (float or None), horse_power (int or None), fuel, transmission, drive_unit (str or None)
+            and mileage (int).
+    """
+    parts = [p.strip() for p in text.split(', ')]
+    engine = horse_power = fuel = transmission = drive_unit = None
+    mileage = 0
+
+    if parts:
+        hp = HORSE_POWER.search(parts[0])
+        capacity = ENGINE.match(parts[0])
+        if hp or capacity:
+            parts.pop(0)
+            horse_power = _int(hp.group(1)) if hp else None
+            engine = float(capacity.group(1).replace(',', '.')) if capacity else None
+
+    if parts:
+        km = MILEAGE.fullmatch(parts[-1])
+        if km:
+            parts.pop()
+            mileage = _int(km.group(1))
+
+    for part in parts:
+        if part in DRIVE_UNITS and drive_unit is None:
+            drive_unit = part
+        elif part in TRANSMISSIONS and transmission is None:
+            transmission = part
+        elif fuel is None:
+            fuel = part
+
+    return engine, horse_power, fuel, transmission, drive_unit, mileage
+
+
+def extract_listings(response) -> list:
+    """
+    Summary
+        The extract_listings function extracts the listings from the HTML of an auto.drom.ru/all/pageN/ page in a
+        single pass: one compiled XPath query returns the title, description, price and location nodes of all
+        listings in document order, and every title with the three nodes after it becomes a Listing with numeric
+        fields. A listing with an unreadable year or price is skipped.
+
+    Inputs
+        response (str | bytes): The HTML of the page.
+
+    Outputs
+        list: A list of Listing records in the order of the HEADER columns of parser.py.
+    """
+    if not response:
+        return []
+
+    root = html.fromstring(response)
+    listings = []
+    card = None
+    for node in LISTING_NODES(root):
+        text = SPACES.sub(' ', node.text_content()).strip()
+        if node.tag == 'span' and node.get('data-ftid') == 'bull_title':
+            card = {'title': text}
+            continue
+        if card is None:
+            continue
+
+        if node.tag == 'span':
+            card['location'] = text
+        elif node.get('class') == 'css-1fe6w6s e162wx9x0':
+            card['info'] = text
+        else:
+            card['price'] = text
+
+        if len(card) == 4:
+            name, _, year = card['title'].rpartition(', ')
+            try:
+                engine, horse_power, fuel, transmission, drive_unit, mileage = parse_info(card['info'])
+                listings.append(Listing(name, int(year), engine, horse_power, fuel, transmission, drive_unit,
+                                        mileage, card['location'], _int(card['price'])))
+            except ValueError:
+                pass
+            card = None
+
+    return listings
@@ -0,0 +1,180 @@
+import collections
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from telemetry.spans import span
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Summary
+        The TokenBucket class limits how often requests are sent, across all threads sharing it. Tokens are added at
+        rate per second up to capacity, every request takes one token and waits while there are none.
+
+    Inputs
+        rate (float): The number of requests per second.
+        capacity (int): The largest burst of requests sent without waiting.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        if rate <= 0:
+            raise ValueError('Частота запросов должна быть больше нуля!')
+
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """A requests session which keeps up to pool_size keep-alive connections per host open for reuse."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _retry_delay(response, attempt: int, backoff: float) -> float:
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        return float(retry_after)
+    return backoff * 2 ** attempt
+
+
+def fetch(session: requests.Session, url: str, limiter: TokenBucket, retries: int = 5, backoff: float = 1.0,
+          timeout: float = 30.0) -> str:
+    """
+    Summary
+        The fetch function downloads a page through the rate limiter. Connection errors, 429 and 5xx responses are
+        retried with exponential backoff, a Retry-After header is respected.
+
+    Inputs
+        session (requests.Session): The session to send the request with.
+        url (str): The address of the page.
+        limiter (TokenBucket): The rate limiter shared by all fetchers.
+        retries (int): How many times a failed request is repeated.
+        backoff (float): The delay before the first retry in seconds, doubled for every next one.
+        timeout (float): The timeout of a request in seconds.
+
+    Outputs
+        str: The text of the page. requests.RequestException is raised when all attempts failed.
+    """
+    for attempt in range(retries + 1):
+        with span('scraper.rate_wait'):
+            limiter.acquire()
+        response = None
+        try:
+            with span('scraper.fetch'):
+                response = session.get(url, timeout=timeout)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.text
+            if attempt == retries:
+                response.raise_for_status()
+        except requests.HTTPError:
+            raise
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+
+        delay = _retry_delay(response, attempt, backoff)
+        logger.warning('Запрос %s не удался, повтор через %.1f с', url, delay)
+        time.sleep(delay)
+
+
+def bounded_map(executor, fn, items, window: int, ordered: bool = True):
+    """
+    Summary
+        The bounded_map function runs fn on an executor for a stream of (key, argument) pairs, with at most window
+        calls submitted at a time, so a long stream never piles up in memory.
+
+    Inputs
+        executor (concurrent.futures.Executor): The executor to run fn on.
+        fn (callable): The function called with every argument.
+        items (iterable): Pairs of (key, argument), read lazily.
+        window (int): The largest number of submitted and not yet consumed calls.
+        ordered (bool): Yield results in the order of items instead of the order of completion.
+
+    Outputs
+        generator: Pairs of (key, result). An exception raised by fn is raised by the generator.
+    """
+    items = iter(items)
+    if ordered:
+        pending = collections.deque()
+        for key, arg in items:
+            pending.append((key, executor.submit(fn, arg)))
+            if len(pending) >= window:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+        return
+
+    pending = {}
+    for key, arg in items:
+        pending[executor.submit(fn, arg)] = key
+        if len(pending) >= window:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
+
+
+def fetch_pages(urls, concurrency: int = 8, rate: float = 2.0, ordered: bool = True, retries: int = 5,
+                backoff: float = 1.0, timeout: float = 30.0):
+    """
+    Summary
+        The fetch_pages function downloads pages with concurrency threads sharing one keep-alive session and one
+        TokenBucket of rate requests per second.
+
+    Inputs
+        urls (iterable): Pairs of (key, url).
+        concurrency (int): The number of pages downloaded at the same time.
+        rate (float): The largest number of requests per second.
+        ordered (bool): Yield pages in the order of urls instead of the order of completion.
+        retries, backoff, timeout: See fetch.
+
+    Outputs
+        generator: Pairs of (key, text of the page). The text is None for a page which could not be downloaded.
+    """
+    session = make_session(concurrency)
+    limiter = TokenBucket(rate, capacity=concurrency)
+
+    def get(url):
+        try:
+            return fetch(session, url, limiter, retries, backoff, timeout)
+        except requests.RequestException as e:
+            logger.error('Страница %s не загружена: %s', url, e)
+            return None
+
+    with session, ThreadPoolExecutor(concurrency) as pool:
+        yield from bounded_map(pool, get, urls, window=2 * concurrency, ordered=ordered)
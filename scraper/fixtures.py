@@ -0,0 +1,127 @@
+import csv
+import html
+import os
+import re
+import threading
+
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+PAGE = re.compile(r'^/all/page(\d+)/?$')
+
+CARD = '''<a data-ftid="bulls-list_bull" href="/bull/{n}/">
+<div><span data-ftid="bull_title">{title}</span></div>
+<div class="css-1fe6w6s e162wx9x0">{info}</div>
+<div class="css-1dv8s3l eyvqki91">{price}</div>
+<span data-ftid="bull_location">{location}</span>
+</a>'''
+
+
+def _number(value: str) -> str:
+    return f'{int(float(value)):,}'.replace(',', ' ')
+
+
+def render_listing(row: dict, n: int = 0) -> str:
+    """Render a row of a cars_<date>.csv file as a listing card of auto.drom.ru."""
+    parts = []
+    if row['engine_capacity'] and row['horse_power']:
+        parts.append(f'{row["engine_capacity"]} л ({_number(row["horse_power"])} л.с.)')
+    elif row['horse_power']:
+        parts.append(f'{_number(row["horse_power"])} л.с.')
+    parts += [row['fuel'], row['transmission'], row['drive_unit']]
+    if row['mileage']:
+        parts.append(f'{_number(row["mileage"])} км')
+
+    return CARD.format(n=n,
+                       title=html.escape(f'{row["name"]}, {row["year"]}'),
+                       info=html.escape(', '.join(parts)),
+                       price=html.escape(row['price']),
+                       location=html.escape(row['location']))
+
+
+def render_page(rows: list, start: int = 0) -> str:
+    cards = '\n'.join(render_listing(row, start + i) for i, row in enumerate(rows))
+    return f'<html><head><meta charset="utf-8"></head><body><div>\n{cards}\n</div></body></html>'
+
+
+def write_fixtures(name: str, directory: str, per_page: int = 20) -> int:
+    """
+    Summary
+        The write_fixtures function turns a cars_<date>.csv file into saved auto.drom.ru/all/pageN/ pages, so the
+        scraper can be run against a local server. Returns the number of written pages.
+
+    Inputs
+        name (str): The name of the CSV file.
+        directory (str): The directory for the page<N>.html files.
+        per_page (int): The number of listings on a page.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(name + '.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    pages = 0
+    for start in range(0, len(rows), per_page):
+        pages += 1
+        with open(os.path.join(directory, f'page{pages}.html'), 'w', encoding='utf-8') as f:
+            f.write(render_page(rows[start:start + per_page], start))
+
+    return pages
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    throttle_every = 0
+    _requests = 0
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls._lock:
+            cls._requests += 1
+            throttled = cls.throttle_every and cls._requests % cls.throttle_every == 0
+
+        if throttled:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        match = PAGE.match(self.path)
+        path = os.path.join(self.directory, f'page{match.group(1)}.html') if match else None
+        if path is None or not os.path.exists(path):
+            self.send_error(404)
+            return
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_fixtures(directory: str, throttle_every: int = 0):
+    """
+    Summary
+        The serve_fixtures context manager runs a local stand-in for auto.drom.ru which serves page<N>.html from
+        directory at /all/pageN/ and yields its base URL, to be passed as base_url to the scraper.
+
+    Inputs
+        directory (str): The directory with the saved pages.
+        throttle_every (int): Answer every throttle_every-th request with 429 to exercise retries, 0 never does.
+    """
+    handler = type('Handler', (FixtureHandler,), {'throttle_every': throttle_every, '_requests': 0,
+                                                  '_lock': threading.Lock()})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), lambda *a: handler(*a, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
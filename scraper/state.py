@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+
+class Checkpoint:
+    """
+    Summary
+        The Checkpoint class remembers which pages of a scraping run are already written to its CSV file, so a run
+        which stopped can be resumed from where it stopped. It is kept in a small JSON file, rewritten atomically
+        after every page.
+
+    Inputs
+        path (str): The JSON file of the checkpoint.
+
+    Flow
+        1. done is the last page up to which all pages are written, pages are the written pages after it (with
+            concurrent scraping pages are finished out of order).
+        2. mark_done adds a page and moves done forward over the pages written without gaps.
+        3. remaining drops the written pages from the pages of a run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.output = None
+        self.done = 0
+        self.pages = set()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            self.output = state.get('output')
+            self.done = state.get('done', 0)
+            self.pages = set(state.get('pages', []))
+
+    def __contains__(self, page: int) -> bool:
+        return page <= self.done or page in self.pages
+
+    def remaining(self, pages) -> list:
+        return [p for p in pages if p not in self]
+
+    def mark_done(self, page: int) -> None:
+        if page > self.done:
+            self.pages.add(page)
+        while self.done + 1 in self.pages:
+            self.done += 1
+            self.pages.remove(self.done)
+
+    def save(self) -> None:
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'output': self.output, 'done': self.done, 'pages': sorted(self.pages)}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.output = None
+        self.done = 0
+        self.pages = set()
+
+
+class SeenIndex:
+    """
+    Summary
+        The SeenIndex class is a persistent set of the listings already scraped, kept in SQLite as 16-byte
+        fingerprints of the listing fields, so an incremental run writes only the listings it has not seen before.
+
+    Inputs
+        path (str): The SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS listings (fingerprint BLOB PRIMARY KEY) WITHOUT ROWID')
+        self._conn.commit()
+
+    @staticmethod
+    def fingerprint(row: list) -> bytes:
+        text = '\x1f'.join('' if x is None else str(x) for x in row)
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def __len__(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def filter_new(self, rows: list) -> list:
+        """Return the rows not seen before, in their order, without repeats."""
+        keys = [self.fingerprint(row) for row in rows]
+        seen = set()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = f'SELECT fingerprint FROM listings WHERE fingerprint IN ({", ".join("?" * len(chunk))})'
+            seen.update(k for k, in self._conn.execute(query, chunk))
+
+        new = []
+        for key, row in zip(keys, rows):
+            if key not in seen:
+                seen.add(key)
+                new.append(row)
+        return new
+
+    def add(self, rows: list) -> None:
+        """Remember the rows as seen, called once they are written."""
+        self._conn.executemany('INSERT OR IGNORE INTO listings VALUES (?)', [(self.fingerprint(r),) for r in rows])
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
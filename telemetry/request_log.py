@@ -0,0 +1,110 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class RequestLog:
+    """
+    Summary
+        The RequestLog class appends the scored requests to a JSONL file without slowing the requests down: append
+        only puts the records on a queue, a background thread serializes them, writes them in batches to a buffered
+        file opened in append mode and flushes it at most every flush_interval seconds. The same batches are passed to
+        the consumers, e.g. a model.drift.DriftMonitor, in that thread too.
+
+    Inputs
+        path (str): The JSONL file, None to only feed the consumers.
+        flush_interval (float): How often, in seconds, the file is flushed.
+        max_queue (int): The largest number of batches waiting to be written. When the writer falls behind, new
+            batches are dropped and counted instead of blocking the requests.
+        consumers (list): Callables taking a list of records, called after every written batch.
+
+    Outputs
+        dict: stats returns the written, dropped and queued counters.
+    """
+
+    def __init__(self, path: str = None, flush_interval: float = 1.0, max_queue: int = 10_000, consumers: list = ()):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.consumers = list(consumers)
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(max_queue)
+        self._file = open(path, 'a', encoding='utf-8', buffering=1 << 16) if path else None
+        self._thread = threading.Thread(target=self._run, name='request-log', daemon=True)
+        self._thread.start()
+
+    def append(self, records: list) -> None:
+        """Queue the records, dicts serializable to JSON, to be written. Never blocks."""
+        if not records:
+            return
+        try:
+            self._queue.put_nowait(records)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(records)
+
+    def log(self, rows: list, prices: list, errors: dict) -> None:
+        """Queue a scored request: a record per car with its input, price and error, see append."""
+        now = round(time.time(), 3)
+        self.append([{'ts': now, 'data': row, 'price': None if i in errors else prices[i], 'error': errors.get(i)}
+                     for i, row in enumerate(rows)])
+
+    def close(self) -> None:
+        """Write the queued records, flush and close the file."""
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'written': self.written, 'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+    def _take(self, timeout: float) -> tuple:
+        """The batches on the queue, waiting up to timeout for the first, and whether close was called."""
+        batches = []
+        try:
+            batches.append(self._queue.get(timeout=timeout))
+            while True:
+                batches.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        closed = any(b is _CLOSE for b in batches)
+        return [r for b in batches if b is not _CLOSE for r in b], closed
+
+    def _run(self) -> None:
+        flushed = time.monotonic()
+        while True:
+            records, closed = self._take(self.flush_interval)
+            if records:
+                self._write(records)
+            if self._file is not None and (closed or time.monotonic() - flushed >= self.flush_interval):
+                self._file.flush()
+                flushed = time.monotonic()
+            if closed:
+                return
+
+    def _write(self, records: list) -> None:
+        if self._file is not None:
+            try:
+                self._file.write(''.join(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in records))
+            except (OSError, ValueError):
+                logger.warning('Не удалось записать журнал запросов %s', self.path, exc_info=True)
+                with self._lock:
+                    self.dropped += len(records)
+                return
+        with self._lock:
+            self.written += len(records)
+
+        for consumer in self.consumers:
+            try:
+                consumer(records)
+            except Exception:
+                logger.warning('Ошибка обработчика журнала запросов', exc_info=True)
@@ -0,0 +1,271 @@
+import bisect
+import contextlib
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_sinks = []
+
+
+class _NoSpan:
+    """The span returned while no sink is installed, entering and leaving it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def enabled() -> bool:
+    return bool(_sinks)
+
+
+def span(name: str):
+    """
+    Summary
+        The span function times the block of a with statement and sends its duration to the installed sinks. Without
+        sinks it returns a shared object whose enter and exit do nothing, so spans left in the hot paths cost one list
+        check.
+
+    Inputs
+        name (str): The name of the span, <area>.<stage>, e.g. predict.model or data_prep.price.
+
+    Outputs
+        A context manager.
+    """
+    return _Span(name) if _sinks else _NO_SPAN
+
+
+def timed(name: str):
+    """Decorate a function to run it inside span(name)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name: str, seconds: float) -> None:
+    """Send a duration measured elsewhere, e.g. in a worker process, to the sinks."""
+    for sink in _sinks:
+        try:
+            sink.observe(name, seconds)
+        except Exception:
+            logger.exception('Ошибка приёмника %r', sink)
+
+
+def add_sink(sink) -> None:
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def clear_sinks() -> None:
+    _sinks.clear()
+
+
+class LoggerSink:
+    """Log every span as '<name> <milliseconds> ms'."""
+
+    def __init__(self, log: logging.Logger = None, level: int = logging.DEBUG):
+        self.log = log or logging.getLogger('telemetry')
+        self.level = level
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.log.log(self.level, '%s %.3f ms', name, seconds * 1000)
+
+
+class HistogramRegistry:
+    """
+    Summary
+        The HistogramRegistry class keeps a histogram of the durations of every span in memory: counts in fixed
+        buckets, the sum and the count, as a Prometheus histogram does. The memory does not grow with the number of
+        observations.
+
+    Inputs
+        buckets (tuple): The upper bounds of the buckets in seconds, increasing.
+
+    Outputs
+        dict: snapshot returns count, sum, mean and bucket-estimated p50/p99 per span. prometheus returns the
+            histograms in the Prometheus text format.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def _quantile(self, counts: list, total: int, q: float) -> float:
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {name: (list(counts), total, count) for name, (counts, total, count) in
+                          self._histograms.items()}
+
+        return {name: {'count': count,
+                       'sum_s': round(total, 6),
+                       'mean_ms': round(total / count * 1000, 4),
+                       'p50_ms_le': self._quantile(counts, count, 0.5) * 1000,
+                       'p99_ms_le': self._quantile(counts, count, 0.99) * 1000}
+                for name, (counts, total, count) in sorted(histograms.items())}
+
+    def prometheus(self, metric: str = 'automobil_span_seconds') -> str:
+        with self._lock:
+            histograms = {name: (list(counts), total, count) for name, (counts, total, count) in
+                          self._histograms.items()}
+
+        lines = [f'# HELP {metric} Duration of the timed stages.', f'# TYPE {metric} histogram']
+        for name, (counts, total, count) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {total!r}')
+            lines.append(f'{metric}_count{{span="{name}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+class PrometheusFileSink:
+    """
+    Summary
+        The PrometheusFileSink class feeds a HistogramRegistry and rewrites a Prometheus text file from it at most
+        every interval seconds, e.g. for the textfile collector of node_exporter. The file is replaced atomically.
+
+    Inputs
+        path (str): The file to write.
+        registry (HistogramRegistry): The histograms to feed and dump, a new one by default.
+        interval (float): The least number of seconds between two writes.
+    """
+
+    def __init__(self, path: str, registry: HistogramRegistry = None, interval: float = 10.0):
+        self.path = path
+        self.registry = registry or HistogramRegistry()
+        self.interval = interval
+        self._written = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.registry.observe(name, seconds)
+        if time.monotonic() - self._written >= self.interval:
+            self.dump()
+
+    def dump(self) -> None:
+        with self._lock:
+            self._written = time.monotonic()
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                f.write(self.registry.prometheus())
+            os.replace(tmp, self.path)
+
+
+@contextlib.contextmanager
+def profile(path: str = None, kind: str = 'cprofile', limit: int = 30):
+    """
+    Summary
+        The profile context manager profiles the calls of the current thread inside the with block, meant for a single
+        request. The report is logged at INFO and kept in the yielded dict under 'report'.
+
+    Inputs
+        path (str): With kind 'cprofile' the pstats dump is also written there, for snakeviz or pstats; with kind
+            'pyinstrument' the HTML report is.
+        kind (str): 'cprofile', or 'pyinstrument' if it is installed.
+        limit (int): The number of functions in the cProfile report.
+
+    Outputs
+        dict: Filled with the report when the block ends.
+    """
+    result = {}
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError('Для kind="pyinstrument" нужен пакет pyinstrument!')
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield result
+        finally:
+            profiler.stop()
+            result['report'] = profiler.output_text()
+            if path:
+                with open(path, 'w') as f:
+                    f.write(profiler.output_html())
+            logger.info('Профиль:\n%s', result['report'])
+        return
+
+    if kind != 'cprofile':
+        raise ValueError(f'Неизвестный профилировщик {kind}!')
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        result['report'] = out.getvalue()
+        logger.info('Профиль:\n%s', result['report'])
@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = 'cars_2023-12-19'
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """The artifacts (data.json, car_model, the scraped CSV) are opened by names relative to the working directory."""
+    monkeypatch.chdir(ROOT)
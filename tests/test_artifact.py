@@ -0,0 +1,39 @@
+import json
+import logging
+import shutil
+
+import pytest
+
+from model.artifact import read_manifest, verify_manifest
+from model.regression_model import DTYPES, PricePredictor
+
+
+def test_the_predictor_checks_its_own_encoder(tmp_path):
+    with open('data.json', 'r') as f:
+        info = json.load(f)
+    info['data'][0] = {k: str(int(v) + 1) for k, v in info['data'][0].items()}
+    other = str(tmp_path / 'other')
+    with open(other + '.json', 'w') as f:
+        json.dump(info, f)
+
+    with pytest.raises(ValueError):
+        PricePredictor(other, 'car_model')
+
+
+def test_the_encoder_next_to_the_model_still_passes(tmp_path):
+    shutil.copy('data.json', tmp_path / 'copy.json')
+    assert PricePredictor(str(tmp_path / 'copy'), 'car_model').ready
+
+
+def test_a_different_xgboost_version_is_a_warning(caplog):
+    manifest = dict(read_manifest('car_model'), xgboost_version='1.7.6')
+    with caplog.at_level(logging.WARNING, logger='model.artifact'):
+        verify_manifest('car_model', manifest, DTYPES, 'data')
+    assert '1.7.6' in caplog.text
+
+
+def test_a_changed_training_csv_is_a_warning(caplog):
+    manifest = dict(read_manifest('car_model'), training_data_sha256='0' * 64)
+    with caplog.at_level(logging.WARNING, logger='model.artifact'):
+        verify_manifest('car_model', manifest, DTYPES, 'data')
+    assert manifest['training_data_file'] in caplog.text
@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+
+from data_prep.aggregates import load_aggregates
+from data_prep.comparables import load_comparables
+from data_prep.data_prep import SCHEMA_TAG, artifact_path, file_hash, load_dataset
+from model.drift import load_reference
+from tests.conftest import DATASET
+
+KINDS = ['feather', 'aggregates.json', 'comparables.npz', 'drift.json']
+
+
+def snapshot(tmp_path, rows: int) -> str:
+    name = str(tmp_path / 'cars')
+    with open(DATASET + '.csv', 'r', encoding='utf-8') as source, open(name + '.csv', 'w', encoding='utf-8') as f:
+        f.writelines(line for _, line in zip(range(rows + 1), source))
+    return name
+
+
+def load_all(name: str) -> None:
+    load_dataset(name)
+    load_aggregates(name)
+    load_comparables(name)
+    load_reference(name)
+
+
+def test_artifacts_are_keyed_by_the_csv_and_the_schema(tmp_path):
+    name = snapshot(tmp_path, 500)
+    stale = f'{name}.{"0" * 16}.aggregates.json'
+    open(stale, 'w').close()
+
+    load_all(name)
+    digest = file_hash(name)
+    paths = [artifact_path(name, kind) for kind in KINDS]
+    assert paths == [f'{name}.{digest[:16]}.{SCHEMA_TAG}.{kind}' for kind in KINDS]
+    assert all(os.path.exists(p) for p in paths)
+    assert not os.path.exists(stale)
+    assert len(load_dataset(name)) == load_aggregates(name)['rows'] == load_reference(name)['rows']
+
+
+def test_artifacts_are_rebuilt_when_the_csv_changes(tmp_path):
+    name = snapshot(tmp_path, 500)
+    load_all(name)
+    old = [artifact_path(name, kind) for kind in KINDS]
+
+    snapshot(tmp_path, 800)
+    load_all(name)
+
+    assert not any(os.path.exists(p) for p in old)
+    assert sorted(os.listdir(tmp_path)) == sorted(['cars.csv'] + [os.path.basename(artifact_path(name, kind))
+                                                                   for kind in KINDS])
+    pd.testing.assert_frame_equal(load_comparables(name).listings, load_dataset(name))
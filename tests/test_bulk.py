@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from data_prep.data_prep import clean, drop_data, open_file
+from model.bulk import score_file
+from model.regression_model import COLUMNS, PricePredictor
+from tests.conftest import DATASET
+
+
+def test_bulk_csv_matches_predict_batch_on_cleaned_rows(tmp_path):
+    target = str(tmp_path / 'prices.csv')
+    report = score_file(DATASET + '.csv', target, workers=0, chunk_size=500)
+    scored = pd.read_csv(target)
+
+    raw = open_file(DATASET)
+    assert report['rows'] == len(raw) == len(scored)
+
+    # clean drops some rows and renumbers the rest; the bulk scorer keeps every row in place.
+    kept = drop_data(raw).index.to_numpy()
+    data = clean(raw)
+    expected, errors = PricePredictor('data', 'car_model').predict_batch(
+        data[COLUMNS].astype({c: str for c in ['name', 'model', 'fuel', 'transmission', 'drive_unit', 'location']}))
+
+    assert not errors
+    np.testing.assert_allclose(scored['price'].to_numpy()[kept], expected, rtol=1e-6)
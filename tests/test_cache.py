@@ -0,0 +1,39 @@
+import numpy as np
+
+from benchmarks.suite import CARS
+from model.cache import PredictionCache
+from model.regression_model import PricePredictor, encode_batch
+
+
+def test_cache_ignores_other_versions(tmp_path):
+    cache = PredictionCache(path=str(tmp_path / 'prices.sqlite'))
+    cache.bind('new')
+
+    cache.put_many([b'car'], [1.0], 'old')
+    assert cache.get_many([b'car'], 'new') == {}
+    cache.put_many([b'car'], [2.0], 'new')
+    assert cache.get_many([b'car'], 'old') == {}
+    assert cache.get_many([b'car'], 'new') == {0: 2.0}
+
+
+def test_prices_of_a_replaced_state_are_not_cached():
+    predictor = PricePredictor('data', 'car_model', cache=PredictionCache())
+    state = predictor._state
+    df, _ = encode_batch(CARS, state.encoder)
+
+    # A request which took the state before a reload finishes after the cache moved to the new files.
+    predictor.cache.bind('reloaded')
+    prices = predictor._score(state, df)
+
+    assert predictor.cache.stats()['size'] == 0
+    np.testing.assert_array_equal(prices, state.model.predict(df))
+
+
+def test_reload_replaces_the_state():
+    predictor = PricePredictor('data', 'car_model', cache=PredictionCache())
+    state = predictor._state
+    predictor.reload()
+
+    assert predictor._state is not state
+    assert predictor.cache.version == predictor._state.version == state.version
+    assert predictor.ready and predictor.has_interval == bool(predictor._state.quantiles)
@@ -0,0 +1,78 @@
+import pandas as pd
+
+from data_prep.data_prep import clean, open_file
+from tests.conftest import DATASET
+
+
+# The cleaning steps as they were before clean(): row-by-row drops and Python loops over the price and name columns.
+# replace assigns the column, the intended effect of its replace(inplace=True) that copy-on-write turned into a no-op.
+def drop_data(data: pd.DataFrame) -> pd.DataFrame:
+    to_drop = set(data[data.fuel == 'автомат'].index) | set(data[data.fuel == 'механика'].index) | \
+        set(data[data.transmission == '4WD'].index) | set(data[data.transmission == 'передний'].index)
+    for i in to_drop:
+        data.drop(i, axis=0, inplace=True)
+
+    data.drop(data[data.drive_unit == '108 058 км'].index, axis=0, inplace=True)
+    return data
+
+
+def replace(data: pd.DataFrame) -> pd.DataFrame:
+    data['transmission'] = data.transmission.replace({'механика': 'МКПП',
+                                                      'автомат': 'АКПП',
+                                                      'робот': 'РКП',
+                                                      'вариатор': 'CVT'
+                                                      })
+    return data
+
+
+def fillna_(data: pd.DataFrame) -> pd.DataFrame:
+    return data.fillna(0)
+
+
+def price(data: pd.DataFrame) -> pd.DataFrame:
+    price_ = []
+    for d in data.price:
+        price_.append(d.replace('\xa0', '').replace('₽', ''))
+    data.reset_index(drop=True, inplace=True)
+    data.price = pd.Series(price_)
+    return data
+
+
+def name_sep(data: pd.DataFrame) -> pd.DataFrame:
+    data.price = data.price.astype('int')
+
+    data.price = data.price / 1_000
+    data.mileage = data.mileage / 1_000
+
+    brand = []
+    model = []
+    for i in range(len(data.name)):
+        title = data.name[i].split(" ")
+        brand.append(title[0])
+        model.append(' '.join(title[1:]))
+
+    data.name = pd.Series(brand)
+    data['model'] = pd.Series(model)
+    return data[['name', 'model', 'year', 'engine_capacity', 'horse_power', 'fuel',
+                 'transmission', 'drive_unit', 'mileage', 'location', 'price']]
+
+
+def chain(data: pd.DataFrame) -> pd.DataFrame:
+    return name_sep(price(fillna_(replace(drop_data(data)))))
+
+
+def test_clean_is_byte_identical_to_the_step_by_step_chain():
+    expected = chain(open_file(DATASET, schema=False)).to_csv(index=False)
+    assert clean(open_file(DATASET, schema=False), schema=False).to_csv(index=False) == expected
+
+
+def test_typed_clean_keeps_the_values():
+    expected = chain(open_file(DATASET, schema=False))
+    data = clean(open_file(DATASET))
+
+    assert list(data.columns) == list(expected.columns)
+    for c in ['name', 'model', 'fuel', 'transmission', 'drive_unit', 'location']:
+        assert data[c].astype(str).tolist() == expected[c].astype(str).tolist()
+    for c in ['year', 'engine_capacity', 'horse_power', 'mileage', 'price']:
+        pd.testing.assert_series_equal(data[c].astype('float64'), expected[c].astype('float64'), check_names=False,
+                                       rtol=1e-6)
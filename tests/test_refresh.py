@@ -0,0 +1,49 @@
+import json
+
+import numpy as np
+import pytest
+
+from xgboost import XGBRegressor
+
+from model.refresh import continue_boosting, refresh
+from model.regression_model import QUANTILES, load_encoder, open_model, open_quantiles
+from model.training import encode_features, load_training_data
+from tests.conftest import DATASET
+
+
+def tree_params(model: XGBRegressor) -> dict:
+    return json.loads(model.get_booster().save_config())['learner']['gradient_booster']['tree_train_param']
+
+
+@pytest.fixture(scope='module')
+def features():
+    data = load_training_data([DATASET]).iloc[:300]
+    return encode_features(data, load_encoder('data')), data['price'].to_numpy(np.float32)
+
+
+def test_continue_boosting_keeps_the_training_params(features):
+    x, y = features
+    for model in [open_model('car_model')] + list(open_quantiles('car_model').values()):
+        # A model read from its native file only knows the xgboost defaults.
+        assert tree_params(model)['eta'] == tree_params(XGBRegressor().fit(x, y))['eta']
+        stored = json.loads(model.get_booster().attr('training_params'))
+
+        params = tree_params(continue_boosting(model, x, y, 2))
+        assert float(params['eta']) == pytest.approx(stored['learning_rate'])
+        assert int(params['max_depth']) == stored['max_depth']
+
+
+def test_continue_boosting_needs_the_training_params(features):
+    x, y = features
+    with pytest.raises(ValueError):
+        continue_boosting(XGBRegressor(n_estimators=2).fit(x, y), x, y, 2)
+
+
+def test_refresh_recalibrates_and_gates_the_quantiles():
+    report = refresh([DATASET], dry_run=True)
+
+    width = QUANTILES['high'] - QUANTILES['low']
+    assert {'coverage_before', 'coverage_after', 'margin'} <= set(report)
+    assert report['accepted'] == (report['rmse_after'] <= report['rmse_before'] * 1.05 and
+                                  abs(report['coverage_after'] - width) <= abs(report['coverage_before'] - width) + 0.05)
+    assert report['margin'] > 0 and not report['written']
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.suite import CARS
+from data_prep.data_prep import load_dataset
+from model.regression_model import COLUMNS, PricePredictor, encode_batch, encode_row, load_encoder, prepare_df
+from tests.conftest import DATASET
+
+UNSEEN = ['Tesla', 'Cybertruck', '2024', '0', '845', 'электро', 'АКПП', 'полный', '1.5', 'Магадан']
+
+
+def cars(rows: int = 200) -> list:
+    """Cars of the dataset in the input format of predict, strings only, and a few made up."""
+    data = load_dataset(DATASET)[COLUMNS].sample(rows, random_state=0)
+    return [[str(x) for x in row] for row in data.itertuples(index=False)] + CARS + [UNSEEN]
+
+
+@pytest.fixture(scope='module')
+def encoder():
+    return load_encoder('data')
+
+
+def test_encode_batch_matches_prepare_df(encoder):
+    data = cars()
+    expected = pd.concat([prepare_df(car, 'data') for car in data], ignore_index=True)
+    df, errors = encode_batch(data, encoder)
+
+    assert not errors
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected)
+
+
+def test_encode_row_matches_prepare_df(encoder):
+    for car in cars(50):
+        pd.testing.assert_frame_equal(encode_row(car, encoder).reset_index(drop=True), prepare_df(car, 'data'))
+
+
+@pytest.mark.parametrize('car, error', [
+    ('Toyota', ValueError),
+    (CARS[0][:9], ImportError),
+    (CARS[0][:2] + [2018] + CARS[0][3:], ValueError),
+    ([None] + CARS[0][1:], ValueError),
+])
+def test_encode_row_rejects_like_prepare_df(encoder, car, error):
+    with pytest.raises(error):
+        prepare_df(car, 'data')
+    with pytest.raises(error):
+        encode_row(car, encoder)
+
+
+@pytest.mark.parametrize('numbers', [
+    ['2018', '2.5', '181', '80'],
+    ['2018.0', '2.', '1e2', ' 80 '],
+    ['2018', '-1.5', '181', 'inf'],
+])
+def test_encode_row_matches_encode_batch(encoder, numbers):
+    car = CARS[0][:2] + numbers[:3] + CARS[0][5:8] + numbers[3:] + CARS[0][9:]
+    df, errors = encode_batch([car], encoder)
+
+    assert not errors
+    pd.testing.assert_frame_equal(encode_row(car, encoder).reset_index(drop=True), df.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('year', ['2018.5', '', 'двадцать'])
+def test_encode_row_rejects_like_encode_batch(encoder, year):
+    car = CARS[0][:2] + [year] + CARS[0][3:]
+    assert encode_batch([car], encoder)[1]
+    with pytest.raises(ValueError):
+        encode_row(car, encoder)
+
+
+def test_encode_batch_reports_bad_rows_and_encodes_the_rest(encoder):
+    data = [
+        CARS[0],
+        [['Toyota']] + CARS[0][1:],
+        CARS[1][:2] + [True] + CARS[1][3:],
+        CARS[2][:3] + [{'litres': 1.6}] + CARS[2][4:],
+        CARS[3][:8] + [False, CARS[3][9]],
+        CARS[3],
+    ]
+    df, errors = encode_batch(data, encoder)
+
+    assert sorted(errors) == [1, 2, 3, 4]
+    assert df.index.tolist() == [0, 5]
+    expected = pd.concat([prepare_df(CARS[0], 'data'), prepare_df(CARS[3], 'data')], ignore_index=True)
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected)
+
+    prices, errors = PricePredictor('data', 'car_model').predict_batch(data)
+    assert sorted(errors) == [1, 2, 3, 4]
+    assert np.isfinite(prices[[0, 5]]).all() and np.isnan(prices[[1, 2, 3, 4]]).all()
@@ -0,0 +1,26 @@
+import json
+import threading
+
+from telemetry.request_log import RequestLog
+
+
+def test_every_record_is_written_or_dropped(tmp_path):
+    path = tmp_path / 'requests.jsonl'
+    log = RequestLog(str(path), flush_interval=0.01, max_queue=4)
+
+    def append():
+        for i in range(500):
+            log.append([{'i': i}, {'i': i}])
+
+    threads = [threading.Thread(target=append) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.close()
+
+    stats = log.stats()
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert stats['written'] == len(lines)
+    assert stats['written'] + stats['dropped'] == 8 * 500 * 2
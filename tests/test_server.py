@@ -0,0 +1,78 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from benchmarks.suite import CARS
+from model.regression_model import PricePredictor
+from model.server import MicroBatcher, make_server
+
+
+@pytest.fixture
+def server():
+    server = make_server(port=0, max_wait_ms=200)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://%s:%d' % server.server_address
+    server.shutdown()
+    server.server_close()
+    server.batcher.close()
+
+
+def post(url: str, body: dict) -> tuple:
+    request = urllib.request.Request(url + '/predict', json.dumps(body).encode('utf-8'),
+                                     {'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_a_malformed_request_does_not_fail_the_others(server):
+    bodies = [{'data': CARS[0]}, {'data': [['Toyota']] + CARS[0][1:]}, {'data': CARS[1][:2] + [True] + CARS[1][3:]},
+              {'records': [CARS[2], [['Kia']] + CARS[2][1:]]}]
+    results = [None] * len(bodies)
+
+    def send(i):
+        results[i] = post(server, bodies[i])
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(len(bodies))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results[0][0] == 200 and results[0][1]['price'] > 0
+    assert results[1][0] == 422 and results[2][0] == 422
+    assert results[3][0] == 200
+    assert results[3][1]['prices'][0] > 0 and results[3][1]['prices'][1] is None
+    assert list(results[3][1]['errors']) == ['1']
+
+
+class Fragile:
+    """A predictor whose batch call fails when any of the cars is a Lada, as a model error would."""
+
+    def __init__(self):
+        self.predictor = PricePredictor('data', 'car_model')
+
+    def predict_batch(self, data):
+        if any(row[0] == 'Lada' for row in data):
+            raise RuntimeError('model error')
+        return self.predictor.predict_batch(data)
+
+
+def test_a_failed_batch_is_scored_car_by_car():
+    batcher = MicroBatcher(Fragile(), max_wait_ms=200)
+    try:
+        futures = [batcher.submit(car) for car in CARS]
+        for car, future in zip(CARS, futures):
+            if car[0] == 'Lada':
+                with pytest.raises(RuntimeError):
+                    future.result(10)
+            else:
+                assert future.result(10) > 0
+    finally:
+        batcher.close()
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from data_prep.stream import clean_chunks, read_chunks, read_partitioned, write_partitioned
+from tests.conftest import DATASET
+
+
+def failing(chunks, after: int):
+    for i, chunk in enumerate(chunks):
+        if i == after:
+            raise OSError('No space left on device')
+        yield chunk
+
+
+def test_a_failed_write_keeps_the_previous_partition(tmp_path):
+    root = str(tmp_path / 'cars')
+    paths = write_partitioned(clean_chunks(read_chunks(DATASET, 500)), root, '2023-12-19')
+    written = read_partitioned(root)
+
+    with pytest.raises(OSError):
+        write_partitioned(failing(clean_chunks(read_chunks(DATASET, 300)), 2), root, '2023-12-19')
+
+    assert sorted(os.listdir(root)) == ['scrape_date=2023-12-19']
+    assert sorted(os.path.join(root, 'scrape_date=2023-12-19', f) for f in
+                  os.listdir(os.path.join(root, 'scrape_date=2023-12-19'))) == paths
+    assert read_partitioned(root).equals(written)
+
+
+def test_writing_a_partition_again_replaces_it(tmp_path):
+    root = str(tmp_path / 'cars')
+    write_partitioned(clean_chunks(read_chunks(DATASET, 500)), root, '2023-12-19')
+    paths = write_partitioned(clean_chunks(read_chunks(DATASET, 300)), root, '2023-12-19')
+
+    assert sorted(os.listdir(root)) == ['scrape_date=2023-12-19']
+    assert sorted(os.listdir(os.path.join(root, 'scrape_date=2023-12-19'))) == [os.path.basename(p) for p in paths]
+    assert len(read_partitioned(root)) == sum(len(c) for c in clean_chunks(read_chunks(DATASET, 300)))
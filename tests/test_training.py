@@ -0,0 +1,11 @@
+import json
+
+from model.training import build_selector, load_training_data
+from tests.conftest import DATASET
+
+
+def test_selector_is_rebuilt_from_the_dataset():
+    with open('selector.json', 'r') as f:
+        selector = json.load(f)
+
+    assert json.dumps(build_selector(load_training_data([DATASET]))) == json.dumps(selector)
@@ -0,0 +1,22 @@
+import numpy as np
+
+from data_prep.data_prep import load_dataset
+from model.regression_model import CATEGORY, COLUMNS, encode_batch, load_encoder, open_model
+from model.tree_engine import TreeEnsemble
+from tests.conftest import DATASET
+
+
+def test_numpy_engine_matches_xgboost():
+    data = load_dataset(DATASET)[COLUMNS]
+    df, errors = encode_batch(data.astype({c: str for c in CATEGORY}), load_encoder('data'))
+    assert not errors
+
+    # Missing numbers take the default branch of every split.
+    df.loc[df.index[::7], 'horse_power'] = np.nan
+    df.loc[df.index[::11], 'mileage'] = np.nan
+
+    model = open_model('car_model')
+    engine = TreeEnsemble.from_booster(model)
+    expected = model.predict(df)
+    np.testing.assert_allclose(engine.predict(df), expected, rtol=1e-6, atol=1e-3)
+    np.testing.assert_allclose(engine.predict(df.iloc[:1]), expected[:1], rtol=1e-6, atol=1e-3)